@@ -5,7 +5,7 @@ _dotdrop()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -eq 1 ]; then
-        COMPREPLY=( $( compgen -W '-h --help -v --version install import compare update remove files detail profiles' -- $cur) )
+        COMPREPLY=( $( compgen -W '-h --help -v --version install import compare update remove uninstall files detail profiles compile explain gencfg' -- $cur) )
     else
         case ${COMP_WORDS[1]} in
             install)
@@ -22,6 +22,9 @@ _dotdrop()
         ;;
             remove)
             _dotdrop_remove
+        ;;
+            uninstall)
+            _dotdrop_uninstall
         ;;
             files)
             _dotdrop_files
@@ -31,6 +34,15 @@ _dotdrop()
         ;;
             profiles)
             _dotdrop_profiles
+        ;;
+            compile)
+            _dotdrop_compile
+        ;;
+            explain)
+            _dotdrop_explain
+        ;;
+            gencfg)
+            _dotdrop_gencfg
         ;;
         esac
 
@@ -43,7 +55,7 @@ _dotdrop_install()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -t --temp -f --force -n --nodiff -d --dry -D --showdiff -a --force-actions -c= --cfg= -p= --profile= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -t --temp -f --force -n --nodiff -d --dry -D --showdiff -a --force-actions -W --workdir-clear -R --remove-existing -c= --cfg= -p= --profile= -w= --workers= ' -- $cur) )
     fi
 }
 
@@ -53,7 +65,7 @@ _dotdrop_import()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -d --dry -f --force -c= --cfg= -p= --profile= -l= --link= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -d --dry -f --force -m --preserve-mode -c= --cfg= -p= --profile= -i= --ignore= -K= --dkey= --transr= --transw= -l= --link= -s= --as= ' -- $cur) )
     fi
 }
 
@@ -63,7 +75,7 @@ _dotdrop_compare()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -W '-V --verbose -b --no-banner -c= --cfg= -p= --profile= -C= --file= -i= --ignore= ' -- $cur) )
+        COMPREPLY=( $( compgen -W '-L --file-only -V --verbose -b --no-banner -z --ignore-missing -c= --cfg= -p= --profile= -w= --workers= -C= --file= -i= --ignore= ' -- $cur) )
     fi
 }
 
@@ -73,7 +85,7 @@ _dotdrop_update()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -k --key -P --show-patch -c= --cfg= -p= --profile= -i= --ignore= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -k --key -P --show-patch -z --ignore-missing -c= --cfg= -p= --profile= -w= --workers= -i= --ignore= ' -- $cur) )
     fi
 }
 
@@ -87,6 +99,16 @@ _dotdrop_remove()
     fi
 }
 
+_dotdrop_uninstall()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
 _dotdrop_files()
 {
     local cur
@@ -117,4 +139,34 @@ _dotdrop_profiles()
     fi
 }
 
+_dotdrop_compile()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -e --eval-dynvars -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
+_dotdrop_explain()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
+_dotdrop_gencfg()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -W ' ' -- $cur) )
+    fi
+}
+
 complete -o bashdefault -o default -o filenames -F _dotdrop dotdrop
\ No newline at end of file
@@ -4,7 +4,8 @@
 #
 set commands\
   install import  compare update\
-  remove  files   detail  profiles
+  remove  files   detail  profiles\
+  compile explain
 
 # Aliases to avoid walls of text
 #
@@ -41,6 +42,8 @@ end
 
 # Complete subcommands
 #
+__fish_dotdrop_comp_sub  -k -a "explain"  -d "Explain why templates will be rendered"
+__fish_dotdrop_comp_sub  -k -a "compile"  -d "Compile the config of a profile to a snapshot"
 __fish_dotdrop_comp_sub  -k -a "profiles" -d "List available profiles"
 __fish_dotdrop_comp_sub  -k -a "detail"   -d "List managed dotfiles details"
 __fish_dotdrop_comp_sub  -k -a "files"    -d "List managed dotfiles"
@@ -68,6 +71,7 @@ set -l  c -s c -l cfg            -d "Path to the config."
 set -l  C -s C -l file           -d "Path of dotfile to compare."
 set -l  d -s d -l dry            -d "Dry run."
 set -l  D -s D -l showdiff       -d "Show a diff before overwriting."
+set -l  e -s e -l eval-dynvars   -d "Evaluate dynvariables when the snapshot is loaded."
 set -l  f -s f -l force          -d "Do not ask user confirmation for anything."
 set -l  G -s G -l grepable       -d "Grepable output."
 set -l  i -s i -l ignore         -d "Pattern to ignore."
@@ -114,11 +118,15 @@ for line in "install:   V b t f n d D a c p w" \
             "files:     V b T G c p" \
             "detail:    V b c p" \
             "profiles:  V b G c" \
+            "compile:   V b e c p" \
+            "explain:   V b c p" \
             "install:   files dirs" \
             "detail:    files dirs" \
+            "explain:   files dirs" \
             "import:    mustfile" \
             "update:    nofile" \
             "remove:    nofile" \
+            "compile:   nofile" \
             # I'm here so no one is hurt by sharp backslashes
 
     set -l command (echo "$line" | cut -d: -f1 )
@@ -5,7 +5,7 @@ _dotdropsh()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -eq 1 ]; then
-        COMPREPLY=( $( compgen -W '-h --help -v --version install import compare update remove files detail profiles' -- $cur) )
+        COMPREPLY=( $( compgen -W '-h --help -v --version install import compare update remove uninstall files detail profiles compile explain gencfg' -- $cur) )
     else
         case ${COMP_WORDS[1]} in
             install)
@@ -22,6 +22,9 @@ _dotdropsh()
         ;;
             remove)
             _dotdropsh_remove
+        ;;
+            uninstall)
+            _dotdropsh_uninstall
         ;;
             files)
             _dotdropsh_files
@@ -31,6 +34,15 @@ _dotdropsh()
         ;;
             profiles)
             _dotdropsh_profiles
+        ;;
+            compile)
+            _dotdropsh_compile
+        ;;
+            explain)
+            _dotdropsh_explain
+        ;;
+            gencfg)
+            _dotdropsh_gencfg
         ;;
         esac
 
@@ -43,7 +55,7 @@ _dotdropsh_install()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -t --temp -f --force -n --nodiff -d --dry -D --showdiff -a --force-actions -c= --cfg= -p= --profile= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -t --temp -f --force -n --nodiff -d --dry -D --showdiff -a --force-actions -W --workdir-clear -R --remove-existing -c= --cfg= -p= --profile= -w= --workers= ' -- $cur) )
     fi
 }
 
@@ -53,7 +65,7 @@ _dotdropsh_import()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -d --dry -f --force -c= --cfg= -p= --profile= -l= --link= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -d --dry -f --force -m --preserve-mode -c= --cfg= -p= --profile= -i= --ignore= -K= --dkey= --transr= --transw= -l= --link= -s= --as= ' -- $cur) )
     fi
 }
 
@@ -63,7 +75,7 @@ _dotdropsh_compare()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -W '-V --verbose -b --no-banner -c= --cfg= -p= --profile= -C= --file= -i= --ignore= ' -- $cur) )
+        COMPREPLY=( $( compgen -W '-L --file-only -V --verbose -b --no-banner -z --ignore-missing -c= --cfg= -p= --profile= -w= --workers= -C= --file= -i= --ignore= ' -- $cur) )
     fi
 }
 
@@ -73,7 +85,7 @@ _dotdropsh_update()
     cur="${COMP_WORDS[COMP_CWORD]}"
 
     if [ $COMP_CWORD -ge 2 ]; then
-        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -k --key -P --show-patch -c= --cfg= -p= --profile= -i= --ignore= ' -- $cur) )
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -k --key -P --show-patch -z --ignore-missing -c= --cfg= -p= --profile= -w= --workers= -i= --ignore= ' -- $cur) )
     fi
 }
 
@@ -87,6 +99,16 @@ _dotdropsh_remove()
     fi
 }
 
+_dotdropsh_uninstall()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -f --force -d --dry -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
 _dotdropsh_files()
 {
     local cur
@@ -117,4 +139,34 @@ _dotdropsh_profiles()
     fi
 }
 
+_dotdropsh_compile()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -e --eval-dynvars -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
+_dotdropsh_explain()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -fW '-V --verbose -b --no-banner -c= --cfg= -p= --profile= ' -- $cur) )
+    fi
+}
+
+_dotdropsh_gencfg()
+{
+    local cur
+    cur="${COMP_WORDS[COMP_CWORD]}"
+
+    if [ $COMP_CWORD -ge 2 ]; then
+        COMPREPLY=( $( compgen -W ' ' -- $cur) )
+    fi
+}
+
 complete -o bashdefault -o default -o filenames -F _dotdropsh dotdrop.sh
\ No newline at end of file
@@ -3,7 +3,7 @@ author: deadc0de6 (https://github.com/deadc0de6)
 Copyright (c) 2017, deadc0de6
 
 represent an action or transformation
-in dotdrop
+in dotdrop and execute actions
 """
 
 import subprocess
@@ -12,6 +12,11 @@ import os
 # local imports
 from dotdrop.dictparser import DictParser
 from dotdrop.exceptions import UndefinedException
+from dotdrop.logger import Logger
+from dotdrop import timings
+
+
+LOG = Logger()
 
 
 class Cmd(DictParser):
@@ -180,3 +185,41 @@ class Transform(Cmd):
         self.args.insert(0, arg1)
         self.args.insert(0, arg0)
         return self.execute(templater=templater, debug=debug)
+
+
+def action_executor(opts, actions, defactions, templater, post=False):
+    """closure for action execution"""
+    def execute():
+        """
+        execute actions and return
+        True, None if ok
+        False, errstring if issue
+        """
+        actiontype = 'pre' if not post else 'post'
+        with timings.phase(f'{actiontype}-actions'):
+            # execute default actions
+            for action in defactions:
+                if opts.dry:
+                    LOG.dry(f'would execute def-{actiontype}-action: {action}')
+                    continue
+                LOG.dbg(f'executing def-{actiontype}-action: {action}')
+                ret = action.execute(templater=templater, debug=opts.debug)
+                if not ret:
+                    err = f'def-{actiontype}-action \"{action.key}\" failed'
+                    LOG.err(err)
+                    return False, err
+
+            # execute actions
+            for action in actions:
+                if opts.dry:
+                    err = f'would execute {actiontype}-action: {action}'
+                    LOG.dry(err)
+                    continue
+                LOG.dbg(f'executing {actiontype}-action: {action}')
+                ret = action.execute(templater=templater, debug=opts.debug)
+                if not ret:
+                    err = f'{actiontype}-action \"{action.key}\" failed'
+                    LOG.err(err)
+                    return False, err
+        return True, None
+    return execute
@@ -0,0 +1,305 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+on-disk caches stored under the workdir
+"""
+
+import os
+import json
+import glob
+import time
+import zlib
+import tempfile
+import threading
+from collections.abc import KeysView
+
+# local imports
+from dotdrop.logger import Logger
+from dotdrop.utils import shellrun
+
+# sub-directory of the workdir holding the caches
+CACHE_DIR = '.cache'
+# header of compiled config snapshots
+SNAPSHOT_MAGIC = b'DOTDROP-SNAPSHOT\x01'
+# identifies the current boot (linux only)
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+# where the os release information is read from
+OS_RELEASE_PATHS = ['/etc/os-release', '/usr/lib/os-release']
+LOG = Logger()
+
+
+def get_cache_path(workdir, name):
+    """return the path of cache "name" under workdir"""
+    workdir = os.path.expanduser(workdir)
+    return os.path.join(workdir, CACHE_DIR, name)
+
+
+def is_cache_path(path, workdir):
+    """return True if path is within the cache directory of workdir"""
+    cachedir = os.path.join(os.path.expanduser(workdir), CACHE_DIR)
+    cachedir = os.path.normpath(cachedir)
+    path = os.path.normpath(path)
+    return path == cachedir or path.startswith(cachedir + os.sep)
+
+
+def get_workdir_files(workdir):
+    """return the files within workdir, caches excluded"""
+    paths = []
+    for root, _, files in os.walk(workdir):
+        if is_cache_path(root, workdir):
+            continue
+        paths.extend(os.path.join(root, file) for file in files)
+    return paths
+
+
+def load_cache(path, debug=False):
+    """load a json cache, returns None if not usable"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            content = json.load(file)
+    except (OSError, ValueError) as exc:
+        if debug:
+            LOG.dbg(f'unable to load cache {path}: {exc}', force=True)
+        return None
+    if debug:
+        LOG.dbg(f'cache loaded from {path}', force=True)
+    return content
+
+
+def save_cache(path, content, debug=False):
+    """
+    atomically save content as json to path
+    returns True on success
+    """
+    parent = os.path.dirname(path)
+    tmp = None
+    try:
+        os.makedirs(parent, exist_ok=True)
+        data = json.dumps(content, default=_json_default)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8',
+                                         dir=parent, prefix='.tmp-',
+                                         delete=False) as file:
+            tmp = file.name
+            file.write(data)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as exc:
+        if debug:
+            LOG.dbg(f'unable to save cache {path}: {exc}', force=True)
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+        return False
+    if debug:
+        LOG.dbg(f'cache saved to {path}', force=True)
+    return True
+
+
+def is_snapshot(path):
+    """return True if path is a compiled config snapshot"""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+def load_snapshot(path, debug=False):
+    """load a compiled config snapshot, returns None if not usable"""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            return None
+        data = zlib.decompress(data[len(SNAPSHOT_MAGIC):])
+        content = json.loads(data.decode('utf-8'))
+    except (OSError, ValueError, zlib.error) as exc:
+        if debug:
+            LOG.dbg(f'unable to load snapshot {path}: {exc}', force=True)
+        return None
+    if debug:
+        LOG.dbg(f'snapshot loaded from {path}', force=True)
+    return content
+
+
+def save_snapshot(path, content, debug=False):
+    """
+    atomically save content as a compressed snapshot to path
+    returns True on success
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp = None
+    try:
+        data = json.dumps(content, default=_json_default,
+                          separators=(',', ':'))
+        data = SNAPSHOT_MAGIC + zlib.compress(data.encode('utf-8'), 9)
+        with tempfile.NamedTemporaryFile('wb', dir=parent,
+                                         prefix='.tmp-',
+                                         delete=False) as file:
+            tmp = file.name
+            file.write(data)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError) as exc:
+        if debug:
+            LOG.dbg(f'unable to save snapshot {path}: {exc}', force=True)
+        if tmp and os.path.exists(tmp):
+            os.unlink(tmp)
+        return False
+    if debug:
+        LOG.dbg(f'snapshot saved to {path}', force=True)
+    return True
+
+
+def remove_cache(path):
+    """remove a cache file if it exists"""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def fingerprint(path):
+    """
+    return a cheap fingerprint of the file pointed by path
+    or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def boot_key():
+    """
+    return a key identifying the current boot and os release
+    or None if the boot cannot be identified
+    """
+    try:
+        with open(BOOT_ID_PATH, 'r', encoding='utf-8') as file:
+            boot_id = file.read().strip()
+    except OSError:
+        return None
+    if not boot_id:
+        return None
+    return [boot_id] + [fingerprint(path) for path in OS_RELEASE_PATHS]
+
+
+def inputs_changed(inputs, globs, debug=False):
+    """
+    return True if any of the inputs (dict path: fingerprint)
+    or glob expansions (dict pattern: paths) changed
+    """
+    for path, fprint in inputs.items():
+        if fingerprint(path) != fprint:
+            if debug:
+                LOG.dbg(f'cache input changed: {path}', force=True)
+            return True
+    for pattern, paths in globs.items():
+        if sorted(glob.glob(pattern, recursive=True)) != paths:
+            if debug:
+                LOG.dbg(f'cache glob changed: {pattern}', force=True)
+            return True
+    return False
+
+
+class CommandCache:
+    """
+    cache the output of shell commands
+    a command is run only once per run and its output
+    can be persisted in the workdir for ttl seconds
+    """
+
+    NAME = 'dynvariables.json'
+
+    def __init__(self):
+        """constructor"""
+        # command -> output for this run
+        self._run = {}
+        # workdir -> {command: {time, ttl, out}}
+        self._persisted = {}
+        self._lock = threading.Lock()
+
+    def run(self, cmd, ttl=0, workdir=None, debug=False):
+        """
+        run cmd through the cache
+        @cmd: the command to run
+        @ttl: seconds to persist the output in workdir (0 to disable)
+        @workdir: the workdir holding the persisted outputs
+        returns True|False, output
+        """
+        with self._lock:
+            if cmd in self._run:
+                if debug:
+                    LOG.dbg(f'cached output for "{cmd}"', force=True)
+                return True, self._run[cmd]
+            if ttl and workdir:
+                out = self._get_persisted(cmd, ttl, workdir)
+                if out is not None:
+                    if debug:
+                        LOG.dbg(f'persisted output for "{cmd}"',
+                                force=True)
+                    self._run[cmd] = out
+                    return True, out
+        ret, out = shellrun(cmd, debug=debug)
+        if not ret:
+            # failures are never cached
+            return ret, out
+        with self._lock:
+            self._run[cmd] = out
+            if ttl and workdir:
+                self._persist(cmd, out, ttl, workdir, debug=debug)
+        return ret, out
+
+    def clear(self):
+        """forget the outputs of this run"""
+        with self._lock:
+            self._run.clear()
+            self._persisted.clear()
+
+    def _get_entries(self, workdir):
+        """get the persisted entries for workdir"""
+        if workdir not in self._persisted:
+            path = get_cache_path(workdir, self.NAME)
+            content = load_cache(path)
+            if not isinstance(content, dict):
+                content = {}
+            self._persisted[workdir] = content
+        return self._persisted[workdir]
+
+    def _get_persisted(self, cmd, ttl, workdir):
+        """return the persisted output of cmd if still valid"""
+        entry = self._get_entries(workdir).get(cmd)
+        if not entry:
+            return None
+        try:
+            age = time.time() - entry['time']
+            if age < 0 or age >= ttl:
+                return None
+            return entry['out']
+        except (KeyError, TypeError):
+            return None
+
+    def _persist(self, cmd, out, ttl, workdir, debug=False):
+        """persist the output of cmd and drop expired entries"""
+        entries = self._get_entries(workdir)
+        now = time.time()
+        entries[cmd] = {'time': now, 'ttl': ttl, 'out': out}
+        for key in list(entries.keys()):
+            entry = entries[key]
+            try:
+                expired = now - entry['time'] >= entry['ttl']
+            except (KeyError, TypeError):
+                expired = True
+            if expired:
+                del entries[key]
+        path = get_cache_path(workdir, self.NAME)
+        save_cache(path, entries, debug=debug)
+
+
+def _json_default(obj):
+    """serialize what json does not handle natively"""
+    if isinstance(obj, (set, tuple, KeysView)):
+        return list(obj)
+    raise TypeError(f'cannot serialize {type(obj)}')
@@ -7,19 +7,26 @@ handle higher level of the config file
 
 import os
 import shlex
+import threading
 import platform
 import re
-import distro
+import hashlib
+from contextlib import contextmanager
 
 
 # local imports
 from dotdrop.cfg_yaml import CfgYaml
 from dotdrop.dotfile import Dotfile
-from dotdrop.settings import Settings
+from dotdrop.settings import Settings, ENV_WORKDIR
 from dotdrop.profile import Profile
 from dotdrop.action import Action, Transform
 from dotdrop.logger import Logger
 from dotdrop.utils import strip_home, debug_list, debug_dict
+from dotdrop.cache import get_cache_path, load_cache, save_cache, \
+    remove_cache, inputs_changed, is_snapshot, load_snapshot, save_snapshot, \
+    boot_key
+from dotdrop.version import __version__ as VERSION
+from dotdrop import timings
 from dotdrop.exceptions import UndefinedException, YamlException, \
     ConfigException
 
@@ -40,6 +47,8 @@ class CfgAggregator:
     variable_distro_id = 'distro_id'
     variable_distro_like = 'distro_like'
     variable_distro_version = 'distro_version'
+    # cache of the platform variables in the workdir
+    platform_cache = 'platform.json'
 
     def __init__(self, path, profile_key, debug=False, dry=False):
         """
@@ -53,6 +62,8 @@ class CfgAggregator:
         self.debug = debug
         self.dry = dry
         self.log = Logger(debug=self.debug)
+        # guards modifications and lazily built indexes
+        self._lock = threading.RLock()
         try:
             self._load()
         except Exception as exc:
@@ -63,13 +74,45 @@ class CfgAggregator:
     # public methods
     ########################################################
 
+    @contextmanager
+    def transaction(self):
+        """
+        batch config modifications, the config is written
+        once when the outermost transaction ends
+        """
+        with self.cfgyaml.transaction(save=not self.dry):
+            yield self
+
     def del_dotfile(self, dotfile):
         """remove this dotfile from the config"""
-        return self.cfgyaml.del_dotfile(dotfile.key)
+        with self._lock, self.transaction():
+            if not self.cfgyaml.del_dotfile(dotfile.key):
+                return False
+            self._dotfiles.pop(dotfile.key, None)
+            if self._dst_index is not None:
+                dst = self._norm_path(dotfile.dst)
+                keys = self._dst_index.get(dst, [])
+                if dotfile.key in keys:
+                    keys.remove(dotfile.key)
+            if self._profiles_index is not None:
+                self._profiles_index.pop(dotfile.key, None)
+            return True
 
     def del_dotfile_from_profile(self, dotfile, profile):
         """remove this dotfile from this profile"""
-        return self.cfgyaml.del_dotfile_from_profile(dotfile.key, profile.key)
+        with self._lock, self.transaction():
+            if not self.cfgyaml.del_dotfile_from_profile(dotfile.key,
+                                                         profile.key):
+                return False
+            pro = self._profiles.get(profile.key)
+            if pro:
+                pro.dotfiles = [d for d in pro.dotfiles
+                                if d.key != dotfile.key]
+            if self._profiles_index is not None:
+                keys = self._profiles_index.get(dotfile.key, [])
+                if profile.key in keys:
+                    keys.remove(profile.key)
+            return True
 
     def new_dotfile(self, src, dst, link, chmod=None,
                     trans_install=None, trans_update=None,
@@ -85,38 +128,21 @@ class CfgAggregator:
         @trans_update: write transformation
         @forcekey: dotfile key
         """
-        dst = self.path_to_dotfile_dst(dst)
-        dotfile = self.get_dotfile_by_src_dst(src, dst)
-        if not dotfile:
-            # add the dotfile
-            dotfile = self._create_new_dotfile(src, dst, link, chmod=chmod,
-                                               trans_install=trans_install,
-                                               trans_update=trans_update,
-                                               forcekey=forcekey)
-
-        if not dotfile:
-            return False
-        ret = dotfile is not None
-
-        if self.profile_key != self.cfgyaml.key_all:
-            # add to profile
-            key = dotfile.key
-            ret = self.cfgyaml.add_dotfile_to_profile(key, self.profile_key)
-            if ret:
-                msg = f'new dotfile {key} to profile {self.profile_key}'
-                self.log.dbg(msg)
-
-        # save the config and reload it
-        if ret:
-            self._save_and_reload()
-        return ret
+        with self._lock, self.transaction():
+            return self._new_dotfile(src, dst, link, chmod=chmod,
+                                     trans_install=trans_install,
+                                     trans_update=trans_update,
+                                     forcekey=forcekey)
 
     def update_dotfile(self, key, chmod):
         """update an existing dotfile"""
-        ret = self.cfgyaml.update_dotfile(key, chmod)
-        if ret:
-            self._save_and_reload()
-        return ret
+        with self._lock, self.transaction():
+            ret = self.cfgyaml.update_dotfile(key, chmod)
+            if ret:
+                dotfile = self._dotfiles.get(key)
+                if dotfile:
+                    dotfile.chmod = chmod
+            return ret
 
     def path_to_dotfile_dst(self, path):
         """normalize the path to match dotfile dst"""
@@ -134,15 +160,18 @@ class CfgAggregator:
         get a list of dotfiles by dst
         @dst: dotfile dst (on filesystem)
         """
-        dotfiles = []
         dst = self._norm_path(dst)
-        dfs = self.dotfiles
+        with self._lock:
+            if self._dst_index is None:
+                self._dst_index = {}
+                for key, entry in self.cfgyaml.dotfiles.items():
+                    path = self._norm_path(entry[CfgYaml.key_dotfile_dst])
+                    self._dst_index.setdefault(path, []).append(key)
+            keys = list(self._dst_index.get(dst, []))
+        dotfiles = [self._get_dotfile_obj(key) for key in keys]
         if profile_key:
-            dfs = self.get_dotfiles(profile_key=profile_key)
-        for dotfile in dfs:
-            left = self._norm_path(dotfile.dst)
-            if left == dst:
-                dotfiles.append(dotfile)
+            keys = [d.key for d in self.get_dotfiles(profile_key=profile_key)]
+            dotfiles = [d for d in dotfiles if d.key in keys]
         return dotfiles
 
     def get_dotfile_by_src_dst(self, src, dst):
@@ -193,20 +222,21 @@ class CfgAggregator:
         pro = self.profile_key
         if key:
             pro = key
-
-        try:
-            return next(x for x in self.profiles if x.key == pro)
-        except StopIteration:
-            return None
+        return self._get_profile_obj(pro)
 
     def get_profiles_by_dotfile_key(self, key):
         """return all profiles having this dotfile"""
-        res = []
-        for profile in self.profiles:
-            keys = [dotfile.key for dotfile in profile.dotfiles]
-            if key in keys:
-                res.append(profile)
-        return res
+        with self._lock:
+            if self._profiles_index is None:
+                self._profiles_index = {}
+                for profile in self.profiles:
+                    for dotfile in profile.dotfiles:
+                        keys = self._profiles_index.setdefault(dotfile.key,
+                                                               [])
+                        if profile.key not in keys:
+                            keys.append(profile.key)
+            keys = list(self._profiles_index.get(key, []))
+        return [self._get_profile_obj(pro) for pro in keys]
 
     def get_dotfiles(self, profile_key=None):
         """
@@ -227,22 +257,68 @@ class CfgAggregator:
         return dotfile object by key
         @key: the dotfile key to look for
         """
-        dfs = self.dotfiles
-        if profile_key:
-            profile = self.get_profile(key=profile_key)
-            if not profile:
-                return None
-            dfs = profile.dotfiles
+        if not profile_key:
+            return self._get_dotfile_obj(key)
+        profile = self.get_profile(key=profile_key)
+        if not profile:
+            return None
         try:
-            return next(x for x in dfs
+            return next(x for x in profile.dotfiles
                         if x.key == key)
         except StopIteration:
             return None
 
+    @property
+    def dotfiles(self):
+        """all dotfiles objects"""
+        return [self._get_dotfile_obj(key)
+                for key in self.cfgyaml.dotfiles]
+
+    @property
+    def profiles(self):
+        """all profiles objects"""
+        return [self._get_profile_obj(key)
+                for key in self.cfgyaml.profiles]
+
+    @property
+    def snapshot(self):
+        """True if loaded from a compiled snapshot"""
+        return self.cfgyaml.snapshot
+
     ########################################################
     # accessors for public methods
     ########################################################
 
+    def _new_dotfile(self, src, dst, link, chmod=None,
+                     trans_install=None, trans_update=None,
+                     forcekey=None):
+        """import a new dotfile (see new_dotfile)"""
+        dst = self.path_to_dotfile_dst(dst)
+        dotfile = self.get_dotfile_by_src_dst(src, dst)
+        if not dotfile:
+            # add the dotfile
+            dotfile = self._create_new_dotfile(src, dst, link, chmod=chmod,
+                                               trans_install=trans_install,
+                                               trans_update=trans_update,
+                                               forcekey=forcekey)
+
+        if not dotfile:
+            return False
+        ret = dotfile is not None
+
+        if self.profile_key != self.cfgyaml.key_all:
+            # add to profile
+            key = dotfile.key
+            ret = self.cfgyaml.add_dotfile_to_profile(key, self.profile_key)
+            if ret:
+                msg = f'new dotfile {key} to profile {self.profile_key}'
+                self.log.dbg(msg)
+                # the profiles including it changed as well,
+                # all are re-materialized on next access
+                self._profiles = {}
+                self._profiles_index = None
+        return ret
+
     def _create_new_dotfile(self, src, dst, link, chmod=None,
                             trans_install=None, trans_update=None,
                             forcekey=None):
@@ -265,9 +341,11 @@ class CfgAggregator:
                                         trans_install_key=trans_install_key,
                                         trans_update_key=trans_update_key):
             return None
-        return Dotfile(key, dst, src,
-                       trans_install=trans_install,
-                       trans_update=trans_update)
+        dotfile = self._get_dotfile_obj(key)
+        if self._dst_index is not None:
+            path = self._norm_path(dotfile.dst)
+            self._dst_index.setdefault(path, []).append(key)
+        return dotfile
 
     ########################################################
     # parsing
@@ -279,12 +357,21 @@ class CfgAggregator:
         if not val:
             raise UndefinedException('\"workdir\" is undefined')
 
-    def _load(self, reloading=False):
+    def _load(self):
         """load lower level config"""
-        self.cfgyaml = CfgYaml(self.path,
-                               self.profile_key,
-                               reloading=reloading,
-                               debug=self.debug)
+        if is_snapshot(self.path):
+            with timings.phase('load snapshot'):
+                self.cfgyaml = self._load_snapshot()
+        else:
+            with timings.phase('load cache'):
+                self.cfgyaml = self._load_cached()
+        if not self.cfgyaml:
+            with timings.phase('parse config'):
+                self.cfgyaml = CfgYaml(self.path,
+                                       self.profile_key,
+                                       debug=self.debug,
+                                       lazy=True)
+            self._save_cached()
 
         self.log.dbg('parsing cfgyaml into cfg_aggregator')
 
@@ -297,15 +384,16 @@ class CfgAggregator:
         # clean key separator
         self.key_separator = re.sub(YAML_OK, YAML_REPL, self.key_separator)
 
-        # dotfiles
-        self.log.dbg('parsing dotfiles')
-        self.dotfiles = Dotfile.parse_dict(self.cfgyaml.dotfiles)
-        debug_list('dotfiles', self.dotfiles, self.debug)
-
-        # profiles
-        self.log.dbg('parsing profiles')
-        self.profiles = Profile.parse_dict(self.cfgyaml.profiles)
-        debug_list('profiles', self.profiles, self.debug)
+        # dotfiles and profiles are only turned into
+        # objects when needed (see _get_dotfile_obj and
+        # _get_profile_obj) since a command usually acts
+        # on a single profile
+        self._dotfiles = {}
+        self._profiles = {}
+        # normalized dst -> dotfile keys
+        self._dst_index = None
+        # dotfile key -> profile keys
+        self._profiles_index = None
 
         # actions
         self.log.dbg('parsing actions')
@@ -331,17 +419,6 @@ class CfgAggregator:
         self._enrich_variables()
 
         self.log.dbg('patch keys...')
-        # patch dotfiles in profiles
-        self._patch_keys_to_objs(self.profiles,
-                                 "dotfiles", self.get_dotfile)
-
-        # patch action in dotfiles actions
-        self._patch_keys_to_objs(self.dotfiles,
-                                 "actions", self._get_action_w_args)
-        # patch action in profiles actions
-        self._patch_keys_to_objs(self.profiles,
-                                 "actions", self._get_action_w_args)
-
         # patch actions in settings default_actions
         self._patch_keys_to_objs([self.settings],
                                  "default_actions", self._get_action_w_args)
@@ -349,67 +426,215 @@ class CfgAggregator:
         msg = f'default actions: {self.settings.default_actions}'
         self.log.dbg(msg)
 
+        # materialize the selected profile
+        profile = self.get_profile()
+        if profile:
+            debug_list('dotfiles', profile.dotfiles, self.debug)
+
+        self.log.dbg('done parsing cfgyaml into cfg_aggregator')
+
+    def _get_dotfile_obj(self, key):
+        """
+        return the dotfile object for key
+        parsed and patched on first access
+        """
+        if key in self._dotfiles:
+            return self._dotfiles[key]
+        if key not in self.cfgyaml.dotfiles:
+            return None
+        dotfile = Dotfile.parse(key, self.cfgyaml.dotfiles[key])
+        # patch action in dotfiles actions
+        self._patch_keys_to_objs([dotfile],
+                                 "actions", self._get_action_w_args)
         # patch trans_install in dotfiles
         trans_inst_args = self._get_trans_update_args(self.get_trans_install)
-        self._patch_keys_to_objs(self.dotfiles,
+        self._patch_keys_to_objs([dotfile],
                                  CfgYaml.key_trans_install,
                                  trans_inst_args,
                                  islist=False)
         # patch trans_update in dotfiles
         trans_update_args = self._get_trans_update_args(self.get_trans_update)
-        self._patch_keys_to_objs(self.dotfiles,
+        self._patch_keys_to_objs([dotfile],
                                  CfgYaml.key_trans_update,
                                  trans_update_args,
                                  islist=False)
+        self._dotfiles[key] = dotfile
+        return dotfile
 
-        self.log.dbg('done parsing cfgyaml into cfg_aggregator')
+    def _get_profile_obj(self, key):
+        """
+        return the profile object for key
+        resolved, parsed and patched on first access
+        """
+        if key in self._profiles:
+            return self._profiles[key]
+        if key not in self.cfgyaml.profiles:
+            return None
+        self.cfgyaml.resolve_profile(key)
+        profile = Profile.parse(key, self.cfgyaml.profiles[key])
+        # patch dotfiles in profiles
+        self._patch_keys_to_objs([profile],
+                                 "dotfiles", self._get_dotfile_obj)
+        # patch action in profiles actions
+        self._patch_keys_to_objs([profile],
+                                 "actions", self._get_action_w_args)
+        self._profiles[key] = profile
+        return profile
+
+    def _get_cache_path(self):
+        """
+        path of the cache for this config and profile
+        the configured workdir is unknown before parsing the config
+        thus the cache always lives in the default one
+        """
+        workdir = os.environ.get(ENV_WORKDIR, Settings.default_workdir)
+        path = os.path.abspath(self.path)
+        key = f'{path}:{self.profile_key}'.encode('utf-8')
+        name = f'config-{hashlib.sha1(key).hexdigest()}.json'
+        return get_cache_path(workdir, name)
+
+    def _load_cached(self):
+        """
+        return a CfgYaml restored from the cache
+        or None on cache miss
+        """
+        path = self._get_cache_path()
+        content = load_cache(path, debug=self.debug)
+        if not content:
+            return None
+        if content.get('version') != VERSION:
+            self.log.dbg('config cache miss: version changed')
+            return None
+        if inputs_changed(content['inputs'], content['globs'],
+                          debug=self.debug):
+            self.log.dbg('config cache miss: inputs changed')
+            return None
+        self.log.dbg(f'config cache hit: {path}')
+        try:
+            return CfgYaml(self.path, self.profile_key,
+                           debug=self.debug, serialized=content)
+        except KeyError:
+            # cache from an incompatible layout
+            return None
+
+    def _load_snapshot(self):
+        """
+        return a CfgYaml restored from a compiled snapshot,
+        its profile becomes the selected one
+        """
+        content = load_snapshot(self.path, debug=self.debug)
+        if not content:
+            raise YamlException(f'invalid snapshot: {self.path}')
+        version = content.get('version')
+        if version != VERSION:
+            err = f'snapshot compiled with dotdrop {version}, '
+            err += 'compile it again'
+            raise YamlException(err)
+        # inputs are usually absent from the hosts the
+        # snapshot is deployed to, only check existing ones
+        inputs = {
+            path: fprint for path, fprint in content['inputs'].items()
+            if os.path.exists(path)
+        }
+        if inputs_changed(inputs, {}, debug=self.debug):
+            self.log.warn(f'snapshot {self.path} might be outdated')
+        self.profile_key = content['profile']
+        self.log.dbg(f'snapshot for profile {self.profile_key}')
+        try:
+            return CfgYaml(self.path, self.profile_key,
+                           debug=self.debug, serialized=content)
+        except KeyError as exc:
+            raise YamlException(f'invalid snapshot: {self.path}') from exc
+
+    def compile(self, path, eval_dvars=False):
+        """
+        compile the config for the selected profile to a snapshot
+        @path: snapshot path
+        @eval_dvars: re-evaluate dynvariables when loading the snapshot
+        returns True on success
+        """
+        self.cfgyaml.resolve_profile(self.profile_key)
+        content = self.cfgyaml.get_snapshot(eval_dvars=eval_dvars)
+        return save_snapshot(path, content, debug=self.debug)
+
+    def _save_cached(self):
+        """save the parsed config to the cache if enabled"""
+        path = self._get_cache_path()
+        key = Settings.key_cache_config
+        if not self.cfgyaml.settings.get(key, False):
+            # make sure no stale cache is left behind
+            remove_cache(path)
+            return
+        content = self.cfgyaml.serialize()
+        if not content:
+            self.log.dbg('config cannot be cached')
+            remove_cache(path)
+            return
+        save_cache(path, content, debug=self.debug)
 
     def _enrich_variables(self):
         """
         enrich available variables
         """
-        if self.variable_os not in self.variables:
-            # enrich with os variable
+        names = [
+            self.variable_os,
+            self.variable_release,
+            self.variable_distro_id,
+            self.variable_distro_version,
+            self.variable_distro_like,
+        ]
+        missing = [name for name in names if name not in self.variables]
+        if not missing:
+            return
+        values = self._get_platform_variables(missing)
+        for name in missing:
+            self.variables[name] = values[name]
+            self.log.dbg(f'enrich variables with {name}={values[name]}')
+
+    def _get_platform_variables(self, names):
+        """
+        return the platform variables in names,
+        they are cached in the workdir for the current boot
+        """
+        key = boot_key()
+        path = get_cache_path(self.settings.workdir, self.platform_cache)
+        values = {}
+        if key:
+            content = load_cache(path, debug=self.debug)
+            if isinstance(content, dict) and content.get('key') == key:
+                values = content.get('variables') or {}
+        missing = [name for name in names if name not in values]
+        if not missing:
+            self.log.dbg('platform variables from cache')
+            return values
+        for name in missing:
+            values[name] = self._get_platform_variable(name)
+        if key:
+            save_cache(path, {'key': key, 'variables': values},
+                       debug=self.debug)
+        return values
+
+    def _get_platform_variable(self, name):
+        """compute the platform variable name"""
+        if name == self.variable_os:
             # https://docs.python.org/3/library/platform.html#platform.system
-            var_os = platform.system().lower()
-            self.variables[self.variable_os] = var_os
-            msg = f'enrich variables with {self.variable_os}={var_os}'
-            self.log.dbg(msg)
-        if self.variable_release not in self.variables:
-            # enrich with release variable
+            return platform.system().lower()
+        if name == self.variable_release:
             # https://docs.python.org/3/library/platform.html#platform.release
-            var_release = platform.release().lower()
-            self.variables[self.variable_release] = var_release
-            msg = f'enrich variables with {self.variable_release}'
-            msg += f'={var_release}'
-            self.log.dbg(msg)
-        if self.variable_distro_id not in self.variables:
-            # enrich with distro variable
-            # https://pypi.org/project/distro/
+            return platform.release().lower()
+        # distro parses the os-release files and may
+        # call lsb_release, only import it when needed
+        # https://pypi.org/project/distro/
+        # pylint: disable=C0415
+        import distro
+        if name == self.variable_distro_id:
             # https://distro.readthedocs.io/en/latest/#distro.id
-            var_distro_id = distro.id().lower()
-            self.variables[self.variable_distro_id] = var_distro_id
-            msg = f'enrich variables with {self.variable_distro_id}'
-            msg += f'={var_distro_id}'
-            self.log.dbg(msg)
-        if self.variable_distro_version not in self.variables:
-            # enrich with distro variable
-            # https://pypi.org/project/distro/
+            return distro.id().lower()
+        if name == self.variable_distro_version:
             # https://distro.readthedocs.io/en/latest/#distro.version
-            var_version = distro.version().lower()
-            self.variables[self.variable_distro_version] = var_version
-            msg = f'enrich variables with {self.variable_distro_version}'
-            msg += f'={var_version}'
-            self.log.dbg(msg)
-        if self.variable_distro_like not in self.variables:
-            # enrich with distro variable
-            # https://pypi.org/project/distro/
-            # https://distro.readthedocs.io/en/latest/#distro.like
-            var_like = distro.like().lower()
-            self.variables[self.variable_distro_like] = var_like
-            msg = f'enrich variables with {self.variable_distro_like}'
-            msg += f'={var_like}'
-            self.log.dbg(msg)
+            return distro.version().lower()
+        # https://distro.readthedocs.io/en/latest/#distro.like
+        return distro.like().lower()
 
     def _patch_keys_to_objs(self, containers, keys, get_by_key, islist=True):
         """
@@ -514,16 +739,6 @@ class CfgAggregator:
     # helpers
     ########################################################
 
-    def _save_and_reload(self):
-        if self.dry:
-            return
-        self.save()
-        self.log.dbg('reloading config')
-        olddebug = self.debug
-        self.debug = False
-        self._load(reloading=True)
-        self.debug = olddebug
-
     @classmethod
     def _norm_path(cls, path):
         if not path:
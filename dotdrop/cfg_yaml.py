@@ -23,24 +23,27 @@ Additionally a few methods are exported.
 import os
 import glob
 import io
-from copy import deepcopy
+import threading
+from contextlib import contextmanager
 from itertools import chain
-from ruamel.yaml import YAML as yaml
-try:
-    import tomllib
-except ImportError:
-    import tomli as tomllib
-import tomli_w
+from concurrent.futures import ThreadPoolExecutor
 
 # local imports
 from dotdrop.version import __version__ as VERSION
-from dotdrop.settings import Settings
+from dotdrop.settings import Settings, ENV_WORKDIR
 from dotdrop.logger import Logger
-from dotdrop.templategen import Templategen
+from dotdrop.templategen import Templategen, DICT_ENV_NAME
 from dotdrop.linktypes import LinkTypes
-from dotdrop.utils import shellrun, uniq_list, userinput
+from dotdrop.utils import uniq_list, userinput
+from dotdrop.cache import fingerprint, CommandCache
+from dotdrop import timings
 from dotdrop.exceptions import YamlException, UndefinedException
 
+# dynvariables output shared by all configs of a run
+DVARS_CACHE = CommandCache()
+# imported configs are parsed concurrently, serialize prompts
+USERINPUT_LOCK = threading.Lock()
+
 
 class CfgYaml:
     """yaml config file parser"""
@@ -59,6 +62,12 @@ class CfgYaml:
     key_dvariables = 'dynvariables'
     key_uvariables = 'uservariables'
 
+    # dynvariables entries
+    key_dvariables_cmd = 'cmd'
+    key_dvariables_ttl = 'ttl'
+    # max imported configs parsed concurrently
+    import_configs_workers = 8
+
     action_pre = 'pre'
     action_post = 'post'
 
@@ -101,6 +110,7 @@ class CfgYaml:
     key_settings_minversion = Settings.key_minversion
     key_imp_link = Settings.key_link_on_import
     key_settings_template = Settings.key_template_dotfile_default
+    key_settings_dvars_workers = Settings.key_dynvariables_workers
 
     # link values
     lnk_nolink = LinkTypes.NOLINK.name.lower()
@@ -116,7 +126,8 @@ class CfgYaml:
 
     def __init__(self, path, profile=None, addprofiles=None,
                  reloading=False, debug=False, imported_configs=None,
-                 fail_on_error=True):
+                 fail_on_error=True, serialized=None, lazy=False,
+                 dvars_workers=None, ancestors=None):
         """
         config parser
         @path: config file path
@@ -125,10 +136,18 @@ class CfgYaml:
         @reloading: true when reloading
         @imported_configs: paths of config files that have been imported so far
         @debug: debug flag
+        @serialized: restore from the output of serialize() or snapshot()
+                     instead of parsing
+        @lazy: only resolve the selected profile (see resolve_profile)
+        @dvars_workers: dynvariables workers of the importing config
+                        (settings of imported configs are ignored)
+        @ancestors: paths of the configs importing this one
+                    (the chain of import_configs up to the main config)
         """
         self._path = os.path.abspath(path)
         self._profile = profile
         self._reloading = reloading
+        self._lazy = lazy
         self._debug = debug
         self._log = Logger(debug=self._debug)
         # config format
@@ -137,12 +156,43 @@ class CfgYaml:
         self._dirty = False
         # indicates the config has been updated
         self._dirty_deprecated = False
+        # deprecation warnings already emitted
+        self._deprecated_warned = set()
+        # raw config loaded with the round-trip loader
+        self._roundtrip = False
+        # nested transactions in progress (see transaction)
+        self._txn_depth = 0
+        self._txn_lock = threading.Lock()
         # profile variables
         self._profilevarskeys = []
         # included profiles
         self._inc_profiles = addprofiles or []
         # imported configs
         self.imported_configs = imported_configs or []
+        # configs importing this one
+        self._ancestors = ancestors or []
+        # files (and their fingerprint) the config was built from
+        self._inputs = {}
+        # glob patterns and their expansion
+        self._globs = {}
+        # the raw config dictionary (see _yaml_dict)
+        self.__yaml_dict = None
+        # the resolved config can be cached (see serialize)
+        self.cacheable = True
+        # dynvariables executed concurrently (None for the settings)
+        self._dvars_workers = dvars_workers
+        # dynvariables ttl in seconds
+        self._dvars_ttl = {}
+        # executed dynvariables: name -> [command, output]
+        self._dvars_exec = {}
+        # restored from a compiled snapshot (see snapshot)
+        self.snapshot = False
+        # templater used while parsing (see _redefine_templater)
+        self._tmpl = None
+        # profiles whose includes and ALL have been resolved
+        self._resolved_profiles = set()
+        # profile -> profiles including it (cleared once resolved)
+        self._included_by = {}
 
         # init the dictionaries
         self.settings = {}
@@ -159,6 +209,10 @@ class CfgYaml:
                 self._dbg(err)
             raise YamlException(err)
 
+        if serialized:
+            self._restore(serialized)
+            return
+
         self._dbg('START of config parsing')
         self._dbg(f'reloading: {reloading}')
         self._dbg(f'profile: {profile}')
@@ -170,6 +224,7 @@ class CfgYaml:
         self._fix_deprecated(self._yaml_dict)
         # validate content
         self._validate(self._yaml_dict, fail_on_error)
+        self._check_cacheable(self._yaml_dict)
 
         ##################################################
         # parse the config and variables
@@ -201,6 +256,7 @@ class CfgYaml:
         # and dynvariables this means that variables referencing
         # dynvariables will result with the not executed value
         if dvariables.keys():
+            self.cacheable = False
             self._shell_exec_dvars(self.variables, keys=dvariables.keys())
         # finally redefine the template
         self._redefine_templater()
@@ -270,10 +326,12 @@ class CfgYaml:
         # process imported profile dotfiles (import)
         self._import_profiles_dotfiles()
         # process imported configs (import_configs)
-        self._import_configs()
+        with timings.phase('import_configs'):
+            self._import_configs()
 
         # process profile include items (actions, dotfiles, ...)
-        self._resolve_profile_includes()
+        with timings.phase('profile includes'):
+            self._resolve_profile_includes(keys=self._get_scoped_profiles())
 
         # add the current profile variables
         _, pvar, pdvar = self._get_profile_included_vars()
@@ -287,9 +345,11 @@ class CfgYaml:
         self._add_variables(newvars)
 
         # process profile ALL
-        self._resolve_profile_all()
+        self._resolve_profile_all(keys=self._get_scoped_profiles())
+        self._resolved_profiles.update(self._get_scoped_profiles())
         # template dotfiles entries
-        self._template_dotfiles_entries()
+        with timings.phase('dotfiles entries'):
+            self._template_dotfiles_entries()
 
         # parse the "uservariables" block
         uvariables = self._parse_blk_uservariables(self._yaml_dict,
@@ -306,6 +366,17 @@ class CfgYaml:
     # public methods
     ########################################################
 
+    def resolve_profile(self, key):
+        """
+        resolve the includes and ALL of the profile key
+        when lazily parsed, no-op otherwise
+        """
+        if key in self._resolved_profiles or key not in self.profiles:
+            return
+        self._resolve_profile_includes(keys=[key])
+        self._resolve_profile_all(keys=[key])
+        self._resolved_profiles.add(key)
+
     def _resolve_dotfile_link(self, link):
         """resolve dotfile link entry"""
         newlink = self._template_item(link)
@@ -359,6 +430,7 @@ class CfgYaml:
         yaml only
         return True if was added
         """
+        self._use_roundtrip()
         # create the profile if it doesn't exist
         self._new_profile(profile_key)
         if profile_key not in self.profiles:
@@ -382,12 +454,41 @@ class CfgYaml:
             # append dotfile
             pro = self._yaml_dict[self.key_profiles][profile_key]
             pro[self.key_profile_dotfiles].append(dotfile_key)
+            if not isinstance(pdfs, list):
+                pdfs = list(pdfs)
+                profile[self.key_profile_dotfiles] = pdfs
+            pdfs.append(dotfile_key)
             if self._debug:
                 msg = f'add \"{dotfile_key}\" to profile \"{profile_key}\"'
                 self._dbg(msg)
+            # the resolved profiles including it hold a copy
+            # of its dotfiles (see _rec_resolve_profile_include)
+            for key in self._get_including_profiles(profile_key):
+                dfs = self.profiles[key].get(self.key_profile_dotfiles)
+                dfs = list(dfs or [])
+                if dotfile_key not in dfs:
+                    dfs.append(dotfile_key)
+                self.profiles[key][self.key_profile_dotfiles] = dfs
             self._dirty = True
         return self._dirty
 
+    def _get_including_profiles(self, profile_key):
+        """
+        return the resolved profiles including profile_key
+        directly or through other profiles
+        """
+        found = []
+        todo = [profile_key]
+        while todo:
+            cur = todo.pop()
+            for key in self._included_by.get(cur, []):
+                if key == profile_key or key in found:
+                    continue
+                found.append(key)
+                todo.append(key)
+        return [key for key in found
+                if key in self._resolved_profiles and key in self.profiles]
+
     def get_all_dotfile_keys(self):
         """return all existing dotfile keys"""
         return self.dotfiles.keys()
@@ -409,6 +510,7 @@ class CfgYaml:
             self._dbg(f'update dotfile: {key}')
             self._dbg(f'old chmod value: {old}')
             self._dbg(f'new chmod value: {chmod}')
+        self._use_roundtrip()
         dotfile = self._yaml_dict[self.key_dotfiles][key]
         if not chmod:
             del dotfile[self.key_dotfile_chmod]
@@ -426,12 +528,18 @@ class CfgYaml:
         dotfile = self._yaml_dict[self.key_dotfiles][key]
         if not self._update_dotfile_chmod(key, dotfile, chmod):
             return False
+        # keep the parsed entry in sync
+        if chmod:
+            self.dotfiles[key][self.key_dotfile_chmod] = chmod
+        else:
+            self.dotfiles[key].pop(self.key_dotfile_chmod, None)
         self._dirty = True
         return True
 
     def add_dotfile(self, key, src, dst, link, chmod=None,
                     trans_install_key=None, trans_update_key=None):
         """add a new dotfile"""
+        self._use_roundtrip()
         if key in self.dotfiles.keys():
             return False
         if self._debug:
@@ -470,17 +578,31 @@ class CfgYaml:
 
         # add to global dict
         self._yaml_dict[self.key_dotfiles][key] = df_dict
+
+        # make it available without reloading the config
+        # (which applied the fixes of the deprecated entries)
+        self._fix_deprecated_dotfile_link({self.key_dotfiles: {key: df_dict}})
+        entry = self._norm_dotfiles({key: df_dict})[key]
+        link = entry[self.key_dotfile_link]
+        entry[self.key_dotfile_link] = self._resolve_dotfile_link(link)
+        entry[self.key_dotfile_src] = self.resolve_dotfile_src(
+            src, templater=self._tmpl)
+        entry[self.key_dotfile_dst] = self.resolve_dotfile_dst(
+            dst, templater=self._tmpl)
+        self.dotfiles[key] = entry
         self._dirty = True
         return True
 
     def del_dotfile(self, key):
         """remove this dotfile from config"""
+        self._use_roundtrip()
         if key not in self._yaml_dict[self.key_dotfiles]:
             self._log.err(f'key not in dotfiles: {key}')
             return False
         if self._debug:
             self._dbg(f'remove dotfile: {key}')
         del self._yaml_dict[self.key_dotfiles][key]
+        self.dotfiles.pop(key, None)
         if self._debug:
             dfs = self._yaml_dict[self.key_dotfiles]
             self._dbg(f'new dotfiles: {dfs}')
@@ -489,6 +611,7 @@ class CfgYaml:
 
     def del_dotfile_from_profile(self, df_key, pro_key):
         """remove this dotfile from that profile"""
+        self._use_roundtrip()
         if self._debug:
             self._dbg(f'removing \"{df_key}\" from \"{pro_key}\"')
         if df_key not in self.dotfiles.keys():
@@ -497,6 +620,11 @@ class CfgYaml:
         if pro_key not in self.profiles.keys():
             self._log.err(f'key not in profile: {pro_key}')
             return False
+        # the parsed profile may hold it through an include
+        pdfs = self.profiles[pro_key].get(self.key_profile_dotfiles)
+        if pdfs and df_key in pdfs:
+            pdfs = [k for k in pdfs if k != df_key]
+            self.profiles[pro_key][self.key_profile_dotfiles] = pdfs
         # get the profile dictionary
         profile = self._yaml_dict[self.key_profiles][pro_key]
         if self.key_profile_dotfiles not in profile:
@@ -515,11 +643,35 @@ class CfgYaml:
         self._dirty = True
         return True
 
+    @contextmanager
+    def transaction(self, save=True):
+        """
+        batch modifications, the config is only written
+        once the outermost transaction ends without error
+        @save: write the config at the end
+        """
+        with self._txn_lock:
+            self._txn_depth += 1
+        done = False
+        try:
+            yield self
+            done = True
+        finally:
+            with self._txn_lock:
+                self._txn_depth -= 1
+                last = self._txn_depth == 0
+            if last and done and save:
+                self.save()
+
     def save(self):
-        """save this instance and return True if saved"""
-        if not self._dirty:
+        """
+        save this instance and return True if saved
+        deferred while a transaction is in progress
+        """
+        if not self._dirty or self._txn_depth:
             return False
 
+        self._use_roundtrip()
         content = self._prepare_to_save(self._yaml_dict)
 
         if self._dirty_deprecated:
@@ -549,17 +701,151 @@ class CfgYaml:
     def dump(self):
         """dump the config dictionary"""
         output = io.StringIO()
+        self._use_roundtrip()
         content = self._prepare_to_save(self._yaml_dict.copy())
         self._yaml_dump(content, output, fmt=self._config_format)
         return output.getvalue()
 
+    def serialize(self):
+        """
+        return the resolved config along with the
+        fingerprint of all the files it was built from
+        returns None if the config cannot be serialized
+        """
+        if not self.cacheable or self._dirty:
+            return None
+        inputs = self._inputs.copy()
+        # custom functions/filters are inputs as well
+        for path in self.settings[Settings.key_func_file] + \
+                self.settings[Settings.key_filter_file]:
+            inputs[path] = fingerprint(path)
+        return {
+            'version': VERSION,
+            'path': self._path,
+            'profile': self._profile,
+            'inputs': inputs,
+            'globs': self._globs,
+            'format': self._config_format,
+            'imported_configs': self.imported_configs,
+            'inc_profiles': self._inc_profiles,
+            'resolved_profiles': sorted(self._resolved_profiles),
+            'included_by': self._included_by,
+            self.key_settings: self.settings,
+            self.key_dotfiles: self.dotfiles,
+            self.key_profiles: self.profiles,
+            self.key_actions: self.actions,
+            self.key_trans_install: self.trans_install,
+            self.key_trans_update: self.trans_update,
+            self.key_variables: self.variables,
+        }
+
+    @property
+    def cache_inputs(self):
+        """the files (fingerprints) and globs the config was built from"""
+        return self._inputs, self._globs
+
+    @property
+    def executed_dvars(self):
+        """
+        the executed dynvariables (name -> [command, output])
+        and their ttl
+        """
+        return self._dvars_exec, self._dvars_ttl
+
+    def merge_cache_inputs(self, other):
+        """add the inputs of the config other (imported) to this one"""
+        inputs, globs = other.cache_inputs
+        self._inputs.update(inputs)
+        self._globs.update(globs)
+        if not other.cacheable:
+            self.cacheable = False
+
+    def get_snapshot(self, eval_dvars=False):
+        """
+        return the resolved config as a self-contained snapshot
+        restricted to the resolved profiles and their dotfiles
+        @eval_dvars: dynvariables are re-evaluated when restored
+                     instead of being frozen
+        """
+        profiles = {
+            k: v for k, v in self.profiles.items()
+            if k in self._resolved_profiles
+        }
+        keys = set()
+        for pro in profiles.values():
+            keys.update(pro.get(self.key_profile_dotfiles, None) or [])
+        dotfiles = {k: v for k, v in self.dotfiles.items() if k in keys}
+        inputs = self._inputs.copy()
+        for path in self.settings[Settings.key_func_file] + \
+                self.settings[Settings.key_filter_file]:
+            inputs[path] = fingerprint(path)
+        dvars = {}
+        if eval_dvars:
+            # only those not overwritten since executed
+            dvars = {
+                k: cmd for k, (cmd, out) in self._dvars_exec.items()
+                if self.variables.get(k) == out
+            }
+        return {
+            'version': VERSION,
+            'snapshot': True,
+            'path': self._path,
+            'profile': self._profile,
+            'inputs': inputs,
+            'globs': self._globs,
+            'format': self._config_format,
+            'imported_configs': self.imported_configs,
+            'inc_profiles': self._inc_profiles,
+            'resolved_profiles': sorted(profiles.keys()),
+            'included_by': self._included_by,
+            self.key_settings: self.settings,
+            self.key_dotfiles: dotfiles,
+            self.key_profiles: profiles,
+            self.key_actions: self.actions,
+            self.key_trans_install: self.trans_install,
+            self.key_trans_update: self.trans_update,
+            self.key_variables: self.variables,
+            self.key_dvariables: dvars,
+            'dvariables_ttl': {
+                k: v for k, v in self._dvars_ttl.items() if k in dvars
+            },
+        }
+
+    def _restore(self, serialized):
+        """restore a config from the output of serialize()"""
+        self._dbg('restoring serialized config')
+        self._inputs = serialized['inputs']
+        self._globs = serialized['globs']
+        self._config_format = serialized['format']
+        self.imported_configs = serialized['imported_configs']
+        self._inc_profiles = serialized['inc_profiles']
+        self._resolved_profiles = set(serialized['resolved_profiles'])
+        self._included_by = serialized.get('included_by', {})
+        self.settings = serialized[self.key_settings]
+        self.dotfiles = serialized[self.key_dotfiles]
+        self.profiles = serialized[self.key_profiles]
+        self.actions = serialized[self.key_actions]
+        self.trans_install = serialized[self.key_trans_install]
+        self.trans_update = serialized[self.key_trans_update]
+        self.variables = serialized[self.key_variables]
+        self.snapshot = serialized.get('snapshot', False)
+        dvars = serialized.get(self.key_dvariables)
+        if dvars:
+            # marked for re-evaluation when compiled
+            self._dbg(f're-evaluate dynvariables: {list(dvars.keys())}')
+            self._dvars_ttl = serialized.get('dvariables_ttl', {})
+            self._shell_exec_dvars(dvars)
+            self.variables.update(dvars)
+        if self._debug:
+            self._debug_entries()
+
     ########################################################
     # block parsing
     ########################################################
 
     def _parse_blk_settings(self, dic):
         """parse the "config" block"""
-        block = self._get_entry(dic, self.key_settings).copy()
+        block = self._cow(self._get_entry(dic, self.key_settings))
         # set defaults
         settings = Settings(None).serialize().get(self.key_settings)
         settings.update(block)
@@ -590,7 +876,7 @@ class CfgYaml:
 
     def _parse_blk_dotfiles(self, dic):
         """parse the "dotfiles" block"""
-        dotfiles = self._get_entry(dic, self.key_dotfiles).copy()
+        dotfiles = self._get_entry(dic, self.key_dotfiles)
         keys = dotfiles.keys()
         if len(keys) != len(list(set(keys))):
             dups = [x for x in keys if x not in list(set(keys))]
@@ -604,7 +890,7 @@ class CfgYaml:
 
     def _parse_blk_profiles(self, dic):
         """parse the "profiles" block"""
-        profiles = self._get_entry(dic, self.key_profiles).copy()
+        profiles = self._get_entry(dic, self.key_profiles)
         profiles = self._norm_profiles(profiles)
         if self._debug:
             self._debug_dict('profiles block', profiles)
@@ -614,8 +900,6 @@ class CfgYaml:
         """parse the "actions" block"""
         actions = self._get_entry(dic, self.key_actions,
                                   mandatory=False)
-        if actions:
-            actions = actions.copy()
         actions = self._norm_actions(actions)
         if self._debug:
             self._debug_dict('actions block', actions)
@@ -626,7 +910,7 @@ class CfgYaml:
         trans_install = self._get_entry(dic, self.key_trans_install,
                                         mandatory=False)
         if trans_install:
-            trans_install = trans_install.copy()
+            trans_install = dict(trans_install)
         if self._debug:
             self._debug_dict('trans_install block', trans_install)
         return trans_install
@@ -636,7 +920,7 @@ class CfgYaml:
         trans_update = self._get_entry(dic, self.key_trans_update,
                                        mandatory=False)
         if trans_update:
-            trans_update = trans_update.copy()
+            trans_update = dict(trans_update)
         if self._debug:
             self._debug_dict('trans_update block', trans_update)
         return trans_update
@@ -647,7 +931,7 @@ class CfgYaml:
                                     self.key_variables,
                                     mandatory=False)
         if variables:
-            variables = variables.copy()
+            variables = dict(variables)
         if self._debug:
             self._debug_dict('variables block', variables)
         return variables
@@ -657,12 +941,39 @@ class CfgYaml:
         dvariables = self._get_entry(dic,
                                      self.key_dvariables,
                                      mandatory=False)
-        if dvariables:
-            dvariables = dvariables.copy()
+        dvariables = self._norm_dvariables(dvariables)
         if self._debug:
             self._debug_dict('dynvariables block', dvariables)
         return dvariables
 
+    def _norm_dvariables(self, dvariables):
+        """
+        normalize dynvariables to name: command
+        and record their ttl if any
+        """
+        if not dvariables:
+            return {}
+        new = {}
+        for key, val in dvariables.items():
+            if not isinstance(val, dict):
+                new[key] = val
+                continue
+            if self.key_dvariables_cmd not in val:
+                err = f'dynvariable "{key}" has no '
+                err += f'"{self.key_dvariables_cmd}" entry'
+                self._log.err(err)
+                raise YamlException(f'config content error: {err}')
+            new[key] = val[self.key_dvariables_cmd]
+            ttl = val.get(self.key_dvariables_ttl, 0)
+            try:
+                ttl = int(ttl)
+            except (TypeError, ValueError) as exc:
+                err = f'bad ttl for dynvariable "{key}": {ttl}'
+                self._log.err(err)
+                raise YamlException(f'config content error: {err}') from exc
+            self._dvars_ttl[key] = ttl
+        return new
+
     def _parse_blk_uservariables(self, dic, current):
         """parse the "uservariables" block"""
         uvariables = self._get_entry(dic,
@@ -672,17 +983,22 @@ class CfgYaml:
         uvars = {}
         if not self._reloading and uvariables:
             try:
-                for name, prompt in uvariables.items():
-                    if name in current:
-                        # ignore if already defined
-                        if self._debug:
-                            self._dbg(f'ignore uservariables {name}')
-                        continue
-                    content = userinput(prompt, debug=self._debug)
-                    uvars[name] = content
+                with USERINPUT_LOCK:
+                    for name, prompt in uvariables.items():
+                        if name in current:
+                            # ignore if already defined
+                            if self._debug:
+                                self._dbg(f'ignore uservariables {name}')
+                            continue
+                        content = userinput(prompt, debug=self._debug)
+                        uvars[name] = content
             except KeyboardInterrupt as exc:
                 raise YamlException('interrupted') from exc
 
+        if uvariables:
+            # values are prompted from the user
+            self.cacheable = False
+
             if uvars:
                 uvars = uvars.copy()
         if self._debug:
@@ -763,6 +1079,7 @@ class CfgYaml:
             if not entries:
                 # no entries in profile dict
                 continue
+            entries = self._cow(entries)
 
             # add "dotfiles:" entry if not present in local object
             if self.key_profile_dotfiles not in entries or \
@@ -817,6 +1134,7 @@ class CfgYaml:
         new = {}
 
         for k, val in dotfiles.items():
+            val = self._cow(val)
             if self.key_dotfile_src not in val:
                 # add 'src' as key' if not present
                 val[self.key_dotfile_src] = k
@@ -872,6 +1190,7 @@ class CfgYaml:
             self.variables = self._rec_resolve_variables(self.variables)
         if shell and new:
             # shell exec
+            self.cacheable = False
             self._shell_exec_dvars(self.variables, keys=new.keys())
             # re-create the templater
             self._redefine_templater()
@@ -925,10 +1244,21 @@ class CfgYaml:
         cur = pentry.get(keyitem, {})
         return self._merge_dict(cur, items)
 
-    def _resolve_profile_all(self):
+    def _get_scoped_profiles(self):
+        """
+        profiles to resolve while parsing,
+        all of them unless lazy
+        """
+        if not self._lazy:
+            return list(self.profiles.keys())
+        keys = [self._profile] + self._inc_profiles
+        return [k for k in uniq_list(keys) if k in self.profiles]
+
+    def _resolve_profile_all(self, keys):
         """resolve some other parts of the config"""
         # profile -> ALL
-        for k, val in self.profiles.items():
+        for k in keys:
+            val = self.profiles[k]
             dfs = val.get(self.key_profile_dotfiles, None)
             if not dfs:
                 continue
@@ -937,9 +1267,9 @@ class CfgYaml:
                     self._dbg(f'add ALL to profile \"{k}\"')
                 val[self.key_profile_dotfiles] = self.dotfiles.keys()
 
-    def _resolve_profile_includes(self):
+    def _resolve_profile_includes(self, keys):
         """resolve elements included through other profiles"""
-        for k, _ in self.profiles.items():
+        for k in keys:
             self._rec_resolve_profile_include(k)
 
     def _rec_resolve_profile_include(self, profile):
@@ -978,6 +1308,9 @@ class CfgYaml:
             if i not in self.profiles.keys():
                 self._log.warn(f'include unknown profile: {i}')
                 continue
+            including = self._included_by.setdefault(i, [])
+            if profile not in including:
+                including.append(profile)
 
             # recursive resolve
             if self._debug:
@@ -1031,11 +1364,13 @@ class CfgYaml:
             if self._debug:
                 self._dbg(f'import dynvariables from {path}')
             dvar = self._import_sub(path, self.key_dvariables,
-                                    mandatory=False)
+                                    mandatory=False,
+                                    patch_func=self._norm_dvariables)
 
             merged = self._merge_dict(dvar, var)
             merged = self._rec_resolve_variables(merged)
             if dvar.keys():
+                self.cacheable = False
                 self._shell_exec_dvars(merged, keys=dvar.keys())
             self._clear_profile_vars(merged)
             newvars = self._merge_dict(merged, newvars)
@@ -1072,17 +1407,31 @@ class CfgYaml:
                                        mandatory=False)
                 val[self.key_dotfiles] = new + current
 
-    def _import_config(self, path):
-        """import config from path"""
+    def _load_config(self, path, imported_configs):
+        """parse the config to import from path"""
         if self._debug:
             self._dbg(f'import config from {path}')
             self._dbg(f'profile: {self._profile}')
             self._dbg(f'included profiles: {self._inc_profiles}')
-        sub = CfgYaml(path, profile=self._profile,
-                      addprofiles=self._inc_profiles,
-                      debug=self._debug,
-                      imported_configs=self.imported_configs,
-                      fail_on_error=False)
+        return CfgYaml(path, profile=self._profile,
+                       addprofiles=self._inc_profiles,
+                       debug=self._debug,
+                       imported_configs=list(imported_configs),
+                       fail_on_error=False,
+                       lazy=self._lazy,
+                       dvars_workers=self._get_dvars_workers(),
+                       ancestors=self._ancestors + [self._path])
+
+    def _import_config(self, path, sub, imported_configs):
+        """
+        merge the config "sub" parsed from path
+        @imported_configs: imported configs sub was parsed with
+        """
+        # configs imported by sub on its own
+        for subpath in sub.imported_configs[len(imported_configs):]:
+            if subpath == path or subpath in self.imported_configs:
+                err = f'{subpath} imported more than once in {self._path}'
+                raise YamlException(err)
 
         # settings are ignored from external file
         # except for filter_file and func_file
@@ -1107,7 +1456,11 @@ class CfgYaml:
         self._clear_profile_vars(sub.variables)
 
         self.imported_configs.append(path)
-        self.imported_configs += sub.imported_configs
+        self.imported_configs += sub.imported_configs[len(imported_configs):]
+        self.merge_cache_inputs(sub)
+        dvars_exec, dvars_ttl = sub.executed_dvars
+        self._dvars_exec.update(dvars_exec)
+        self._dvars_ttl.update(dvars_ttl)
 
         if self._debug:
             self._debug_dict('add import_configs var', sub.variables)
@@ -1120,11 +1473,32 @@ class CfgYaml:
         if not imp:
             return
         paths = self._resolve_paths(imp)
-        for path in paths:
+        chain = self._ancestors + [self._path]
+        for idx, path in enumerate(paths):
+            # siblings are parsed before being merged,
+            # cycles are detected through the import chain
+            if path in chain or path in self.imported_configs or \
+                    path in paths[:idx]:
+                err = f'{path} imported more than once in {self._path}'
+                raise YamlException(err)
+
+        # configs are independent until merged, parse them
+        # concurrently and merge them in order
+        imported = list(self.imported_configs)
+        if len(paths) > 1:
+            nbworkers = min(len(paths), self.import_configs_workers)
+            with ThreadPoolExecutor(max_workers=nbworkers) as ex:
+                futures = [ex.submit(self._load_config, path, imported)
+                           for path in paths]
+                subs = [fut.result() for fut in futures]
+        else:
+            subs = [self._load_config(path, imported) for path in paths]
+
+        for path, sub in zip(paths, subs):
             if path in self.imported_configs:
                 err = f'{path} imported more than once in {self._path}'
                 raise YamlException(err)
-            self._import_config(path)
+            self._import_config(path, sub, imported)
 
     def _import_sub(self, path, key, mandatory=False, patch_func=None):
         """
@@ -1134,6 +1508,7 @@ class CfgYaml:
         if self._debug:
             self._dbg(f'import \"{key}\" from \"{path}\"')
         extdict = self._load_yaml(path)
+        self._check_cacheable(extdict)
         new = self._get_entry(extdict, key, mandatory=mandatory)
         if patch_func:
             if self._debug:
@@ -1185,6 +1560,18 @@ class CfgYaml:
         self._fix_deprecated_dotfile_link(yamldict)
         self._fix_deprecated_trans(yamldict)
 
+    def _warn_deprecated(self, msg):
+        """
+        flag the config as updated and warn once
+        (fixes are re-applied when switching to round-trip)
+        """
+        self._dirty = True
+        self._dirty_deprecated = True
+        if msg in self._deprecated_warned:
+            return
+        self._deprecated_warned.add(msg)
+        self._log.warn(msg)
+
     def _fix_deprecated_trans_in_dict(self, yamldic):
         # trans -> trans_install
         old_key = self.old_key_trans
@@ -1194,9 +1581,7 @@ class CfgYaml:
             del yamldic[old_key]
             msg = f'deprecated \"{old_key}\", '
             msg += f', updated to {new_key}\"'
-            self._log.warn(msg)
-            self._dirty = True
-            self._dirty_deprecated = True
+            self._warn_deprecated(msg)
 
         # trans_read -> trans_install
         old_key = self.old_key_trans_r
@@ -1206,9 +1591,7 @@ class CfgYaml:
             del yamldic[old_key]
             warn = f'deprecated \"{old_key}\"'
             warn += f', updated to \"{new_key}\"'
-            self._log.warn(warn)
-            self._dirty = True
-            self._dirty_deprecated = True
+            self._warn_deprecated(warn)
 
         # trans_write -> trans_update
         old_key = self.old_key_trans_w
@@ -1218,9 +1601,7 @@ class CfgYaml:
             del yamldic[old_key]
             warn = f'deprecated \"{old_key}\"'
             warn += f', updated to \"{new_key}\"'
-            self._log.warn(warn)
-            self._dirty = True
-            self._dirty_deprecated = True
+            self._warn_deprecated(warn)
 
     def _fix_deprecated_trans(self, yamldict):
         """fix deprecated trans key"""
@@ -1248,9 +1629,7 @@ class CfgYaml:
         else:
             config[newkey] = self.lnk_nolink
         del config[old_key]
-        self._log.warn('deprecated \"link_by_default\"')
-        self._dirty = True
-        self._dirty_deprecated = True
+        self._warn_deprecated('deprecated \"link_by_default\"')
 
     def _fix_deprecated_dotfile_link(self, yamldict):
         """fix deprecated link in dotfiles"""
@@ -1268,11 +1647,9 @@ class CfgYaml:
                 if cur:
                     new = self.lnk_link
                 dotfile[self.key_dotfile_link] = new
-                self._dirty = True
-                self._dirty_deprecated = True
                 warn = 'deprecated \"link: <boolean>\"'
                 warn += f', updated to \"link: {new}\"'
-                self._log.warn(warn)
+                self._warn_deprecated(warn)
 
             if self.key_dotfile_link in dotfile and \
                     dotfile[self.key_dotfile_link] == self.lnk_link:
@@ -1280,11 +1657,9 @@ class CfgYaml:
                 # to "link: absolute"
                 new = self.lnk_absolute
                 dotfile[self.key_dotfile_link] = new
-                self._dirty = True
-                self._dirty_deprecated = True
                 warn = 'deprecated \"link: link\"'
                 warn += f', updated to \"link: {new}\"'
-                self._log.warn(warn)
+                self._warn_deprecated(warn)
 
             if old_key in dotfile and \
                     isinstance(dotfile[old_key], bool):
@@ -1295,11 +1670,9 @@ class CfgYaml:
                     new = self.lnk_children
                 del dotfile[old_key]
                 dotfile[self.key_dotfile_link] = new
-                self._dirty = True
-                self._dirty_deprecated = True
                 warn = 'deprecated \"link_children\" value'
                 warn += f', updated to \"{new}\"'
-                self._log.warn(warn)
+                self._warn_deprecated(warn)
 
     ########################################################
     # yaml utils
@@ -1317,9 +1690,46 @@ class CfgYaml:
             content[self.key_profiles] = None
         return content
 
-    def _load_yaml(self, path):
+    @property
+    def _yaml_dict(self):
+        """
+        the raw config dictionary
+        loaded on demand when restored from serialize()
+        or when switching to round-trip (see _use_roundtrip)
+        """
+        if self.__yaml_dict is None:
+            content = self._load_yaml(self._path, roundtrip=self._roundtrip)
+            self._fix_deprecated(content)
+            for key in [self.key_dotfiles, self.key_profiles]:
+                if not content.get(key):
+                    content[key] = {}
+            self.__yaml_dict = content
+        return self.__yaml_dict
+
+    @_yaml_dict.setter
+    def _yaml_dict(self, value):
+        self.__yaml_dict = value
+
+    def _use_roundtrip(self):
+        """
+        the raw config is loaded with the fast safe loader,
+        reload it with the round-trip loader (preserving comments
+        and formatting) before it gets modified or saved
+        """
+        if self.snapshot:
+            err = f'{self._path} is a compiled snapshot, '
+            err += 'modify the original config and compile it again'
+            raise YamlException(err)
+        if self._roundtrip:
+            return
+        self._dbg('switching to round-trip loading')
+        self._roundtrip = True
+        self._yaml_dict = None
+
+    def _load_yaml(self, path, roundtrip=False):
         """load a yaml file to a dict"""
         content = {}
+        self._inputs[path] = fingerprint(path)
         if self._debug:
             self._dbg(f'----------dump:{path}----------')
             cfg = '\n'
@@ -1329,7 +1739,8 @@ class CfgYaml:
             self._dbg(cfg.rstrip())
             self._dbg(f'----------end:{path}----------')
         try:
-            content, fmt = self._yaml_load(path)
+            with timings.phase('yaml load'):
+                content, fmt = self._yaml_load(path, roundtrip=roundtrip)
             self._config_format = fmt
         except Exception as exc:
             self._log.err(exc)
@@ -1339,6 +1750,35 @@ class CfgYaml:
             self._dbg(f'format: {self._config_format}')
         return content
 
+    def _check_cacheable(self, content):
+        """
+        the resolved config is not cacheable when
+        its templates use environment variables
+        """
+        if not self.cacheable:
+            return
+        for string in self._iter_strings(content):
+            if DICT_ENV_NAME not in string:
+                continue
+            if self._tmpl is None:
+                self._tmpl = Templategen()
+            if DICT_ENV_NAME in self._tmpl.get_referenced_variables(string):
+                self._dbg(f'not cacheable, uses the environment: {string}')
+                self.cacheable = False
+                return
+
+    @classmethod
+    def _iter_strings(cls, content):
+        """yield all the strings within content"""
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, dict):
+            for value in content.values():
+                yield from cls._iter_strings(value)
+        elif isinstance(content, list):
+            for value in content:
+                yield from cls._iter_strings(value)
+
     def _validate(self, yamldict, fail_on_error):
         """validate entries"""
         if not yamldict:
@@ -1376,25 +1816,39 @@ class CfgYaml:
                 raise YamlException(f'config content error: {err}')
 
     @classmethod
-    def _yaml_load(cls, path):
+    def _yaml_load(cls, path, roundtrip=True):
         """load config file"""
         is_toml = path.lower().endswith(".toml")
         if is_toml:
             return cls.__toml_load(path), 'toml'
-        return cls.__yaml_load(path), 'yaml'
+        return cls.__yaml_load(path, roundtrip=roundtrip), 'yaml'
 
     @classmethod
-    def __yaml_load(cls, path):
-        """load from yaml"""
+    def __yaml_load(cls, path, roundtrip=True):
+        """
+        load from yaml
+        the safe loader is much faster but drops comments
+        and formatting, only use round-trip if the content
+        is to be written back
+        """
+        # pylint: disable=C0415
+        from ruamel.yaml import YAML as yaml
         with open(path, 'r', encoding='utf8') as file:
-            data = yaml()
-            data.typ = 'rt'
+            if roundtrip:
+                data = yaml(typ='rt')
+            else:
+                data = yaml(typ='safe', pure=False)
             content = data.load(file)
         return content
 
     @classmethod
     def __toml_load(cls, path):
         """load from toml"""
+        # pylint: disable=C0415
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
         with open(path, 'r', encoding='utf8') as file:
             data = file.read()
         content = tomllib.loads(data)
@@ -1418,6 +1872,8 @@ class CfgYaml:
     @classmethod
     def __yaml_dump(cls, content, file):
         """dump to yaml"""
+        # pylint: disable=C0415
+        from ruamel.yaml import YAML as yaml
         data = yaml()
         data.default_flow_style = False
         data.indent = 2
@@ -1427,6 +1883,8 @@ class CfgYaml:
     @classmethod
     def __toml_dump(cls, content, file):
         """dump to toml"""
+        # pylint: disable=C0415
+        import tomli_w
         file.write(tomli_w.dumps(content))
 
     ########################################################
@@ -1434,16 +1892,28 @@ class CfgYaml:
     ########################################################
 
     def _redefine_templater(self):
-        """create templater based on current variables"""
+        """update the templater with current variables"""
+        self._update_templater(self.variables)
+
+    def _update_templater(self, variables):
+        """
+        point the templater to variables and load any new
+        custom functions/filters, returns the previous variables
+        """
         fufile = None
         fifile = None
         if Settings.key_func_file in self.settings:
             fufile = self.settings[Settings.key_func_file]
         if Settings.key_filter_file in self.settings:
             fifile = self.settings[Settings.key_filter_file]
-        self._tmpl = Templategen(variables=self.variables,
-                                 func_file=fufile,
-                                 filter_file=fifile)
+        if not self._tmpl:
+            # created once and reused while parsing
+            self._tmpl = Templategen(func_file=fufile,
+                                     filter_file=fifile)
+        else:
+            self._tmpl.load_functions(func_file=fufile,
+                                      filter_file=fifile)
+        return self._tmpl.set_variables(variables)
 
     def _template_item(self, item, exc_if_fail=True):
         """
@@ -1547,29 +2017,80 @@ class CfgYaml:
     def _rec_resolve_variables(self, variables):
         """recursive resolve variables"""
         var = self._enrich_vars(variables, self._profile)
-        # use a separated templategen to handle variables
-        # resolved outside the main config
-        func_files = self.settings[Settings.key_func_file]
-        filter_files = self.settings[Settings.key_filter_file]
-        templ = Templategen(variables=var,
-                            func_file=func_files,
-                            filter_file=filter_files)
+        # only variables still containing templates need
+        # to be resolved, in the order of their dependencies
+        pending = [k for k, val in variables.items()
+                   if Templategen.var_is_template(val)]
         newvars = variables.copy()
-        for k in variables.keys():
-            val = variables[k]
-            while Templategen.var_is_template(val):
-                val = templ.generate_string_or_dict(val)
-                if isinstance(val, dict):
-                    for sub in val:
-                        subkey = f'{k}.{sub}'
-                        newvars[subkey] = val[sub]
-                else:
-                    newvars[k] = val
-                templ.update_variables(newvars)
-        if newvars is self.variables:
-            self._redefine_templater()
+        if not pending:
+            return newvars
+        # the templater only sees the variables being resolved
+        # which may live outside the main config
+        previous = self._update_templater(var)
+        templ = self._tmpl
+        try:
+            for k in self._sort_variables(templ, variables, pending):
+                val = variables[k]
+                while Templategen.var_is_template(val):
+                    val = templ.generate_string_or_dict(val)
+                    changed = {}
+                    if isinstance(val, dict):
+                        for sub in val:
+                            subkey = f'{k}.{sub}'
+                            changed[subkey] = val[sub]
+                    else:
+                        changed[k] = val
+                    newvars.update(changed)
+                    templ.update_variables(changed)
+        finally:
+            templ.variables = previous
         return newvars
 
+    def _sort_variables(self, templ, variables, keys):
+        """
+        sort keys of variables so that each comes after
+        the variables it references
+        raises a YamlException on cyclic references
+        """
+        pending = set(keys)
+        deps = {}
+        for k in keys:
+            refs = templ.get_referenced_variables(variables[k])
+            deps[k] = [ref for ref in refs if ref in pending]
+
+        order = []
+        done = set()
+        for k in keys:
+            if k in done:
+                continue
+            # iterative depth-first search
+            path = [k]
+            stack = [iter(sorted(deps[k]))]
+            while stack:
+                ref = next(stack[-1], None)
+                if ref is None:
+                    stack.pop()
+                    cur = path.pop()
+                    if cur not in done:
+                        done.add(cur)
+                        order.append(cur)
+                    continue
+                if ref in done:
+                    continue
+                if ref in path:
+                    cycle = path[path.index(ref):] + [ref]
+                    if any(isinstance(variables[c], dict) for c in cycle):
+                        # dict entries may reference each other's
+                        # sub-keys, those get iteratively resolved
+                        continue
+                    err = 'cyclic reference in variables: '
+                    err += ' -> '.join(cycle)
+                    self._log.err(err)
+                    raise YamlException(err)
+                path.append(ref)
+                stack.append(iter(sorted(deps[ref])))
+        return order
+
     def _get_profile_included_vars(self):
         """
         resolve profile included variables/dynvariables
@@ -1586,6 +2107,7 @@ class CfgYaml:
         # now get the included ones
         pro_var = self._get_profile_included_item(self.key_profile_variables)
         pro_dvar = self._get_profile_included_item(self.key_profile_dvariables)
+        pro_dvar = self._norm_dvariables(pro_dvar)
 
         # the included profiles
         inc_profiles = []
@@ -1643,6 +2165,8 @@ class CfgYaml:
         error = f'bad path {path}'
         if fatal_not_found:
             raise YamlException(error)
+        # the path may appear later on
+        self._inputs[path] = None
         self._log.warn(error)
 
     def _check_path_existence(self, path, fatal_not_found=True):
@@ -1715,7 +2239,7 @@ class CfgYaml:
                 # content is list, merge
                 if k not in final:
                     final[k] = []
-                final[k] += val
+                final[k] = final[k] + val
             elif isinstance(val, str):
                 final[k] = val
             else:
@@ -1727,17 +2251,36 @@ class CfgYaml:
 
     @classmethod
     def _get_entry(cls, dic, key, mandatory=True):
-        """return copy of entry from yaml dictionary"""
+        """
+        return entry from yaml dictionary
+        the entry is shared with the yaml dictionary,
+        copy what gets modified (see _cow)
+        """
         if key not in dic:
             if mandatory:
                 err = f'invalid config: no entry \"{key}\" found'
                 raise YamlException(err)
             dic[key] = {}
-            return deepcopy(dic[key])
+            return dic[key]
         if mandatory and not dic[key]:
             # ensure is not none
             dic[key] = {}
-        return deepcopy(dic[key])
+        return dic[key]
+
+    @classmethod
+    def _cow(cls, entry):
+        """
+        copy an entry before modifying it, its lists and
+        dicts are copied as well while other values are shared
+        """
+        new = {}
+        for k, val in entry.items():
+            if isinstance(val, list):
+                val = list(val)
+            elif isinstance(val, dict):
+                val = dict(val)
+            new[k] = val
+        return new
 
     def _clear_none(self, dic):
         """recursively delete all none/empty values in a dictionary."""
@@ -1777,7 +2320,9 @@ class CfgYaml:
         if self._debug:
             self._dbg(f'expanding glob {path}')
         expanded_path = os.path.expanduser(path)
-        return glob.glob(expanded_path, recursive=True)
+        paths = glob.glob(expanded_path, recursive=True)
+        self._globs[expanded_path] = sorted(paths)
+        return paths
 
     def _norm_path(self, path):
         """Resolve a path either absolute or relative to config path"""
@@ -1800,17 +2345,61 @@ class CfgYaml:
         """shell execute dynvariables in-place"""
         if not keys:
             keys = dic.keys()
+        keys = list(keys)
+        workdir = os.environ.get(ENV_WORKDIR,
+                                 self.settings.get(self.key_settings_workdir))
+
+        # commands are already templated and thus independent,
+        # each unique one is run once
+        cmds = {}
         for k in keys:
-            val = dic[k]
-            ret, out = shellrun(val, debug=self._debug)
-            if not ret:
-                err = f'var \"{k}: {val}\" failed: {out}'
-                self._log.err(err)
-                raise YamlException(err)
-            if self._debug:
-                self._dbg(f'{k}: `{val}` -> {out}')
-            dic[k] = out
-            self._debug_dict('dynvars after', dic)
+            ttl = self._dvars_ttl.get(k, 0)
+            cmds[dic[k]] = max(cmds.get(dic[k], 0), ttl)
+        results = {}
+        with timings.phase('dynvariables'):
+            workers = self._get_dvars_workers()
+            if workers > 1 and len(cmds) > 1:
+                # opted in, all are run even if one fails
+                nbworkers = min(len(cmds), workers)
+                msg = f'run {len(cmds)} dynvariables on {nbworkers} workers'
+                self._dbg(msg)
+                with ThreadPoolExecutor(max_workers=nbworkers) as ex:
+                    futures = {
+                        cmd: ex.submit(DVARS_CACHE.run, cmd, ttl=ttl,
+                                       workdir=workdir, debug=self._debug)
+                        for cmd, ttl in cmds.items()
+                    }
+                    for cmd, fut in futures.items():
+                        results[cmd] = fut.result()
+
+            # in order, stop on the first failure
+            for k in keys:
+                val = dic[k]
+                if val not in results:
+                    results[val] = DVARS_CACHE.run(val, ttl=cmds[val],
+                                                   workdir=workdir,
+                                                   debug=self._debug)
+                ret, out = results[val]
+                if not ret:
+                    err = f'var \"{k}: {val}\" failed: {out}'
+                    self._log.err(err)
+                    raise YamlException(err)
+                if self._debug:
+                    self._dbg(f'{k}: `{val}` -> {out}')
+                dic[k] = out
+                self._dvars_exec[k] = [val, out]
+        self._debug_dict('dynvars after', dic)
+
+    def _get_dvars_workers(self):
+        """return the number of dynvariables executed concurrently"""
+        if self._dvars_workers is not None:
+            return self._dvars_workers
+        workers = self.settings.get(self.key_settings_dvars_workers, 1)
+        try:
+            return max(int(workers), 1)
+        except (TypeError, ValueError) as exc:
+            err = f'bad {self.key_settings_dvars_workers}: {workers}'
+            raise YamlException(err) from exc
 
     @classmethod
     def _check_minversion(cls, minversion):
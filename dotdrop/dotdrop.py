@@ -8,22 +8,26 @@ entry point
 import os
 import sys
 import time
-import fnmatch
 from concurrent import futures
 
 # local imports
 from dotdrop.options import Options
 from dotdrop.logger import Logger
-from dotdrop.templategen import Templategen
+from dotdrop.templategen import Templategen, DEPENDENCIES
 from dotdrop.installer import Installer
 from dotdrop.uninstaller import Uninstaller
 from dotdrop.updater import Updater
 from dotdrop.comparator import Comparator
 from dotdrop.importer import Importer
+from dotdrop.action import action_executor
+from dotdrop.workdir import get_templater, load_caches, save_caches, \
+    workdir_enum
 from dotdrop.utils import get_tmpdir, removepath, \
     uniq_list, ignores_to_absolute, dependencies_met, \
-    adapt_workers, check_version, pivot_path, dir_empty
+    adapt_workers, check_version, dir_empty, pivot_path
 from dotdrop.linktypes import LinkTypes
+from dotdrop.cache import get_workdir_files
+from dotdrop import timings
 from dotdrop.exceptions import YamlException, \
     UndefinedException, UnmetDependency, \
     ConfigException, OptionsException
@@ -36,45 +40,7 @@ TRANS_SUFFIX = 'trans'
 ###########################################################
 
 
-def action_executor(opts, actions, defactions, templater, post=False):
-    """closure for action execution"""
-    def execute():
-        """
-        execute actions and return
-        True, None if ok
-        False, errstring if issue
-        """
-        actiontype = 'pre' if not post else 'post'
-
-        # execute default actions
-        for action in defactions:
-            if opts.dry:
-                LOG.dry(f'would execute def-{actiontype}-action: {action}')
-                continue
-            LOG.dbg(f'executing def-{actiontype}-action: {action}')
-            ret = action.execute(templater=templater, debug=opts.debug)
-            if not ret:
-                err = f'def-{actiontype}-action \"{action.key}\" failed'
-                LOG.err(err)
-                return False, err
-
-        # execute actions
-        for action in actions:
-            if opts.dry:
-                err = f'would execute {actiontype}-action: {action}'
-                LOG.dry(err)
-                continue
-            LOG.dbg(f'executing {actiontype}-action: {action}')
-            ret = action.execute(templater=templater, debug=opts.debug)
-            if not ret:
-                err = f'{actiontype}-action \"{action.key}\" failed'
-                LOG.err(err)
-                return False, err
-        return True, None
-    return execute
-
-
-def _dotfile_update(opts, path, key=False):
+def _dotfile_update(opts, templ, path, key=False):
     """
     update a dotfile pointed by path
     if key is false or by key (in path)
@@ -83,18 +49,18 @@ def _dotfile_update(opts, path, key=False):
                       dry=opts.dry, safe=opts.safe, debug=opts.debug,
                       ignore=opts.update_ignore,
                       showpatch=opts.update_showpatch,
-                      ignore_missing_in_dotdrop=opts.ignore_missing_in_dotdrop)
+                      ignore_missing_in_dotdrop=opts.ignore_missing_in_dotdrop,
+                      templater=templ)
     if key:
         return updater.update_key(path)
     return updater.update_path(path)
 
 
-def _dotfile_compare(opts, dotfile, tmp):
+def _dotfile_compare(opts, templ, dotfile, tmp):
     """
     compare a dotfile
     returns True if same
     """
-    templ = _get_templater(opts)
     ignore_missing_in_dotdrop = opts.ignore_missing_in_dotdrop or \
         dotfile.ignore_missing_in_dotdrop
     inst = Installer(create=opts.create, backup=opts.backup,
@@ -108,7 +74,7 @@ def _dotfile_compare(opts, dotfile, tmp):
 
     # add dotfile variables
     newvars = dotfile.get_dotfile_variables()
-    templ.add_tmp_vars(newvars=newvars)
+    templ = templ.overlay(newvars)
 
     # dotfiles does not exist / not installed
     LOG.dbg(f'comparing {dotfile}')
@@ -195,7 +161,7 @@ def _dotfile_compare(opts, dotfile, tmp):
     return True
 
 
-def _dotfile_install(opts, dotfile, tmpdir=None):
+def _dotfile_install(opts, templ, dotfile, tmpdir=None):
     """
     install a dotfile
     returns <success, dotfile key, err>
@@ -203,12 +169,9 @@ def _dotfile_install(opts, dotfile, tmpdir=None):
     # installer
     inst = _get_install_installer(opts, tmpdir=tmpdir)
 
-    # templater
-    templ = _get_templater(opts)
-
     # add dotfile variables
     newvars = dotfile.get_dotfile_variables()
-    templ.add_tmp_vars(newvars=newvars)
+    templ = templ.overlay(newvars)
 
     preactions = []
     if not opts.install_temporary:
@@ -322,15 +285,14 @@ def cmd_install(opts):
     # clear the workdir
     if opts.install_clear_workdir and not opts.dry:
         LOG.dbg(f'clearing the workdir under {opts.workdir}')
-        for root, _, files in os.walk(opts.workdir):
-            for file in files:
-                fpath = os.path.join(root, file)
-                # ignore error
-                removepath(fpath, logger=LOG)
+        for fpath in get_workdir_files(opts.workdir):
+            # ignore error
+            removepath(fpath, logger=LOG)
 
     # execute profile pre-action
     LOG.dbg(f'run {len(pro_pre_actions)} profile pre actions')
-    templ = _get_templater(opts)
+    # shared by all dotfiles
+    templ = get_templater(opts)
     ret, _ = action_executor(opts, pro_pre_actions, [], templ, post=False)()
     if not ret:
         return False
@@ -343,7 +305,8 @@ def cmd_install(opts):
 
         wait_for = []
         for dotfile in dotfiles:
-            j = ex.submit(_dotfile_install, opts, dotfile, tmpdir=tmpdir)
+            func = timings.wrap(f'dotfile {dotfile.key}', _dotfile_install)
+            j = ex.submit(func, opts, templ, dotfile, tmpdir=tmpdir)
             wait_for.append(j)
         # check result
         for fut in futures.as_completed(wait_for):
@@ -356,7 +319,8 @@ def cmd_install(opts):
     else:
         # sequentially
         for dotfile in dotfiles:
-            tmpret, key, err = _dotfile_install(opts, dotfile, tmpdir=tmpdir)
+            func = timings.wrap(f'dotfile {dotfile.key}', _dotfile_install)
+            tmpret, key, err = func(opts, templ, dotfile, tmpdir=tmpdir)
             # check result
             if tmpret:
                 installed.append(key)
@@ -381,44 +345,6 @@ def cmd_install(opts):
     return True
 
 
-def _workdir_enum(opts):
-    workdir_files = []
-    for root, _, files in os.walk(opts.workdir):
-        for file in files:
-            fpath = os.path.join(root, file)
-            workdir_files.append(fpath)
-
-    for dotfile in opts.dotfiles:
-        src = os.path.join(opts.dotpath, dotfile.src)
-        if dotfile.link == LinkTypes.NOLINK:
-            # ignore not link files
-            continue
-        if not Templategen.path_is_template(src):
-            # ignore not template
-            continue
-        newpath = pivot_path(dotfile.dst, opts.workdir,
-                             striphome=True, logger=None)
-        if os.path.isdir(newpath):
-            # recursive
-            pattern = f'{newpath}/*'
-            files = workdir_files.copy()
-            for file in files:
-                if fnmatch.fnmatch(file, pattern):
-                    workdir_files.remove(file)
-            # only checks children
-            children = [f.path for f in os.scandir(newpath)]
-            for child in children:
-                if child in workdir_files:
-                    workdir_files.remove(child)
-        else:
-            if newpath in workdir_files:
-                workdir_files.remove(newpath)
-    for wfile in workdir_files:
-        line = f'=> \"{wfile}\" does not exist in dotdrop'
-        LOG.log(line)
-    return len(workdir_files)
-
-
 def cmd_compare(opts, tmp):
     """compare dotfiles and return True if all identical"""
     dotfiles = opts.dotfiles
@@ -436,6 +362,8 @@ def cmd_compare(opts, tmp):
         LOG.log('\nno dotfile to compare')
         return False
 
+    # shared by all dotfiles
+    templ = get_templater(opts)
     same = True
     cnt = 0
     if opts.workers > 1:
@@ -447,7 +375,8 @@ def cmd_compare(opts, tmp):
             if not dotfile.src and not dotfile.dst:
                 # ignore fake dotfile
                 continue
-            j = ex.submit(_dotfile_compare, opts, dotfile, tmp)
+            func = timings.wrap(f'dotfile {dotfile.key}', _dotfile_compare)
+            j = ex.submit(func, opts, templ, dotfile, tmp)
             wait_for.append(j)
         # check result
         for fut in futures.as_completed(wait_for):
@@ -460,11 +389,12 @@ def cmd_compare(opts, tmp):
             if not dotfile.src and not dotfile.dst:
                 # ignore fake dotfile
                 continue
-            if not _dotfile_compare(opts, dotfile, tmp):
+            func = timings.wrap(f'dotfile {dotfile.key}', _dotfile_compare)
+            if not func(opts, templ, dotfile, tmp):
                 same = False
             cnt += 1
 
-    if opts.compare_workdir and _workdir_enum(opts) > 0:
+    if opts.compare_workdir and workdir_enum(opts) > 0:
         same = False
 
     LOG.log(f'\n{cnt} dotfile(s) compared.')
@@ -477,7 +407,7 @@ def cmd_update(opts):
     paths = opts.update_path
     iskey = opts.update_iskey
 
-    if opts.profile not in [p.key for p in opts.profiles]:
+    if not opts.conf.get_profile(opts.profile):
         LOG.err(f'no such profile \"{opts.profile}\"')
         return False
 
@@ -503,24 +433,30 @@ def cmd_update(opts):
 
     LOG.dbg(f'dotfile to update: {paths}')
 
-    # update each dotfile
-    if opts.workers > 1:
-        # in parallel
-        LOG.dbg(f'run with {opts.workers} workers')
-        ex = futures.ThreadPoolExecutor(max_workers=opts.workers)
-        wait_for = []
-        for path in paths:
-            j = ex.submit(_dotfile_update, opts, path, key=iskey)
-            wait_for.append(j)
-        # check result
-        for fut in futures.as_completed(wait_for):
-            if fut.result():
-                cnt += 1
-    else:
-        # sequentially
-        for path in paths:
-            if _dotfile_update(opts, path, key=iskey):
-                cnt += 1
+    # shared by all dotfiles
+    templ = get_templater(opts)
+
+    # update each dotfile, the config is written once
+    with opts.conf.transaction():
+        if opts.workers > 1:
+            # in parallel
+            LOG.dbg(f'run with {opts.workers} workers')
+            ex = futures.ThreadPoolExecutor(max_workers=opts.workers)
+            wait_for = []
+            for path in paths:
+                func = timings.wrap(f'dotfile {path}', _dotfile_update)
+                j = ex.submit(func, opts, templ, path, key=iskey)
+                wait_for.append(j)
+            # check result
+            for fut in futures.as_completed(wait_for):
+                if fut.result():
+                    cnt += 1
+        else:
+            # sequentially
+            for path in paths:
+                func = timings.wrap(f'dotfile {path}', _dotfile_update)
+                if func(opts, templ, path, key=iskey):
+                    cnt += 1
 
     LOG.log(f'\n{cnt} file(s) updated.')
     return cnt == len(paths)
@@ -540,23 +476,24 @@ def cmd_importer(opts):
                         ignore=opts.import_ignore,
                         forcekey=opts.import_force_key)
 
-    for path in paths:
-        tmpret = importer.import_path(path,
-                                      import_as=opts.import_as,
-                                      import_link=opts.import_link,
-                                      import_mode=opts.import_mode,
-                                      trans_install=opts.import_trans_install,
-                                      trans_update=opts.import_trans_update)
-        if tmpret < 0:
-            ret = False
-        elif tmpret > 0:
-            cnt += 1
+    # the config is written once all paths are imported
+    with opts.conf.transaction():
+        for path in paths:
+            tmpret = importer.import_path(
+                path,
+                import_as=opts.import_as,
+                import_link=opts.import_link,
+                import_mode=opts.import_mode,
+                trans_install=opts.import_trans_install,
+                trans_update=opts.import_trans_update)
+            if tmpret < 0:
+                ret = False
+            elif tmpret > 0:
+                cnt += 1
 
     if opts.dry:
         LOG.dry('new config file would be:')
         LOG.raw(opts.conf.dump())
-    else:
-        opts.conf.save()
     LOG.log(f'\n{cnt} file(s) imported.')
 
     return ret
@@ -577,7 +514,7 @@ def cmd_list_profiles(opts):
 
 def cmd_files(opts):
     """list all dotfiles for a specific profile"""
-    if opts.profile not in [p.key for p in opts.profiles]:
+    if not opts.conf.get_profile(opts.profile):
         LOG.warn(f'unknown profile \"{opts.profile}\"')
         return
     what = 'Dotfile(s)'
@@ -611,7 +548,7 @@ def cmd_files(opts):
 
 def cmd_detail(opts):
     """list details on all files for all dotfile entries"""
-    if opts.profile not in [p.key for p in opts.profiles]:
+    if not opts.conf.get_profile(opts.profile):
         LOG.warn(f'unknown profile \"{opts.profile}\"')
         return
     dotfiles = opts.dotfiles
@@ -678,73 +615,74 @@ def cmd_remove(opts):
     LOG.dbg(f'dotfile(s) to remove: {pathss}')
 
     removed = []
-    for key in paths:
-        if not iskey:
-            # by path
-            dotfiles = opts.conf.get_dotfile_by_dst(key)
-            if not dotfiles:
-                LOG.warn(f'{key} ignored, does not exist')
-                continue
-        else:
-            # by key
-            dotfile = opts.conf.get_dotfile(key)
-            if not dotfile:
-                LOG.warn(f'{key} ignored, does not exist')
-                continue
-            dotfiles = [dotfile]
-
-        for dotfile in dotfiles:
-            k = dotfile.key
-            # ignore if uses any type of link
-            if dotfile.link != LinkTypes.NOLINK:
-                msg = f'{k} uses symlink, remove manually'
-                LOG.warn(msg)
-                continue
-
-            LOG.dbg(f'removing {key}')
-
-            # make sure is part of the profile
-            if dotfile.key not in [d.key for d in opts.dotfiles]:
-                msg = f'{key} ignored, not associated to this profile'
-                LOG.warn(msg)
-                continue
-            profiles = opts.conf.get_profiles_by_dotfile_key(k)
-            pkeys = ','.join([p.key for p in profiles])
-            if opts.dry:
-                LOG.dry(f'would remove {dotfile} from {pkeys}')
-                continue
-            msg = f'Remove \"{k}\" from all these profiles: {pkeys}'
-            if opts.safe and not LOG.ask(msg):
-                return False
-            LOG.dbg(f'remove dotfile: {dotfile}')
+    # the config is written once all dotfiles are removed
+    with opts.conf.transaction():
+        for key in paths:
+            if not iskey:
+                # by path
+                dotfiles = opts.conf.get_dotfile_by_dst(key)
+                if not dotfiles:
+                    LOG.warn(f'{key} ignored, does not exist')
+                    continue
+            else:
+                # by key
+                dotfile = opts.conf.get_dotfile(key)
+                if not dotfile:
+                    LOG.warn(f'{key} ignored, does not exist')
+                    continue
+                dotfiles = [dotfile]
+
+            for dotfile in dotfiles:
+                k = dotfile.key
+                # ignore if uses any type of link
+                if dotfile.link != LinkTypes.NOLINK:
+                    msg = f'{k} uses symlink, remove manually'
+                    LOG.warn(msg)
+                    continue
+
+                LOG.dbg(f'removing {key}')
+
+                # make sure is part of the profile
+                if dotfile.key not in [d.key for d in opts.dotfiles]:
+                    msg = f'{key} ignored, not associated to this profile'
+                    LOG.warn(msg)
+                    continue
+                profiles = opts.conf.get_profiles_by_dotfile_key(k)
+                pkeys = ','.join([p.key for p in profiles])
+                if opts.dry:
+                    LOG.dry(f'would remove {dotfile} from {pkeys}')
+                    continue
+                msg = f'Remove \"{k}\" from all these profiles: {pkeys}'
+                if opts.safe and not LOG.ask(msg):
+                    return False
+                LOG.dbg(f'remove dotfile: {dotfile}')
 
-            for profile in profiles:
-                if not opts.conf.del_dotfile_from_profile(dotfile, profile):
+                for profile in profiles:
+                    if not opts.conf.del_dotfile_from_profile(dotfile,
+                                                              profile):
+                        return False
+                if not opts.conf.del_dotfile(dotfile):
                     return False
-            if not opts.conf.del_dotfile(dotfile):
-                return False
-
-            # remove dotfile from dotpath
-            dtpath = os.path.join(opts.dotpath, dotfile.src)
-            removepath(dtpath, logger=LOG)
-            # remove empty directory
-            parent = os.path.dirname(dtpath)
-            # remove any empty parent up to dotpath
-            while parent != opts.dotpath:
-                if os.path.isdir(parent) and dir_empty(parent):
-                    msg = f'Remove empty dir \"{parent}\"'
-                    if opts.safe and not LOG.ask(msg):
-                        break
-                    if not removepath(parent, logger=LOG):
-                        LOG.warn(f'unable to remove {parent}')
-                parent = os.path.dirname(parent)
-            removed.append(dotfile)
+
+                # remove dotfile from dotpath
+                dtpath = os.path.join(opts.dotpath, dotfile.src)
+                removepath(dtpath, logger=LOG)
+                # remove empty directory
+                parent = os.path.dirname(dtpath)
+                # remove any empty parent up to dotpath
+                while parent != opts.dotpath:
+                    if os.path.isdir(parent) and dir_empty(parent):
+                        msg = f'Remove empty dir \"{parent}\"'
+                        if opts.safe and not LOG.ask(msg):
+                            break
+                        if not removepath(parent, logger=LOG):
+                            LOG.warn(f'unable to remove {parent}')
+                    parent = os.path.dirname(parent)
+                removed.append(dotfile)
 
     if opts.dry:
         LOG.dry('new config file would be:')
         LOG.raw(opts.conf.dump())
-    else:
-        opts.conf.save()
     if removed:
         LOG.log('\nFollowing dotfile(s) are not tracked anymore:')
         entries = [f'- \"{r.dst}\" (was tracked as \"{r.key}\")'
@@ -755,6 +693,39 @@ def cmd_remove(opts):
     return True
 
 
+def cmd_compile(opts):
+    """compile the config for the selected profile to a snapshot"""
+    if not opts.conf.get_profile(opts.profile):
+        LOG.warn(f'unknown profile \"{opts.profile}\"')
+        return False
+    path = opts.compile_path
+    if opts.dry:
+        LOG.dry(f'would compile profile \"{opts.profile}\" to {path}')
+        return True
+    if not opts.conf.compile(path, eval_dvars=opts.compile_eval_dvars):
+        LOG.err(f'unable to compile config to {path}')
+        return False
+    LOG.log(f'profile \"{opts.profile}\" compiled to {path}')
+    return True
+
+
+def cmd_explain(opts):
+    """explain why the templates of the dotfiles will be rendered"""
+    if not opts.conf.get_profile(opts.profile):
+        LOG.warn(f'unknown profile \"{opts.profile}\"')
+        return
+    if not opts.template_incremental:
+        LOG.warn('template_incremental is disabled, '
+                 'templates are always rendered')
+    dotfiles = opts.dotfiles
+    if opts.explain_keys:
+        uniq = uniq_list(opts.explain_keys)
+        dotfiles = [d for d in dotfiles if d.key in uniq]
+    templ = get_templater(opts)
+    for dotfile in dotfiles:
+        _explain(opts, templ, dotfile)
+
+
 ###########################################################
 # helpers
 ###########################################################
@@ -775,14 +746,6 @@ def _get_install_installer(opts, tmpdir=None):
     return inst
 
 
-def _get_templater(opts):
-    """get an templater instance"""
-    templ = Templategen(base=opts.dotpath, variables=opts.variables,
-                        func_file=opts.func_file, filter_file=opts.filter_file,
-                        debug=opts.debug)
-    return templ
-
-
 def _detail(dotpath, dotfile):
     """display details on all files under a dotfile entry"""
     entry = f'{dotfile.key}'
@@ -808,6 +771,39 @@ def _detail(dotpath, dotfile):
                 LOG.sub(f'{fpath} (template:{template})')
 
 
+def _explain(opts, templ, dotfile):
+    """log why the templates of a dotfile entry will be rendered"""
+    LOG.log(f'{dotfile.key}')
+    src = os.path.normpath(os.path.expanduser(dotfile.src))
+    src = os.path.join(opts.dotpath, src)
+    dst = os.path.normpath(os.path.expanduser(dotfile.dst))
+    if not dotfile.template or \
+            not Templategen.path_is_template(src, debug=opts.debug):
+        LOG.sub('not templated')
+        return
+    if dotfile.link != LinkTypes.NOLINK:
+        # templates are installed to the workdir and linked
+        dst = pivot_path(dst, opts.workdir, striphome=True)
+    if dotfile.trans_install:
+        LOG.sub('transformed before being templated')
+        return
+    templ = templ.overlay(dotfile.get_dotfile_variables())
+    paths = [(src, dst)]
+    if os.path.isdir(src):
+        paths = []
+        for root, _, files in os.walk(src):
+            for file in files:
+                path = os.path.join(root, file)
+                rel = os.path.relpath(path, src)
+                paths.append((path, os.path.join(dst, rel)))
+    for path, pathdst in sorted(paths):
+        if not Templategen.path_is_template(path, debug=opts.debug):
+            continue
+        newvars = Installer.get_tmp_file_vars(path, pathdst)
+        reason = DEPENDENCIES.explain(templ.overlay(newvars), path, pathdst)
+        LOG.sub(f'{path} to {pathdst}: {reason or "up to date"}')
+
+
 def _select(selections, dotfiles):
     selected = []
     for selection in selections:
@@ -913,6 +909,18 @@ def _exec_command(opts):
             LOG.dbg(f'running cmd: {command}')
             cmd_uninstall(opts)
 
+        elif opts.cmd_compile:
+            # compile the config to a snapshot
+            command = 'compile'
+            LOG.dbg(f'running cmd: {command}')
+            ret = cmd_compile(opts)
+
+        elif opts.cmd_explain:
+            # explain the rendering of templates
+            command = 'explain'
+            LOG.dbg(f'running cmd: {command}')
+            cmd_explain(opts)
+
     except UndefinedException as exc:
         LOG.err(exc)
         ret = False
@@ -934,7 +942,8 @@ def main():
 
     time0 = time.time()
     try:
-        opts = Options()
+        with timings.phase('options'):
+            opts = Options()
     except YamlException as exc:
         LOG.err(f'yaml error: {exc}')
         return False
@@ -956,18 +965,23 @@ def main():
     if opts.check_version:
         check_version()
 
+    load_caches(opts)
+
     time0 = time.time()
-    ret, command = _exec_command(opts)
+    with timings.phase('command'):
+        ret, command = _exec_command(opts)
     cmd_time = time.time() - time0
 
     opts.debug_command()
     LOG.dbg(f'done executing command \"{command}\"')
     LOG.dbg(f'options loaded in {options_time}')
     LOG.dbg(f'command executed in {cmd_time}')
+    save_caches(opts)
 
     if ret and opts.conf.save():
         LOG.log('config file updated')
 
+    timings.report()
     LOG.dbg(f'return {ret}')
     return ret
 
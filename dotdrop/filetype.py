@@ -0,0 +1,192 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+identify the type of files (text or binary)
+"""
+
+import os
+import sys
+import codecs
+import threading
+
+# local imports
+from dotdrop.logger import Logger
+from dotdrop.utils import run
+
+
+# bytes read to identify a file
+SAMPLE_SIZE = 4096
+MIME_EMPTY = 'inode/x-empty'
+MIME_TEXT = 'text/plain'
+MIME_BINARY = 'application/octet-stream'
+MIME_SYMLINK = 'inode/symlink'
+# bytes found in text files (same as "file")
+TEXT_CHARS = bytes({7, 8, 9, 10, 12, 13, 27} |
+                   set(range(0x20, 0x7f)) |
+                   set(range(0x80, 0x100)))
+# text encodings using NUL bytes
+BOMS = (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE,
+        codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+# text formats magic may not report as text (markup like
+# image/svg+xml, application/pgp-keys, application/postscript)
+FORMATS = (b'<', b'-----BEGIN ', b'%!')
+LOG = Logger()
+
+
+class FiletypeCache:
+    """
+    thread-safe cache of file types
+    keyed by the file identity and state
+    """
+
+    def __init__(self):
+        """constructor"""
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def key(cls, path):
+        """return the cache key of path or None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, key):
+        """return the cached type for key or None"""
+        if key is None:
+            return None
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, filetype):
+        """cache filetype for key"""
+        if key is None or not filetype:
+            return
+        with self._lock:
+            self._entries[key] = filetype
+
+    def clear(self):
+        """empty the cache"""
+        with self._lock:
+            self._entries.clear()
+
+
+CACHE = FiletypeCache()
+
+
+def sniff(path):
+    """
+    identify path from its first bytes, only plain
+    text and binary are decided (see FORMATS)
+    returns the mime type or None when undecided
+    """
+    try:
+        with open(path, 'rb') as file:
+            chunk = file.read(SAMPLE_SIZE)
+    except OSError:
+        return None
+    if not chunk:
+        return MIME_EMPTY
+    if chunk.startswith(BOMS):
+        # utf-16/utf-32 text contains NUL bytes
+        return None
+    if b'\0' in chunk:
+        return MIME_BINARY
+    if chunk.translate(None, TEXT_CHARS):
+        # control characters
+        return None
+    start = chunk
+    if start.startswith(codecs.BOM_UTF8):
+        start = start[len(codecs.BOM_UTF8):]
+    if start.lstrip().startswith(FORMATS):
+        # magic knows better
+        return None
+    try:
+        chunk.decode('utf-8')
+    except UnicodeDecodeError as exc:
+        if len(chunk) < SAMPLE_SIZE or exc.start < len(chunk) - 3:
+            # not only a character cut at the end of the sample
+            return None
+    return MIME_TEXT
+
+
+def get_filetype(path, debug=False):
+    """return the mime type of path"""
+    return get_filetypes([path], debug=debug)[path]
+
+
+def get_filetypes(paths, debug=False):
+    """
+    return a dict path: mime type for all paths,
+    files not identified from their content are
+    handled by magic or by a single call to "file"
+    """
+    types = {}
+    keys = {}
+    undecided = []
+    for path in paths:
+        key = FiletypeCache.key(path)
+        filetype = CACHE.get(key)
+        if not filetype:
+            filetype = sniff(path)
+            CACHE.put(key, filetype)
+        if not filetype:
+            keys[path] = key
+            undecided.append(path)
+            continue
+        types[path] = filetype
+    if undecided:
+        found = _get_filetypes_fallback(undecided, debug=debug)
+        for path in undecided:
+            filetype = found.get(path, '')
+            if filetype == MIME_SYMLINK:
+                filetype = _get_symlink_filetype(path, debug=debug)
+            else:
+                CACHE.put(keys[path], filetype)
+            types[path] = filetype
+    return types
+
+
+def _get_symlink_filetype(path, debug=False):
+    """return the mime type of the symlink target"""
+    dst = os.readlink(path)
+    if not os.path.isabs(dst):
+        # canonicalize relative path
+        dst = os.path.join(os.path.dirname(path), dst)
+    return get_filetype(dst, debug=debug)
+
+
+def _get_filetypes_fallback(paths, debug=False):
+    """use magic or the file command to get the mime types"""
+    try:
+        # pylint: disable=C0415
+        import magic
+        if debug:
+            LOG.dbg('using \"magic\" for filetype identification',
+                    force=True)
+        return {path: magic.from_file(path, mime=True) for path in paths}
+    except (ImportError, AttributeError):
+        # not installed or not python-magic
+        pass
+    if debug:
+        LOG.dbg('using \"file\" for filetype identification', force=True)
+    if any('\n' in path for path in paths):
+        # one line per path is expected
+        return {path: _file_cmd([path], debug)[0] for path in paths}
+    types = _file_cmd(paths, debug)
+    if len(types) != len(paths):
+        return {path: _file_cmd([path], debug)[0] for path in paths}
+    return dict(zip(paths, types))
+
+
+def _file_cmd(paths, debug=False):
+    """run "file" on paths and return its output lines"""
+    # `file` on Windows doesn't support `-L`
+    follow_symlink = ['-L'] if sys.platform != 'win32' else []
+    cmd = ['file'] + follow_symlink + ['-b', '--mime-type', '--'] + paths
+    _, out = run(cmd, debug=debug)
+    lines = [line.strip() for line in out.splitlines()]
+    return lines or ['']
@@ -7,7 +7,6 @@ handle the installation of dotfiles
 
 import os
 import errno
-import shutil
 
 # local imports
 from dotdrop.logger import Logger
@@ -15,11 +14,15 @@ from dotdrop.linktypes import LinkTypes
 from dotdrop.utils import copyfile, get_file_perm, \
     pivot_path, must_ignore, removepath, \
     samefile, write_to_tmpfile, fastdiff, \
-    content_empty
+    content_empty, copy_file
 from dotdrop.utils import chmod as chmodit
 from dotdrop.utils import diff as diffit
 from dotdrop.exceptions import UndefinedException
+from dotdrop.templategen import DEPENDENCIES
+from dotdrop.writer import render_to_tmp, replace_file
 from dotdrop.cfg_yaml import CfgYaml
+from dotdrop.filetype import get_filetypes
+from dotdrop import timings
 
 
 class Installer:
@@ -69,6 +72,8 @@ class Installer:
         # avoids printing file copied logs
         # when using install_to_tmp for comparing
         self.comparing = False
+        # <temporary dst, dst> when installing to temp
+        self._pivot = None
 
         self.log = Logger(debug=self.debug)
 
@@ -279,10 +284,12 @@ class Installer:
 
         # install the dotfile to a temp directory
         tmpdst = pivot_path(dst, tmpdir, logger=self.log)
+        self._pivot = (tmpdst, dst)
         ret, err = self.install(templater, src, tmpdst,
                                 LinkTypes.NOLINK,
                                 is_template=is_template,
                                 chmod=chmod, ignore=ignore)
+        self._pivot = None
         if ret:
             self.log.dbg(f'tmp installed in {tmpdst}')
 
@@ -568,29 +575,53 @@ class Installer:
             return False, err
 
         # handle the file
-        content = None
+        rendered = None
+        differs = True
+        inputs = None
+        if is_template and templater.is_binary(src):
+            # nothing to render, copied as is
+            self.log.dbg(f'binary file not templated: {src}')
+            is_template = False
         if is_template:
             # template the file
             self.log.dbg(f'it is a template: {src}')
-            saved = templater.add_tmp_vars(self._get_tmp_file_vars(src, dst))
+            newvars = self.get_tmp_file_vars(src, dst)
+            templater = templater.overlay(newvars)
+            realdst = self._get_real_dst(dst)
+            if (self.diff or self.comparing) and \
+                    DEPENDENCIES.uptodate(templater, src, realdst):
+                if not self.comparing:
+                    self.log.dbg(f'{dst} is the same')
+                    return False, None
+                # compare the destination with itself
+                return self._write(realdst, dst, actionexec=actionexec)
             try:
-                content = templater.generate(src)
+                inputs = DEPENDENCIES.inputs(templater, src)
+                with timings.phase('template'):
+                    rendered, differs = render_to_tmp(
+                        templater, src, dst, compare=realdst,
+                        dry=self.dry, debug=self.debug)
             except UndefinedException as exc:
                 return False, str(exc)
-            finally:
-                templater.restore_vars(saved)
+            except OSError as exc:
+                return False, f'rendering {src}: {exc}'
+
+        try:
             # test is empty
-            if noempty and content_empty(content):
+            if rendered and noempty and self._is_empty(rendered):
                 self.log.dbg(f'ignoring empty template: {src}')
                 return False, None
-            if content is None:
-                err = f'empty template {src}'
-                return False, err
-
-        # write the file
-        ret, err = self._write(src, dst,
-                               content=content,
-                               actionexec=actionexec)
+            # write the file
+            ret, err = self._write(src, dst,
+                                   rendered=rendered, differs=differs,
+                                   actionexec=actionexec)
+            if inputs is not None and \
+                    self._holds_rendered(ret, err, differs):
+                DEPENDENCIES.put(realdst, inputs)
+        finally:
+            if rendered and os.path.exists(rendered):
+                # ignore error
+                removepath(rendered, logger=self.log)
 
         if ret and not err:
             rights = f'{get_file_perm(src):o}'
@@ -621,8 +652,17 @@ class Installer:
         ret = False
         dst_dotfiles = []
 
+        entries = os.listdir(src)
+        if is_template:
+            # identify all the files at once, the types are
+            # cached for the templater
+            paths = [os.path.join(src, entry) for entry in entries]
+            get_filetypes([path for path in paths
+                           if not os.path.isdir(path)],
+                          debug=self.debug)
+
         # handle all files in dir
-        for entry in os.listdir(src):
+        for entry in entries:
             fpath = os.path.join(src, entry)
             self.log.dbg(f'deploy sub from {dst}: {entry}')
             if not os.path.isdir(fpath):
@@ -705,33 +745,40 @@ class Installer:
                 self.log.warn(f'unable to remove {path}')
 
     @classmethod
-    def _write_content_to_file(cls, content, src, dst):
-        """write content to file"""
-        if content:
-            # write content the file
-            try:
-                with open(dst, 'wb') as file:
-                    file.write(content)
-            except NotADirectoryError as exc:
-                err = f'opening dest file: {exc}'
-                return False, err
-            except OSError as exc:
-                return False, str(exc)
-            except TypeError as exc:
-                return False, str(exc)
-        else:
-            # copy file
-            try:
-                # do NOT copy meta here
-                shutil.copyfile(src, dst)
-            except OSError as exc:
-                return False, str(exc)
+    def _write_to_file(cls, src, dst, rendered=None):
+        """copy src or move the rendered file to dst"""
+        if rendered:
+            return replace_file(rendered, dst)
+        # copy file
+        try:
+            # do NOT copy meta here
+            copy_file(src, dst)
+        except OSError as exc:
+            return False, str(exc)
         return True, None
 
-    def _write(self, src, dst, content=None,
+    def _holds_rendered(self, ret, err, differs):
+        """
+        return True if the destination now holds the rendered
+        template from the result <ret, err> of _write
+        """
+        if err or self.dry:
+            return False
+        return not differs or (ret and not self.comparing)
+
+    @classmethod
+    def _is_empty(cls, path):
+        """return True if the file path has no content"""
+        if os.path.getsize(path) > 1:
+            return False
+        with open(path, 'rb') as file:
+            return content_empty(file.read())
+
+    def _write(self, src, dst, rendered=None, differs=True,
                actionexec=None):
         """
-        copy dotfile / write content to file
+        copy dotfile / move the rendered template to dst
+        (differs tells if the rendered file is different from dst)
 
         return
         - True, None        : success
@@ -756,7 +803,11 @@ class Installer:
                     return False, err
 
             if self.diff:
-                if not self._is_different(src, dst, content=content):
+                if rendered:
+                    different = differs
+                else:
+                    different = self._is_different(src, dst)
+                if not different:
                     self.log.dbg(f'{dst} is the same')
                     return False, None
 
@@ -764,8 +815,7 @@ class Installer:
                 self.log.dbg(f'change detected for {dst}')
                 if self.showdiff:
                     # get diff
-                    self._show_diff_before_write(src, dst,
-                                                 content=content)
+                    self._show_diff_before_write(rendered or src, dst)
                 if not self.log.ask(f'Overwrite \"{dst}\"'):
                     return False, 'aborted'
                 overwrite = True
@@ -797,7 +847,8 @@ class Installer:
 
         # writing to file
         self.log.dbg(f'before writing to {dst} ({get_file_perm(src):o})')
-        ret = self._write_content_to_file(content, src, dst)
+        with timings.phase('write'):
+            ret = self._write_to_file(src, dst, rendered=rendered)
         self.log.dbg(f'written to {dst} ({get_file_perm(src):o})')
         return ret
 
@@ -805,8 +856,18 @@ class Installer:
     # helpers
     ########################################################
 
+    def _get_real_dst(self, dst):
+        """return the destination of dst when installed to temp"""
+        if not self._pivot:
+            return dst
+        tmpdst, realdst = self._pivot
+        if dst == tmpdst:
+            return realdst
+        return os.path.join(realdst, os.path.relpath(dst, tmpdst))
+
     @classmethod
-    def _get_tmp_file_vars(cls, src, dst):
+    def get_tmp_file_vars(cls, src, dst):
+        """variables available when templating src to dst"""
         tmp = {}
         tmp['_dotfile_sub_abs_src'] = src
         tmp['_dotfile_sub_abs_dst'] = dst
@@ -74,6 +74,8 @@ Usage:
   dotdrop files     [-VbTG]       [-c <path>] [-p <profile>]
   dotdrop detail    [-Vb]         [-c <path>] [-p <profile>] [<key>...]
   dotdrop profiles  [-VbG]        [-c <path>]
+  dotdrop compile   [-Vbe]        [-c <path>] [-p <profile>] <snapshot>
+  dotdrop explain   [-Vb]         [-c <path>] [-p <profile>] [<key>...]
   dotdrop gencfg
   dotdrop --help
   dotdrop --version
@@ -85,6 +87,7 @@ Options:
   -C --file=<path>        Path of dotfile to compare.
   -d --dry                Dry run.
   -D --showdiff           Show a diff before overwriting.
+  -e --eval-dynvars       Evaluate dynvariables when the snapshot is loaded.
   -f --force              Do not ask user confirmation for anything.
   -G --grepable           Grepable output.
   -i --ignore=<pattern>   Pattern to ignore.
@@ -147,6 +150,11 @@ class Options(AttrMonitor):
         self.clear_workdir = None
         self.key_prefix = None
         self.key_separator = None
+        self.workdir = None
+        self.template_max_size = None
+        self.template_bytecode_cache = None
+        self.template_incremental = None
+        self.dynvariables_workers = None
 
         # args parsing
         self.args = {}
@@ -288,6 +296,13 @@ class Options(AttrMonitor):
                                   self.profile,
                                   debug=self.debug,
                                   dry=self.dry)
+        if self.conf.snapshot and self.conf.profile_key != self.profile:
+            if self.profile != PROFILE:
+                err = 'snapshot compiled for profile '
+                err += f'\"{self.conf.profile_key}\"'
+                raise OptionsException(err)
+            # default profile, use the snapshot one
+            self.profile = self.conf.profile_key
         # transform the config settings to self attribute
         settings = self.conf.get_settings()
         debug_dict('effective settings', settings, self.debug)
@@ -364,6 +379,15 @@ class Options(AttrMonitor):
         """uninstall specifics"""
         self.uninstall_key = self.args['<key>']
 
+    def _apply_args_compile(self):
+        """compile specifics"""
+        self.compile_path = self.args['<snapshot>']
+        self.compile_eval_dvars = self.args['--eval-dynvars']
+
+    def _apply_args_explain(self):
+        """explain specifics"""
+        self.explain_keys = self.args['<key>']
+
     def _apply_args_detail(self):
         """detail specifics"""
         self.detail_keys = self.args['<key>']
@@ -380,6 +404,11 @@ class Options(AttrMonitor):
         self.cmd_detail = self.args['detail']
         self.cmd_remove = self.args['remove']
         self.cmd_uninstall = self.args['uninstall']
+        self.cmd_compile = self.args['compile']
+        self.cmd_explain = self.args['explain']
+        if self.conf.snapshot and \
+                (self.cmd_import or self.cmd_update or self.cmd_remove):
+            raise OptionsException('a compiled snapshot cannot be modified')
 
         # adapt attributes based on arguments
         self.safe = not self.args['--force']
@@ -431,14 +460,23 @@ class Options(AttrMonitor):
         # "uninstall" specifics
         self._apply_args_uninstall()
 
+        # "compile" specifics
+        self._apply_args_compile()
+
+        # "explain" specifics
+        self._apply_args_explain()
+
     def _fill_attr(self):
         """create attributes from conf"""
         # defined variables
         self.variables = self.conf.get_variables()
         # dotfiles for this profile
         self.dotfiles = self.conf.get_dotfiles(profile_key=self.profile)
-        # all defined profiles
-        self.profiles = self.conf.get_profiles()
+
+    @property
+    def profiles(self):
+        """all defined profiles (only materialized when needed)"""
+        return self.conf.get_profiles()
 
     def _debug_attr(self):
         """debug display all of this class attributes"""
@@ -52,6 +52,11 @@ class Settings(DictParser):
     key_compare_workdir = 'compare_workdir'
     key_key_prefix = 'key_prefix'
     key_key_separator = 'key_separator'
+    key_cache_config = 'cache_config'
+    key_template_max_size = 'template_max_size'
+    key_template_bytecode_cache = 'template_bytecode_cache'
+    key_template_incremental = 'template_incremental'
+    key_dynvariables_workers = 'dynvariables_workers'
 
     # import keys
     key_import_actions = 'import_actions'
@@ -60,6 +65,7 @@ class Settings(DictParser):
 
     # defaults
     default_diff_cmd = 'diff -r -u {0} {1}'
+    default_workdir = '~/.config/dotdrop'
 
     def __init__(self, backup=True, banner=True,
                  create=True, default_actions=None, dotpath='dotfiles',
@@ -68,7 +74,7 @@ class Settings(DictParser):
                  link_dotfile_default=LinkTypes.NOLINK,
                  link_on_import=LinkTypes.NOLINK, longkey=False,
                  upignore=None, cmpignore=None, instignore=None,
-                 impignore=None, workdir='~/.config/dotdrop',
+                 impignore=None, workdir=default_workdir,
                  showdiff=False, minversion=None,
                  func_file=None, filter_file=None,
                  diff_command=default_diff_cmd,
@@ -77,7 +83,9 @@ class Settings(DictParser):
                  force_chmod=False, chmod_on_import=False,
                  check_version=False, clear_workdir=False,
                  compare_workdir=False, key_prefix=True,
-                 key_separator='_'):
+                 key_separator='_', cache_config=False,
+                 template_max_size=0, template_bytecode_cache=False,
+                 template_incremental=False, dynvariables_workers=1):
         self.backup = backup
         self.banner = banner
         self.create = create
@@ -112,6 +120,11 @@ class Settings(DictParser):
         self.compare_workdir = compare_workdir
         self.key_prefix = key_prefix
         self.key_separator = key_separator
+        self.cache_config = cache_config
+        self.template_max_size = template_max_size
+        self.template_bytecode_cache = template_bytecode_cache
+        self.template_incremental = template_incremental
+        self.dynvariables_workers = dynvariables_workers
 
         # check diff command
         if not is_bin_in_path(self.diff_command):
@@ -148,6 +161,11 @@ class Settings(DictParser):
             self.key_compare_workdir: self.compare_workdir,
             self.key_key_prefix: self.key_prefix,
             self.key_key_separator: self.key_separator,
+            self.key_cache_config: self.cache_config,
+            self.key_template_max_size: self.template_max_size,
+            self.key_template_bytecode_cache: self.template_bytecode_cache,
+            self.key_template_incremental: self.template_incremental,
+            self.key_dynvariables_workers: self.dynvariables_workers,
         }
         self._serialize_seq(self.key_default_actions, dic)
         self._serialize_seq(self.key_import_actions, dic)
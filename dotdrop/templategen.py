@@ -6,14 +6,15 @@ jinja2 template generator
 """
 
 import os
-import io
 import re
+import copy
+import json
+import hashlib
 import mmap
-import sys
-from jinja2 import Environment, FileSystemLoader, \
-    ChoiceLoader, FunctionLoader, TemplateNotFound, \
-    StrictUndefined
-from jinja2.exceptions import UndefinedError
+import threading
+from stat import S_ISREG, S_ISDIR
+from collections import OrderedDict, ChainMap
+from collections.abc import Mapping
 
 
 # local imports
@@ -21,6 +22,9 @@ from dotdrop import utils
 from dotdrop import jhelpers
 from dotdrop.logger import Logger
 from dotdrop.exceptions import UndefinedException
+from dotdrop.cache import get_cache_path, load_cache, save_cache
+from dotdrop.filetype import get_filetype
+from dotdrop.version import __version__ as VERSION
 
 BLOCK_START = '{%@@'
 BLOCK_END = '@@%}'
@@ -30,63 +34,503 @@ COMMENT_START = '{#@@'
 COMMENT_END = '@@#}'
 LOG = Logger()
 
+# any of the block, variable or comment start markers
+MARKERS = re.compile(rb'\{[%{#]@@')
+# leading bytes checked for NUL to detect binary files
+SCAN_BLOCK = 4096
+# size of the blocks read when streaming binary files
+STREAM_BLOCK = 1024 * 1024
+
 DICT_ENV_NAME = 'env'
 DICT_VARS_NAME = '_vars'
 
+# filters whose output changes between calls
+IMPURE_FILTERS = ['random']
+# filters taking the name of other filters/tests as arguments
+HIGHER_ORDER_FILTERS = ['map', 'select', 'reject', 'selectattr', 'rejectattr']
+# jinja globals whose output changes between calls
+IMPURE_GLOBALS = ['lipsum']
+
+
+def file_has_markers(path, debug=False):
+    """
+    test if file pointed by path is a template,
+    the file is scanned once for any of the markers
+    and files with NUL in their first block are binary
+    """
+    if debug:
+        LOG.dbg(f'is template: {path}')
+    if not os.path.isfile(path):
+        return False
+    try:
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as mapf:
+                if mapf.find(b'\0', 0, SCAN_BLOCK) != -1:
+                    # is binary so surely no template
+                    return False
+                return MARKERS.search(mapf) is not None
+    except (OSError, ValueError):
+        # unreadable or emptied meanwhile
+        return False
+
+
+class CompiledCache:
+    """
+    thread-safe LRU of compiled template code
+    shared by all templaters
+    """
+
+    def __init__(self, maxsize=1024):
+        """constructor
+        @maxsize: max number of compiled templates kept
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """return the compiled code for key or None"""
+        with self._lock:
+            code = self._entries.get(key)
+            if code is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return code
+
+    def put(self, key, code):
+        """add compiled code for key"""
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+COMPILED = CompiledCache()
+
+
+class TemplateIndex:
+    """
+    thread-safe index of the files template status
+    persisted in the workdir, a file is only read
+    when its stat changed since it was indexed
+    """
+
+    NAME = 'templates.json'
+
+    def __init__(self):
+        """constructor"""
+        # path -> [dev, inode, size, mtime, is template]
+        self._files = {}
+        # paths looked up during this run
+        self._seen = set()
+        self._path = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.reads = 0
+        # files bigger than this are not scanned (0 for no limit)
+        self.max_size = 0
+
+    def load(self, workdir, max_size=0, debug=False):
+        """load the index persisted in workdir"""
+        path = get_cache_path(workdir, self.NAME)
+        content = load_cache(path, debug=debug)
+        with self._lock:
+            self._path = path
+            self.max_size = max_size or 0
+            if isinstance(content, dict):
+                self._files.update(content)
+
+    def save(self, debug=False):
+        """persist the index if it changed"""
+        with self._lock:
+            if not self._path or not self._dirty:
+                return False
+            # forget files that do not exist anymore
+            for path in list(self._files.keys()):
+                if path not in self._seen and not os.path.exists(path):
+                    del self._files[path]
+            content = dict(self._files)
+            self._dirty = False
+        return save_cache(self._path, content, debug=debug)
+
+    def file_is_template(self, path, stat, debug=False):
+        """return True if the file path with stat is a template"""
+        if self.max_size and stat.st_size > self.max_size:
+            # too big to be scanned
+            if debug:
+                LOG.dbg(f'not scanned (size {stat.st_size}): \"{path}\"',
+                        force=True)
+            return False
+        key = [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            self._seen.add(path)
+            entry = self._files.get(path)
+        if isinstance(entry, list) and entry[:-1] == key:
+            return entry[-1]
+        isit = file_has_markers(path, debug=debug)
+        with self._lock:
+            self.reads += 1
+            self._files[path] = key + [isit]
+            self._dirty = True
+        return isit
+
+    def path_is_template(self, path, debug=False):
+        """
+        recursively check if any file is a template within path,
+        directories are rolled up from the status of their files
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # does not exist
+            if debug:
+                LOG.dbg(f'is NOT template: \"{path}\"', force=True)
+            return False
+        if S_ISREG(stat.st_mode):
+            return self.file_is_template(path, stat, debug=debug)
+        if not S_ISDIR(stat.st_mode):
+            return False
+        # directory mtimes do not change when a file
+        # they contain is modified, their content is
+        # thus always walked but files are only stat'ed
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    isit = self.file_is_template(entry.path, entry.stat(),
+                                                 debug=debug)
+                else:
+                    isit = self.path_is_template(entry.path, debug=debug)
+                if isit:
+                    if debug:
+                        LOG.dbg(f'is indeed template: \"{path}\"',
+                                force=True)
+                    return True
+        if debug:
+            LOG.dbg(f'is NOT template: \"{path}\"', force=True)
+        return False
+
+
+TEMPLATES = TemplateIndex()
+
+
+class TemplateDeps:
+    """
+    thread-safe record of the inputs (files loaded and
+    variables referenced) of the rendered templates persisted
+    in the workdir, a template whose inputs and destination
+    did not change since it was rendered is not rendered again
+    """
+
+    NAME = 'template-deps.json'
+
+    def __init__(self):
+        """constructor"""
+        # destination -> inputs of the template rendered to it
+        self._entries = {}
+        self._path = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.skipped = 0
+
+    def load(self, workdir, debug=False):
+        """load the dependencies persisted in workdir"""
+        path = get_cache_path(workdir, self.NAME)
+        content = load_cache(path, debug=debug)
+        with self._lock:
+            self._path = path
+            self.enabled = True
+            if isinstance(content, dict) and \
+                    content.get('version') == VERSION and \
+                    isinstance(content.get('entries'), dict):
+                self._entries.update(content['entries'])
+
+    def save(self, debug=False):
+        """persist the dependencies if they changed"""
+        with self._lock:
+            if not self._path or not self._dirty:
+                return False
+            # forget destinations that do not exist anymore
+            for dst in list(self._entries.keys()):
+                if not os.path.lexists(dst):
+                    del self._entries[dst]
+            content = {'version': VERSION, 'entries': dict(self._entries)}
+            self._dirty = False
+        return save_cache(self._path, content, debug=debug)
+
+    def inputs(self, templater, src):
+        """
+        return the current inputs of the template src
+        to record with put once rendered, None when disabled
+        """
+        if not self.enabled:
+            return None
+        files, names, filters, reason = templater.get_dependencies(src)
+        entry = {
+            'src': src,
+            'base': templater.base,
+            'files': {path: _stat_key(path) for path in files},
+            'filters': sorted(filters),
+        }
+        if not reason:
+            entry['vars'], reason = templater.get_inputs_digest(names,
+                                                                filters)
+        if reason:
+            entry['volatile'] = reason
+        return entry
+
+    def put(self, dst, inputs):
+        """record that dst holds the template rendered with inputs"""
+        if not self.enabled or inputs is None:
+            return
+        entry = dict(inputs)
+        entry['dst'] = _stat_key(_get_target(dst))
+        with self._lock:
+            self._entries[dst] = entry
+            self._dirty = True
+
+    def uptodate(self, templater, src, dst):
+        """return True if dst holds the rendered template src"""
+        if not self.enabled:
+            return False
+        reason = self.explain(templater, src, dst)
+        if reason:
+            templater.log.dbg(f'render {src} to {dst}: {reason}')
+            return False
+        templater.log.dbg(f'{dst} up to date with {src}')
+        with self._lock:
+            self.skipped += 1
+        return True
+
+    def explain(self, templater, src, dst):
+        """
+        return the reason why the template src needs
+        to be rendered to dst or None if it does not
+        """
+        with self._lock:
+            entry = self._entries.get(dst)
+        if not entry:
+            return 'never rendered to this destination'
+        if entry.get('volatile'):
+            return entry['volatile']
+        if entry.get('src') != src or entry.get('base') != templater.base:
+            return 'different source'
+        key = _stat_key(_get_target(dst))
+        if not key:
+            return 'destination does not exist'
+        if key != entry.get('dst'):
+            return 'destination modified'
+        for path, key in entry.get('files', {}).items():
+            if _stat_key(path) != key:
+                return f'\"{path}\" modified'
+        recorded = entry.get('vars', {})
+        names = {name: None if isinstance(digest, str) else list(digest)
+                 for name, digest in recorded.items()}
+        digests, reason = templater.get_inputs_digest(
+            names, entry.get('filters', []))
+        if reason:
+            return reason
+        for name, digest in recorded.items():
+            if digests.get(name) == digest:
+                continue
+            if isinstance(digest, dict):
+                for key, value in digest.items():
+                    if digests[name].get(key) != value:
+                        return f'variable \"{name}.{key}\" changed'
+            return f'variable \"{name}\" changed'
+        return None
+
+
+DEPENDENCIES = TemplateDeps()
+
+
+def _stat_key(path):
+    """return the stat of path as stored in the caches"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def _get_target(path):
+    """symlinks are written through"""
+    if os.path.islink(path):
+        return os.path.realpath(path)
+    return path
+
+
+def _digest(value):
+    """return a digest of the value of a variable"""
+    if isinstance(value, Mapping) and not isinstance(value, dict):
+        value = dict(value)
+    try:
+        data = json.dumps(value, sort_keys=True, default=repr)
+    except (TypeError, ValueError):
+        data = repr(value)
+    return hashlib.sha1(data.encode('utf-8', 'surrogateescape')).hexdigest()
+
 
 class Templategen:
     """dotfile templater"""
 
+    # cache directory of the compiled templates
+    BYTECODE_NAME = 'bytecode'
+
     def __init__(self, base='.', variables=None,
-                 func_file=None, filter_file=None, debug=False):
+                 func_file=None, filter_file=None,
+                 bytecode_dir=None, debug=False):
         """constructor
         @base: directory path where to search for templates
         @variables: dictionary of variables for templates
         @func_file: file path to load functions from
         @filter_file: file path to load filters from
+        @bytecode_dir: directory where to persist compiled templates
         @debug: enable debug
         """
         self.base = base.rstrip(os.sep)
+        self.bytecode_dir = bytecode_dir
         self.debug = debug
         self.log = Logger(debug=self.debug)
         self.log.dbg('loading templategen')
         self.variables = {}
-        loader1 = FileSystemLoader(self.base)
-        loader2 = FunctionLoader(self._template_loader)
-        loader = ChoiceLoader([loader1, loader2])
-        self.env = Environment(loader=loader,
-                               trim_blocks=True, lstrip_blocks=True,
-                               keep_trailing_newline=True,
-                               block_start_string=BLOCK_START,
-                               block_end_string=BLOCK_END,
-                               variable_start_string=VAR_START,
-                               variable_end_string=VAR_END,
-                               comment_start_string=COMMENT_START,
-                               comment_end_string=COMMENT_END,
-                               undefined=StrictUndefined)
+        # the templater whose engine is shared (see overlay)
+        self.root = self
+        self._lock = threading.Lock()
+        # custom functions/filters files already loaded
+        self._loaded_files = set()
+        # compiled code depends on the available filters
+        self._signature = None
+        # the jinja environment is only created when
+        # something needs to be templated (see env)
+        self._env = None
+        self._globals = {}
+        self._filters = {}
 
         # adding variables
-        self.variables[DICT_ENV_NAME] = os.environ
-        if variables:
-            self.variables.update(variables)
-            self.variables[DICT_VARS_NAME] = variables
+        self.set_variables(variables)
 
         # adding header method
-        self.env.globals['header'] = self._header
+        self._globals['header'] = self._header
         # adding helper methods
         self.log.dbg('load global functions:')
-        self._load_funcs_to_dic(jhelpers, self.env.globals)
-        if func_file:
-            for ffile in func_file:
-                self.log.dbg(f'load custom functions from {ffile}')
-                self._load_path_to_dic(ffile, self.env.globals)
-        if filter_file:
-            for ffile in filter_file:
-                self.log.dbg(f'load custom filters from {ffile}')
-                self._load_path_to_dic(ffile, self.env.filters)
+        self._load_funcs_to_dic(jhelpers, self._globals)
+        self.load_functions(func_file=func_file, filter_file=filter_file)
+        self._update_signature()
         if self.debug:
             self._debug_dict('template additional variables', variables)
 
+    @property
+    def signature(self):
+        """
+        the key sharing compiled code between templaters,
+        the available filters
+        """
+        return self._signature
+
+    @property
+    def user_filters(self):
+        """the filters loaded from the filter files"""
+        return self._filters
+
+    @property
+    def env(self):
+        """the jinja environment, created on first use"""
+        if self.root is not self:
+            return self.root.env
+        if self._env is not None:
+            return self._env
+        with self._lock:
+            if self._env is not None:
+                # created by another thread meanwhile
+                return self._env
+            # pylint: disable=C0415
+            from jinja2 import Environment, FileSystemLoader, \
+                ChoiceLoader, FunctionLoader, StrictUndefined
+            loader1 = FileSystemLoader(self.base)
+            loader2 = FunctionLoader(self._template_loader)
+            loader = ChoiceLoader([loader1, loader2])
+            # templates are not modified during a run
+            env = Environment(loader=loader,
+                              auto_reload=False,
+                              bytecode_cache=self._get_bytecode_cache(),
+                              trim_blocks=True, lstrip_blocks=True,
+                              keep_trailing_newline=True,
+                              block_start_string=BLOCK_START,
+                              block_end_string=BLOCK_END,
+                              variable_start_string=VAR_START,
+                              variable_end_string=VAR_END,
+                              comment_start_string=COMMENT_START,
+                              comment_end_string=COMMENT_END,
+                              undefined=StrictUndefined)
+            env.globals.update(self._globals)
+            env.filters.update(self._filters)
+            self._env = env
+        return self._env
+
+    def overlay(self, variables=None):
+        """
+        return a templater sharing the engine of this one
+        (environment, functions and filters) and rendering
+        with variables on top of the ones of this templater,
+        this templater is left untouched
+        """
+        # the copy shares the root of this templater
+        tmpl = copy.copy(self)
+        tmpl.variables = self.variables.new_child(dict(variables or {}))
+        return tmpl
+
+    def load_functions(self, func_file=None, filter_file=None):
+        """
+        load custom functions and filters
+        files already loaded are skipped
+        @func_file: file paths to load functions from
+        @filter_file: file paths to load filters from
+        """
+        if self.root is not self:
+            self.root.load_functions(func_file=func_file,
+                                     filter_file=filter_file)
+            return
+        for ffile in func_file or []:
+            if ('func', ffile) in self._loaded_files:
+                continue
+            self.log.dbg(f'load custom functions from {ffile}')
+            self._load_path_to_dic(ffile, self._globals)
+            self._loaded_files.add(('func', ffile))
+        for ffile in filter_file or []:
+            if ('filter', ffile) in self._loaded_files:
+                continue
+            self.log.dbg(f'load custom filters from {ffile}')
+            self._load_path_to_dic(ffile, self._filters)
+            self._loaded_files.add(('filter', ffile))
+            self._update_signature()
+        if self._env is not None:
+            self._env.globals.update(self._globals)
+            self._env.filters.update(self._filters)
+            self._env.bytecode_cache = self._get_bytecode_cache()
+
+    def set_variables(self, variables):
+        """
+        replace the variables available to templates
+        returns the previous ones
+        """
+        previous = self.variables
+        base = {DICT_ENV_NAME: os.environ}
+        if variables:
+            base.update(variables)
+            base[DICT_VARS_NAME] = variables
+        # scopes (dotfile, file, ...) are layered on top
+        self.variables = ChainMap(base)
+        return previous
+
     def generate(self, src):
         """
         render template from path
@@ -95,8 +539,20 @@ class Templategen:
         """
         if not os.path.exists(src):
             return ''
+        return b''.join(self.generate_stream(src))
+
+    def generate_stream(self, src):
+        """
+        render template from path as chunks of bytes
+        may raise a UndefinedException while iterating
+        in case a variable is undefined
+        """
+        if not os.path.exists(src):
+            return
+        # pylint: disable=C0415
+        from jinja2.exceptions import UndefinedError
         try:
-            return self._handle_file(src)
+            yield from self._stream_file(src)
         except UndefinedError as exc:
             err = f'undefined variable: {exc.message}'
             raise UndefinedException(err) from exc
@@ -109,8 +565,13 @@ class Templategen:
         """
         if not string:
             return ''
+        if not self._has_markers(string):
+            # nothing to render
+            return string
+        # pylint: disable=C0415
+        from jinja2.exceptions import UndefinedError
         try:
-            return self.env.from_string(string).render(self.variables)
+            return self._render(self._from_string(string))
         except UndefinedError as exc:
             err = f'undefined variable: {exc.message}'
             raise UndefinedException(err) from exc
@@ -147,22 +608,248 @@ class Templategen:
             return self.generate_dict(content)
         raise UndefinedException(f'could not template {content}')
 
+    def get_referenced_variables(self, content):
+        """
+        return the set of variable names referenced
+        in content (string or dict, recursively)
+        """
+        names = set()
+        if isinstance(content, dict):
+            for value in content.values():
+                names.update(self.get_referenced_variables(value))
+            return names
+        if not isinstance(content, str) or \
+                not self._has_markers(content):
+            return names
+        # pylint: disable=C0415
+        from jinja2 import meta
+        from jinja2.exceptions import TemplateSyntaxError
+        try:
+            ast = self.env.parse(content)
+        except TemplateSyntaxError:
+            # reported when rendered
+            return names
+        return meta.find_undeclared_variables(ast)
+
+    def get_dependencies(self, src):
+        """
+        return the inputs of the template src found in its source
+        and in the ones it loads: <files, names, filters, reason>
+        with the paths of the templates, the variables referenced
+        (name: keys used or None for the whole value), the filters
+        used and the reason why these are unknown (None if known)
+        """
+        # pylint: disable=C0415
+        from jinja2 import meta
+        from jinja2.exceptions import TemplateError, TemplateNotFound
+        env = self.env
+        files = []
+        names = {}
+        filters = set()
+        todo = [os.path.relpath(src, self.base)]
+        seen = set()
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            path = os.path.normpath(os.path.join(self.base, name))
+            try:
+                source, filename, _ = env.loader.get_source(env, name)
+                ast = env.parse(source, name, filename)
+            except TemplateNotFound:
+                # may be created later (ignore missing)
+                files.append(path)
+                continue
+            except (TemplateError, OSError, UnicodeDecodeError) as exc:
+                return files, names, filters, f'not parsable: {exc}'
+            files.append(filename or path)
+            for ref in meta.find_referenced_templates(ast):
+                if ref is None:
+                    return files, names, filters, 'dynamic template loading'
+                todo.append(ref)
+            for var, keys in self._get_used_names(ast, filters).items():
+                if var not in names:
+                    names[var] = keys
+                elif names[var] is None or keys is None:
+                    names[var] = None
+                else:
+                    names[var] |= keys
+        return files, names, filters, None
+
+    def get_inputs_digest(self, names, filters):
+        """
+        return <digests, reason> with the digests of the current
+        values of the variables names (see get_dependencies)
+        and the reason why the rendered output cannot be
+        predicted from them (None if it can)
+        """
+        userfilters = self.root.user_filters
+        for name in filters:
+            if name in userfilters or name in IMPURE_FILTERS:
+                return {}, f'uses filter \"{name}\"'
+        lookup = ChainMap(*self.variables.maps, self.env.globals)
+        digests = {}
+        for name, keys in sorted(names.items()):
+            value = lookup.get(name)
+            if callable(value):
+                if not self._is_pure(value):
+                    return digests, f'uses function \"{name}\"'
+                digests[name] = name
+            elif keys is None or not isinstance(value, Mapping):
+                digests[name] = _digest(value)
+            else:
+                digests[name] = {key: _digest(value.get(key))
+                                 for key in sorted(keys)}
+        return digests, None
+
     def add_tmp_vars(self, newvars=None):
-        """add vars to the globals, make sure to call restore_vars"""
-        saved_variables = self.variables.copy()
-        if not newvars:
-            return saved_variables
-        self.variables.update(newvars)
+        """
+        push a scope with vars on top of the variables,
+        make sure to call restore_vars
+        """
+        saved_variables = self.variables
+        self.variables = saved_variables.new_child(dict(newvars or {}))
         return saved_variables
 
     def restore_vars(self, saved_globals):
-        """restore globals from add_tmp_vars"""
-        self.variables = saved_globals.copy()
+        """pop the scopes pushed since add_tmp_vars"""
+        self.variables = saved_globals
 
     def update_variables(self, variables):
         """update variables"""
         self.variables.update(variables)
 
+    @staticmethod
+    def cache_stats():
+        """return the compiled templates cache (hits, misses)"""
+        return COMPILED.hits, COMPILED.misses
+
+    def _update_signature(self):
+        """
+        update the key used to share compiled code,
+        jinja's own filters are the same for all templaters
+        """
+        self._signature = frozenset(self._filters)
+
+    def _get_bytecode_cache(self):
+        """
+        return the persistent cache of compiled templates or None,
+        jinja checks the template content itself and entries are
+        named after what else changes the compiled code
+        """
+        if not self.bytecode_dir:
+            return None
+        # pylint: disable=C0415
+        from jinja2 import FileSystemBytecodeCache
+        try:
+            os.makedirs(self.bytecode_dir, exist_ok=True)
+        except OSError as exc:
+            self.log.warn(f'no bytecode cache in {self.bytecode_dir}: {exc}')
+            return None
+        sig = [BLOCK_START, BLOCK_END, VAR_START, VAR_END,
+               COMMENT_START, COMMENT_END] + sorted(self._filters)
+        sig = hashlib.sha1('\0'.join(sig).encode('utf-8')).hexdigest()
+        return FileSystemBytecodeCache(self.bytecode_dir,
+                                       pattern=f'{sig[:16]}-%s.cache')
+
+    def _render(self, template):
+        """
+        same as template.render(self.variables) but
+        without flattening the variables scopes into a new dict
+        """
+        return template.environment.concat(self._render_stream(template))
+
+    def _render_stream(self, template):
+        """same as _render but yields the rendered chunks"""
+        variables = ChainMap(*self.variables.maps, template.globals)
+        context = template.new_context(variables, shared=True)
+        try:
+            yield from template.root_render_func(context)
+        except Exception:  # pylint: disable=W0718
+            # same as jinja, re-raised with the template traceback
+            template.environment.handle_exception()
+
+    @staticmethod
+    def _get_used_names(ast, filters):
+        """
+        return the names used in ast (name: keys used or None
+        if not only used through constant keys) in a single walk,
+        local names are included, and add the filters used to filters,
+        calls (like env.get('FOO') or cfg.items()) use the whole value
+        """
+        # pylint: disable=C0415
+        from jinja2 import nodes
+        uses = {}
+        keys = {}
+        called = set()
+        for node in ast.find_all(nodes.Node):
+            if isinstance(node, nodes.Call):
+                # parents are walked before their children
+                called.add(id(node.node))
+            if isinstance(node, nodes.Name):
+                if node.ctx == 'load':
+                    uses[node.name] = uses.get(node.name, 0) + 1
+            elif isinstance(node, (nodes.Getattr, nodes.Getitem)):
+                if not isinstance(node.node, nodes.Name):
+                    continue
+                if id(node) in called:
+                    continue
+                if isinstance(node, nodes.Getattr):
+                    key = node.attr
+                elif isinstance(node.arg, nodes.Const) and \
+                        isinstance(node.arg.value, str):
+                    key = node.arg.value
+                else:
+                    continue
+                keys.setdefault(node.node.name, []).append(key)
+            elif isinstance(node, (nodes.Filter, nodes.Test)):
+                filters.add(node.name)
+                if node.name not in HIGHER_ORDER_FILTERS:
+                    continue
+                filters.update(arg.value for arg in node.args
+                               if isinstance(arg, nodes.Const) and
+                               isinstance(arg.value, str))
+        names = {}
+        for name, count in uses.items():
+            used = keys.get(name, [])
+            names[name] = set(used) if len(used) == count else None
+        return names
+
+    @staticmethod
+    def _is_pure(func):
+        """
+        return True if func is one of the jinja or dotdrop
+        helpers returning the same for the same arguments
+        """
+        # pylint: disable=C0415
+        from jinja2.defaults import DEFAULT_NAMESPACE
+        pure = [value for name, value in DEFAULT_NAMESPACE.items()
+                if name not in IMPURE_GLOBALS]
+        pure += [jhelpers.basename, jhelpers.dirname,
+                 Templategen.__dict__['_header'].__func__]
+        func = getattr(func, '__func__', func)
+        return any(func is other for other in pure)
+
+    @staticmethod
+    def _has_markers(string):
+        """return True if string contains any template marker"""
+        return VAR_START in string or BLOCK_START in string or \
+            COMMENT_START in string
+
+    def _from_string(self, string):
+        """
+        same as env.from_string but sharing
+        the compiled code between templaters
+        """
+        key = (string, self.root.signature)
+        code = COMPILED.get(key)
+        if code is None:
+            code = self.env.compile(string)
+            COMPILED.put(key, code)
+        glob = self.env.make_globals(None)
+        return self.env.template_class.from_code(self.env, code, glob)
+
     def _load_path_to_dic(self, path, dic):
         mod = utils.get_module_from_path(path)
         if not mod:
@@ -172,7 +859,7 @@ class Templategen:
 
     def _load_funcs_to_dic(self, mod, dic):
         """dynamically load functions from module to dic"""
-        if not mod or not dic:
+        if not mod or dic is None:
             return
         funcs = utils.get_module_functions(mod)
         for name, func in funcs:
@@ -185,34 +872,19 @@ class Templategen:
         return f'{prepend}{utils.header()}'
 
     def _get_filetype(self, src):
-        """use magic or the file command to get the mime type of a file"""
-        try:
-            # pylint: disable=C0415
-            import magic
-            filetype = magic.from_file(src, mime=True)
-            self.log.dbg('using \"magic\" for filetype identification')
-        except ImportError:
-            # fallback
-
-            # `file` on Windows doesn't support `-L`
-            follow_symlink = ['-L'] if sys.platform != 'win32' else []
-
-            _, filetype = utils.run(['file'] + follow_symlink + ['-b',
-                                                                 '--mime-type',
-                                                                 src],
-                                    debug=self.debug)
-            self.log.dbg('using \"file\" for filetype identification')
-            filetype = filetype.strip()
-        if filetype == 'inode/symlink':
-            dst = os.readlink(src)
-            if dst[0] != '/':
-                # Canonicalize relative path
-                dst = os.path.join(os.path.dirname(src), dst)
-            return self._get_filetype(dst)
-        return filetype
+        """get the mime type of a file"""
+        return get_filetype(src, debug=self.debug)
+
+    def is_binary(self, src):
+        """return True if src is not text and is not templated"""
+        return not self._is_text(self._get_filetype(src))
 
     def _handle_file(self, src):
         """generate the file content from template"""
+        return b''.join(self._stream_file(src))
+
+    def _stream_file(self, src):
+        """generate the file content from template by chunks"""
         filetype = self._get_filetype(src)
         istext = self._is_text(filetype)
         self.log.dbg(f'filetype \"{src}\": {filetype}')
@@ -242,30 +914,32 @@ class Templategen:
         path = os.path.join(self.base, relpath)
         path = os.path.normpath(path)
         if not os.path.exists(path):
+            # pylint: disable=C0415
+            from jinja2 import TemplateNotFound
             raise TemplateNotFound(path)
         with open(path, 'r', encoding='utf8') as file:
             content = file.read()
         return content
 
     def _handle_text_file(self, src):
-        """write text to file"""
+        """yield the rendered text by chunks"""
         template_rel_path = os.path.relpath(src, self.base)
         try:
             template = self.env.get_template(template_rel_path)
-            content = template.render(self.variables)
         except UnicodeDecodeError:
             data = self._read_bad_encoded_text(src)
-            content = self.generate_string(data)
-        return content.encode('utf-8')
+            yield self.generate_string(data).encode('utf-8')
+            return
+        for chunk in self._render_stream(template):
+            yield chunk.encode('utf-8')
 
     def _handle_bin_file(self, src):
-        """write binary to file"""
+        """yield the binary content by blocks"""
         # this is dirty
         if not src.startswith(self.base):
             src = os.path.join(self.base, src)
         with open(src, 'rb') as file:
-            content = file.read()
-        return content
+            yield from iter(lambda: file.read(STREAM_BLOCK), b'')
 
     @classmethod
     def _read_bad_encoded_text(cls, path):
@@ -277,38 +951,8 @@ class Templategen:
     @staticmethod
     def path_is_template(path, debug=False):
         """recursively check if any file is a template within path"""
-        path = os.path.expanduser(path)
-
-        if not os.path.exists(path):
-            # does not exist
-            if debug:
-                LOG.dbg(f'is NOT template: \"{path}\"', force=True)
-            return False
-
-        if os.path.isfile(path):
-            # is file
-            return Templategen._is_template(path, debug=debug)
-
-        # is a directory
-        for entry in os.listdir(path):
-            fpath = os.path.join(path, entry)
-            if not os.path.isfile(fpath):
-                # recursively explore directory
-                if Templategen.path_is_template(fpath,
-                                                debug=debug):
-                    if debug:
-                        LOG.dbg(f'is indeed template: \"{path}\"', force=True)
-                    return True
-            else:
-                # check if file is a template
-                if Templategen._is_template(fpath,
-                                            debug=debug):
-                    if debug:
-                        LOG.dbg(f'is indeed template: \"{path}\"', force=True)
-                    return True
-        if debug:
-            LOG.dbg(f'is NOT template: \"{path}\"', force=True)
-        return False
+        path = os.path.abspath(os.path.expanduser(path))
+        return TEMPLATES.path_is_template(path, debug=debug)
 
     @staticmethod
     def string_is_template(string):
@@ -340,25 +984,7 @@ class Templategen:
     @staticmethod
     def _is_template(path, debug=False):
         """test if file pointed by path is a template"""
-        if debug:
-            Logger().dbg(f'is template: {path}')
-        if not os.path.isfile(path):
-            return False
-        if os.stat(path).st_size == 0:
-            return False
-        markers = [BLOCK_START, VAR_START, COMMENT_START]
-        patterns = [re.compile(marker.encode()) for marker in markers]
-        try:
-            with io.open(path, "r", encoding="utf-8") as file:
-                mapf = mmap.mmap(file.fileno(), 0,
-                                 access=mmap.ACCESS_READ)
-                for pattern in patterns:
-                    if pattern.search(mapf):
-                        return True
-        except UnicodeDecodeError:
-            # is binary so surely no template
-            return False
-        return False
+        return file_has_markers(path, debug=debug)
 
     def _debug_dict(self, title, elems):
         """pretty print dict"""
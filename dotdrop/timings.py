@@ -0,0 +1,108 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+per-phase timings reported when DOTDROP_TIMINGS is set
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+ENV_TIMINGS = 'DOTDROP_TIMINGS'
+ENABLED = ENV_TIMINGS in os.environ
+
+# phase path (tuple of names) -> [total ns, count]
+_PHASES = {}
+# phase path -> order of first entry
+_ORDER = {}
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_MAIN_STACK = []
+_NULL = nullcontext()
+
+
+def phase(name):
+    """
+    time the enclosed block as the phase "name",
+    nested phases are reported as children
+    """
+    if not ENABLED:
+        return _NULL
+    return _timed(name)
+
+
+def wrap(name, func):
+    """return func timed as the phase "name" when called"""
+    if not ENABLED:
+        return func
+
+    def wrapper(*args, **kwargs):
+        with _timed(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def _timed(name):
+    """record the time spent in phase name"""
+    stack = _get_stack()
+    stack.append(name)
+    path = tuple(stack)
+    with _LOCK:
+        _ORDER.setdefault(path, len(_ORDER))
+    start = time.monotonic_ns()
+    try:
+        yield
+    finally:
+        took = time.monotonic_ns() - start
+        stack.pop()
+        with _LOCK:
+            entry = _PHASES.setdefault(path, [0, 0])
+            entry[0] += took
+            entry[1] += 1
+
+
+def _get_stack():
+    """return the stack of phases of the current thread"""
+    if threading.current_thread() is threading.main_thread():
+        return _MAIN_STACK
+    stack = getattr(_LOCAL, 'stack', None)
+    if stack is None:
+        # workers nest under the phase the main thread is in
+        stack = list(_MAIN_STACK)
+        _LOCAL.stack = stack
+    return stack
+
+
+def report(file=None):
+    """print the timings to file (stderr by default)"""
+    if not ENABLED:
+        return
+    file = file or sys.stderr
+    with _LOCK:
+        phases = dict(_PHASES)
+        order = dict(_ORDER)
+
+    def sortkey(path):
+        return [order[path[:i + 1]] for i in range(len(path))]
+
+    lines = ['timings:']
+    for path in sorted(phases, key=sortkey):
+        total, count = phases[path]
+        indent = '  ' * len(path)
+        line = f'{indent}{path[-1]}: {total / 1000000:.1f}ms'
+        if count > 1:
+            line += f' ({count} times)'
+        lines.append(line)
+    file.write('\n'.join(lines) + '\n')
+
+
+def clear():
+    """forget all recorded timings"""
+    with _LOCK:
+        _PHASES.clear()
+        _ORDER.clear()
@@ -28,7 +28,7 @@ class Updater:
     def __init__(self, dotpath, variables, conf,
                  profile_key, dry=False, safe=True,
                  debug=False, ignore=None, showpatch=False,
-                 ignore_missing_in_dotdrop=False):
+                 ignore_missing_in_dotdrop=False, templater=None):
         """constructor
         @dotpath: path where dotfiles are stored
         @variables: dictionary of variables for the templates
@@ -39,6 +39,7 @@ class Updater:
         @debug: enable debug
         @ignore: pattern to ignore when updating
         @showpatch: show patch if dotfile to update is a template
+        @templater: the templater to use (created if None)
         """
         self.dotpath = dotpath
         self.variables = variables
@@ -50,11 +51,11 @@ class Updater:
         self.ignore = ignore or []
         self.showpatch = showpatch
         self.ignore_missing_in_dotdrop = ignore_missing_in_dotdrop
-        self.templater = Templategen(variables=self.variables,
-                                     base=self.dotpath,
-                                     debug=self.debug)
-        # save template vars
-        self.tvars = self.templater.add_tmp_vars()
+        self.templater = templater
+        if not self.templater:
+            self.templater = Templategen(variables=self.variables,
+                                         base=self.dotpath,
+                                         debug=self.debug)
         self.log = Logger(debug=self.debug)
 
     def update_path(self, path):
@@ -162,10 +163,9 @@ class Updater:
             return path
         self.log.dbg(f'executing write transformation {trans}')
         tmp = get_unique_tmp_name()
-        self.templater.restore_vars(self.tvars)
         newvars = dotfile.get_dotfile_variables()
-        self.templater.add_tmp_vars(newvars=newvars)
-        if not trans.transform(path, tmp, templater=self.templater,
+        templater = self.templater.overlay(newvars)
+        if not trans.transform(path, tmp, templater=templater,
                                debug=self.debug):
             if os.path.exists(tmp):
                 # ignore error
@@ -195,7 +195,6 @@ class Updater:
 
     def _resolve_template(self, tpath):
         """resolve the template to a temporary file"""
-        self.templater.restore_vars(self.tvars)
         return self.templater.generate(tpath)
 
     def _same_rights(self, left, right):
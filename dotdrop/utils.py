@@ -11,15 +11,15 @@ import os
 import uuid
 import fnmatch
 import inspect
-import importlib
+import importlib.machinery
+import importlib.util
 import filecmp
 import itertools
 import shutil
 import json
 import sys
+import threading
 from pathlib import PurePath
-import requests
-from packaging import version
 
 # local import
 from dotdrop.logger import Logger
@@ -33,6 +33,16 @@ ENV_TEMP = 'DOTDROP_TMPDIR'
 # the temporary directory
 TMPDIR = None
 
+# modules loaded by get_module_from_path
+MODULES = {}
+MODULES_LOCK = threading.Lock()
+
+# copy method -> [files, bytes] (see copy_file)
+COPY_STATS = {}
+COPY_STATS_LOCK = threading.Lock()
+# ioctl cloning a file on linux (reflink)
+FICLONE = 0x40049409
+
 # files dotdrop refuses to remove
 DONOTDELETE = [
     os.path.expanduser('~'),
@@ -64,6 +74,85 @@ def write_to_tmpfile(content):
     return path
 
 
+def copy_file(src, dst):
+    """
+    copy the content of src to dst (no meta) without
+    reading it in python: reflink, copy_file_range
+    or sendfile with a fallback to read/write
+    returns the method used
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        method = _copy_fds(fsrc.fileno(), fdst.fileno(), size)
+        if not method:
+            os.lseek(fsrc.fileno(), 0, os.SEEK_SET)
+            shutil.copyfileobj(fsrc, fdst)
+            method = 'read/write'
+            size = fdst.tell()
+    count_copy(method, size)
+    return method
+
+
+def _copy_fds(infd, outfd, size):
+    """
+    copy size bytes between the file descriptors
+    in the kernel, returns the method used or
+    None if none is supported
+    """
+    if not size:
+        # empty or size unknown (procfs, some fuse filesystems)
+        return None
+    if sys.platform.startswith('linux'):
+        try:
+            # pylint: disable=C0415
+            import fcntl
+            fcntl.ioctl(outfd, FICLONE, infd)
+            return 'reflink'
+        except OSError:
+            # not supported by the filesystem
+            pass
+    calls = []
+    if hasattr(os, 'copy_file_range'):
+        calls.append(('copy_file_range',
+                      lambda count: os.copy_file_range(infd, outfd, count)))
+    if hasattr(os, 'sendfile'):
+        calls.append(('sendfile',
+                      lambda count: os.sendfile(outfd, infd, None, count)))
+    for method, call in calls:
+        copied = 0
+        try:
+            while copied < size:
+                sent = call(size - copied)
+                if not sent:
+                    # not supported or file truncated
+                    break
+                copied += sent
+        except OSError:
+            # not supported between these files
+            pass
+        if copied == size:
+            return method
+        # start over
+        os.lseek(infd, 0, os.SEEK_SET)
+        os.lseek(outfd, 0, os.SEEK_SET)
+        os.ftruncate(outfd, 0)
+    return None
+
+
+def count_copy(method, size):
+    """account size bytes moved with method"""
+    with COPY_STATS_LOCK:
+        entry = COPY_STATS.setdefault(method, [0, 0])
+        entry[0] += 1
+        entry[1] += size
+
+
+def copy_stats():
+    """return the dict method: (files, bytes) of the copies"""
+    with COPY_STATS_LOCK:
+        return {method: tuple(entry) for method, entry in COPY_STATS.items()}
+
+
 def shellrun(cmd, debug=False):
     """
     run a command in the shell (expects a string)
@@ -437,16 +526,22 @@ def get_module_functions(mod):
 
 
 def get_module_from_path(path):
-    """get module from path"""
+    """get module from path, each path is only loaded once"""
     if not path or not os.path.exists(path):
         return None
-    module_name = os.path.basename(path).rstrip('.py')
-    # allow any type of files
-    importlib.machinery.SOURCE_SUFFIXES.append('')
-    # import module
-    spec = importlib.util.spec_from_file_location(module_name, path)
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
+    path = os.path.abspath(path)
+    with MODULES_LOCK:
+        if path in MODULES:
+            return MODULES[path]
+        module_name = os.path.basename(path).rstrip('.py')
+        # allow any type of files
+        loader = importlib.machinery.SourceFileLoader(module_name, path)
+        # import module
+        spec = importlib.util.spec_from_file_location(module_name, path,
+                                                      loader=loader)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        MODULES[path] = mod
     return mod
 
 
@@ -461,76 +556,26 @@ def dependencies_met():
             err = f'The tool \"{dep}\" was not found in the PATH!'
             raise UnmetDependency(err)
 
-    # check python deps
-# pylint: disable=C0415
+    # check python deps without importing them,
+    # they are only imported when needed
+    required = ['docopt', 'jinja2', 'ruamel.yaml', 'tomli_w', 'distro']
+    if sys.version_info < (3, 11):
+        required.append('tomli')
+    for name in required:
+        if not _module_exists(name):
+            raise UnmetDependency(f'missing python module \"{name}\"')
 
-    # python-magic
-    name = 'python-magic'
-    err = f'missing python module \"{name}\"'
-    try:
-        import magic
-        assert magic
-        if not hasattr(magic, 'from_file'):
-            LOG.warn(err)
-    except ImportError:
-        LOG.warn(err)
-
-    # docopt
-    name = 'docopt'
-    err = f'missing python module \"{name}\"'
-    try:
-        from docopt import docopt
-        assert docopt
-    except ImportError as exc:
-        raise UnmetDependency(err) from exc
-
-    # jinja2
-    name = 'jinja2'
-    err = f'missing python module \"{name}\"'
-    try:
-        import jinja2
-        assert jinja2
-    except ImportError as exc:
-        raise UnmetDependency(err) from exc
-
-    # ruamel.yaml
-    name = 'ruamel.yaml'
-    err = f'missing python module \"{name}\"'
-    try:
-        from ruamel.yaml import YAML
-        assert YAML
-    except ImportError as exc:
-        raise UnmetDependency(err) from exc
+    # python-magic is optional
+    if not _module_exists('magic'):
+        LOG.warn('missing python module \"python-magic\"')
 
-    # tomli
-    if sys.version_info < (3, 11):
-        name = 'tomli'
-        err = f'missing python module \"{name}\"'
-        try:
-            import tomli
-            assert tomli
-        except ImportError as exc:
-            raise UnmetDependency(err) from exc
-
-    # tomli_w
-    name = 'tomli_w'
-    err = f'missing python module \"{name}\"'
-    try:
-        import tomli_w
-        assert tomli_w
-    except ImportError as exc:
-        raise UnmetDependency(err) from exc
-
-    # distro
-    name = 'distro'
-    err = f'missing python module \"{name}\"'
-    try:
-        import distro
-        assert distro
-    except ImportError as exc:
-        raise UnmetDependency(err) from exc
 
-# pylint: enable=C0415
+def _module_exists(name):
+    """return True if module name can be imported"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
 
 
 def mirror_file_rights(src, dst):
@@ -620,6 +665,11 @@ def check_version():
     compare with "version"
     and emit warning in case new version is available
     """
+    # only needed here and slow to import
+    # pylint: disable=C0415
+    import requests
+    from packaging import version
+
     url = 'https://api.github.com/repos/deadc0de6/dotdrop/releases/latest'
     try:
         req = requests.get(url, timeout=1)
@@ -0,0 +1,92 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+what dotdrop keeps in its workdir: the templates
+installed there and the caches of the templater
+"""
+
+import os
+import fnmatch
+
+# local imports
+from dotdrop.logger import Logger
+from dotdrop.templategen import Templategen, TEMPLATES, DEPENDENCIES
+from dotdrop.linktypes import LinkTypes
+from dotdrop.cache import get_cache_path, get_workdir_files
+from dotdrop.utils import pivot_path, copy_stats
+
+
+LOG = Logger()
+
+
+def get_templater(opts):
+    """get an templater instance"""
+    bytecode_dir = None
+    if opts.template_bytecode_cache:
+        bytecode_dir = get_cache_path(opts.workdir,
+                                      Templategen.BYTECODE_NAME)
+    templ = Templategen(base=opts.dotpath, variables=opts.variables,
+                        func_file=opts.func_file, filter_file=opts.filter_file,
+                        bytecode_dir=bytecode_dir, debug=opts.debug)
+    return templ
+
+
+def load_caches(opts):
+    """load the template caches of the workdir"""
+    # template status of the dotpath files
+    TEMPLATES.load(opts.workdir, max_size=opts.template_max_size,
+                   debug=opts.debug)
+    if opts.template_incremental or opts.cmd_explain:
+        DEPENDENCIES.load(opts.workdir, debug=opts.debug)
+
+
+def save_caches(opts):
+    """save the template caches of the workdir"""
+    hits, misses = Templategen.cache_stats()
+    LOG.dbg(f'compiled templates cache: {hits} hit(s), {misses} miss(es)')
+    TEMPLATES.save(debug=opts.debug)
+    LOG.dbg(f'template index: {TEMPLATES.reads} file(s) read')
+    DEPENDENCIES.save(debug=opts.debug)
+    LOG.dbg(f'template dependencies: {DEPENDENCIES.skipped} up to date')
+    for method, (files, size) in sorted(copy_stats().items()):
+        LOG.dbg(f'written with {method}: {files} file(s), {size} byte(s)')
+
+
+def workdir_enum(opts):
+    """
+    log the files of the workdir not installed by
+    the dotfiles and return their number
+    """
+    # dotdrop caches are ignored
+    workdir_files = get_workdir_files(opts.workdir)
+
+    for dotfile in opts.dotfiles:
+        src = os.path.join(opts.dotpath, dotfile.src)
+        if dotfile.link == LinkTypes.NOLINK:
+            # ignore not link files
+            continue
+        if not Templategen.path_is_template(src):
+            # ignore not template
+            continue
+        newpath = pivot_path(dotfile.dst, opts.workdir,
+                             striphome=True, logger=None)
+        if os.path.isdir(newpath):
+            # recursive
+            pattern = f'{newpath}/*'
+            files = workdir_files.copy()
+            for file in files:
+                if fnmatch.fnmatch(file, pattern):
+                    workdir_files.remove(file)
+            # only checks children
+            children = [f.path for f in os.scandir(newpath)]
+            for child in children:
+                if child in workdir_files:
+                    workdir_files.remove(child)
+        else:
+            if newpath in workdir_files:
+                workdir_files.remove(newpath)
+    for wfile in workdir_files:
+        line = f'=> \"{wfile}\" does not exist in dotdrop'
+        LOG.log(line)
+    return len(workdir_files)
@@ -0,0 +1,126 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+write installed files atomically: templates are
+rendered to a temporary file moved over the destination
+"""
+
+import os
+import uuid
+from stat import S_IMODE
+
+# local imports
+from dotdrop.logger import Logger
+from dotdrop.utils import get_tmpdir, removepath, copy_file, count_copy
+
+
+LOG = Logger()
+
+
+def write_stream(chunks, file, compare=None):
+    """
+    write the chunks of bytes to the file object
+    while comparing them to the content of the file
+    at path compare (if any)
+    returns True if compare has a different content
+    """
+    other = None
+    differs = True
+    if compare:
+        try:
+            # pylint: disable=R1732
+            other = open(compare, 'rb')
+            differs = False
+        except OSError:
+            other = None
+    try:
+        for chunk in chunks:
+            file.write(chunk)
+            if not differs and other.read(len(chunk)) != chunk:
+                differs = True
+        if not differs and other.read(1):
+            # compare is longer
+            differs = True
+    finally:
+        if other:
+            other.close()
+    return differs
+
+
+def get_write_target(dst):
+    """symlinks are written through, as when opening them"""
+    if os.path.islink(dst):
+        return os.path.realpath(dst)
+    return dst
+
+
+def replace_file(path, dst):
+    """
+    atomically replace dst (or the file it links to)
+    with the file path, keeping the rights of dst
+    returns <success, error>
+    """
+    target = get_write_target(dst)
+    try:
+        if os.path.exists(target):
+            stat = os.stat(target)
+            os.chmod(path, S_IMODE(stat.st_mode))
+            try:
+                os.chown(path, stat.st_uid, stat.st_gid)
+            except OSError:
+                # not allowed
+                pass
+        size = os.path.getsize(path)
+        os.replace(path, target)
+        count_copy('rename', size)
+        return True, None
+    except OSError:
+        # different filesystem or directory not writable
+        pass
+    try:
+        # do NOT copy meta here
+        copy_file(path, target)
+    except NotADirectoryError as exc:
+        return False, f'opening dest file: {exc}'
+    except OSError as exc:
+        return False, str(exc)
+    return True, None
+
+
+def render_to_tmp(templater, src, dst, compare=None,
+                  dry=False, debug=False):
+    """
+    render the template src to a temporary file next to dst
+    and compare it on the fly with the existing dst
+    (or compare if defined)
+    returns <temporary file, content differs>
+    may raise UndefinedException or OSError
+    """
+    target = get_write_target(dst)
+    name = f'.{os.path.basename(target)}.dotdrop-{uuid.uuid4().hex}'
+    parent = os.path.dirname(target)
+    # same rights as for a file created by open
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    fdesc = None
+    tmp = os.path.join(parent, name)
+    if not dry:
+        try:
+            fdesc = os.open(tmp, flags, 0o666)
+        except OSError:
+            # no parent (yet) or not writable
+            fdesc = None
+    if fdesc is None:
+        tmp = os.path.join(get_tmpdir(), name)
+        fdesc = os.open(tmp, flags, 0o666)
+    try:
+        with os.fdopen(fdesc, 'wb') as file:
+            compare = get_write_target(compare or dst)
+            differs = write_stream(templater.generate_stream(src),
+                                   file, compare=compare)
+    except BaseException:
+        removepath(tmp, logger=LOG)
+        raise
+    if debug:
+        LOG.dbg(f'rendered {src} to {tmp} (differs: {differs})', force=True)
+    return tmp, differs
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+benchmark scanning a mixed dotpath of text
+and binary files for templating markers
+"""
+
+import io
+import os
+import re
+import sys
+import mmap
+import random
+import tempfile
+import shutil
+
+from benchutils import best_of
+
+# pylint: disable=C0413
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dotdrop.templategen import file_has_markers  # noqa: E402
+
+FILES = 2000
+SIZE = 64 * 1024
+RUNS = 3
+MARKERS = ['{%@@', '{{@@', '{#@@']
+
+
+def create_dotpath(path, nbfiles, size):
+    """
+    create nbfiles files in path, a third each of
+    plain text, text templates with their marker
+    at the end and binary files
+    """
+    rnd = random.Random(0)
+    line = b'export SOMEVARIABLE="some value" # comment\n'
+    text = line * (size // len(line))
+    for i in range(nbfiles):
+        kind = i % 3
+        if kind == 0:
+            content = text
+        elif kind == 1:
+            content = text + MARKERS[i % len(MARKERS)].encode() + b'@@}}\n'
+        else:
+            content = rnd.randbytes(size)
+        sub = os.path.join(path, f'dir{i % 20}')
+        os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f'file{i}'), 'wb') as file:
+            file.write(content)
+
+
+def old_is_template(path):
+    """the previous implementation (one search per marker)"""
+    if not os.path.isfile(path):
+        return False
+    if os.stat(path).st_size == 0:
+        return False
+    patterns = [re.compile(marker.encode()) for marker in MARKERS]
+    try:
+        with io.open(path, 'r', encoding='utf-8') as file:
+            mapf = mmap.mmap(file.fileno(), 0,
+                             access=mmap.ACCESS_READ)
+            for pattern in patterns:
+                if pattern.search(mapf):
+                    return True
+    except UnicodeDecodeError:
+        return False
+    return False
+
+
+def scan(paths, func):
+    """return the number of templates in paths"""
+    return sum(1 for path in paths if func(path))
+
+
+def main():
+    """entry point"""
+    nbfiles = FILES
+    if len(sys.argv) > 1:
+        nbfiles = int(sys.argv[1])
+    tmp = tempfile.mkdtemp()
+    try:
+        create_dotpath(tmp, nbfiles, SIZE)
+        paths = [os.path.join(root, name)
+                 for root, _, files in os.walk(tmp)
+                 for name in files]
+        print(f'{len(paths)} files of {SIZE // 1024}KiB '
+              f'(text, templates, binary) ({RUNS} runs, best)')
+
+        old = scan(paths, old_is_template)
+        new = scan(paths, file_has_markers)
+        print(f'templates found: old {old}, new {new}')
+        otime = best_of(lambda: scan(paths, old_is_template), RUNS)
+        ntime = best_of(lambda: scan(paths, file_has_markers), RUNS)
+        print(f'one search per marker: {otime:.3f}s')
+        print(f'single pass:           {ntime:.3f}s ({otime / ntime:.1f}x)')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
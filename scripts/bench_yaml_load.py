@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+benchmark loading a large config with the
+round-trip and the safe yaml loaders
+and the peak memory used to parse it
+"""
+
+import os
+import sys
+import tempfile
+import shutil
+
+from benchutils import best_of, peak_memory
+
+# pylint: disable=C0413
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dotdrop.cfg_yaml import CfgYaml  # noqa: E402
+
+DOTFILES = 5000
+PROFILES = 50
+IMPORTS = 10
+RUNS = 3
+
+
+def create_config(path, nbdotfiles, nbprofiles, imports=None, prefix=''):
+    """create a config with nbdotfiles dotfiles"""
+    with open(path, 'w', encoding='utf8') as file:
+        file.write('config:\n')
+        file.write('  backup: true\n')
+        file.write('  create: true\n')
+        file.write('  dotpath: dotfiles\n')
+        if imports:
+            file.write('  import_configs:\n')
+            for imp in imports:
+                file.write(f'  - {imp}\n')
+        file.write('dotfiles:\n')
+        for i in range(nbdotfiles):
+            file.write(f'  # dotfile {i}\n')
+            file.write(f'  f_{prefix}file{i}:\n')
+            file.write(f'    src: dir{i % 100}/file{i}\n')
+            file.write(f'    dst: ~/dir{i % 100}/file{i}\n')
+            if i % 10 == 0:
+                file.write('    link: absolute\n')
+        file.write('profiles:\n')
+        for i in range(nbprofiles):
+            file.write(f'  p{i}:\n')
+            file.write('    dotfiles:\n')
+            for j in range(i, nbdotfiles, nbprofiles):
+                file.write(f'    - f_{prefix}file{j}\n')
+
+
+def create_imports(tmp, nbdotfiles, nbimports):
+    """create nbimports configs splitting nbdotfiles between them"""
+    paths = []
+    for i in range(nbimports):
+        path = os.path.join(tmp, f'import{i}.yaml')
+        create_config(path, nbdotfiles // nbimports, PROFILES,
+                      prefix=f'i{i}')
+        paths.append(path)
+    return paths
+
+
+def main():
+    """entry point"""
+    nbdotfiles = DOTFILES
+    if len(sys.argv) > 1:
+        nbdotfiles = int(sys.argv[1])
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'config.yaml')
+        create_config(path, nbdotfiles, PROFILES)
+        print(f'config with {nbdotfiles} dotfiles ({RUNS} runs, best)')
+
+        # pylint: disable=W0212
+        rtime = best_of(lambda: CfgYaml._yaml_load(path, roundtrip=True),
+                        RUNS)
+        stime = best_of(lambda: CfgYaml._yaml_load(path, roundtrip=False),
+                        RUNS)
+        print(f'load round-trip: {rtime:.3f}s')
+        print(f'load safe:       {stime:.3f}s ({rtime / stime:.1f}x)')
+
+        ptime = best_of(lambda: CfgYaml(path, profile='p0'), RUNS)
+        print(f'full parse (profile p0): {ptime:.3f}s')
+        peak = peak_memory(lambda: CfgYaml(path, profile='p0'))
+        print(f'full parse peak memory: {peak / 1024 / 1024:.1f}MiB')
+
+        # same amount of dotfiles spread over imported configs
+        imports = create_imports(tmp, nbdotfiles, IMPORTS)
+        path = os.path.join(tmp, 'config-imports.yaml')
+        create_config(path, 0, PROFILES, imports=imports)
+        print(f'with {IMPORTS} imported configs')
+        ptime = best_of(lambda: CfgYaml(path, profile='p0'), RUNS)
+        print(f'full parse (profile p0): {ptime:.3f}s')
+        peak = peak_memory(lambda: CfgYaml(path, profile='p0'))
+        print(f'full parse peak memory: {peak / 1024 / 1024:.1f}MiB')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
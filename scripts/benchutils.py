@@ -0,0 +1,32 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+
+helpers shared by the benchmark scripts
+"""
+
+import time
+import tracemalloc
+
+
+def best_of(func, runs):
+    """return the best time of runs calls to func"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        took = time.perf_counter() - start
+        if best is None or took < best:
+            best = took
+    return best
+
+
+def peak_memory(func):
+    """return the peak memory in bytes allocated by func"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
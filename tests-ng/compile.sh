@@ -0,0 +1,107 @@
+#!/usr/bin/env bash
+# author: deadc0de6 (https://github.com/deadc0de6)
+# Copyright (c) 2024, deadc0de6
+#
+# test compiled config snapshots
+# returns 1 in case of error
+#
+## start-cookie
+set -eu -o errtrace -o pipefail
+cur=$(cd "$(dirname "${0}")" && pwd)
+ddpath="${cur}/../"
+PPATH="{PYTHONPATH:-}"
+export PYTHONPATH="${ddpath}:${PPATH}"
+altbin="python3 -m dotdrop.dotdrop"
+if hash coverage 2>/dev/null; then
+  mkdir -p coverages/
+  altbin="coverage run -p --data-file coverages/coverage --source=dotdrop -m dotdrop.dotdrop"
+fi
+bin="${DT_BIN:-${altbin}}"
+# shellcheck source=tests-ng/helpers
+source "${cur}"/helpers
+echo -e "$(tput setaf 6)==> RUNNING $(basename "${BASH_SOURCE[0]}") <==$(tput sgr0)"
+## end-cookie
+
+################################################################
+# this is the test
+################################################################
+
+# the dotfile source
+tmps=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+mkdir -p "${tmps}"/dotfiles
+# the dotfile destination
+tmpd=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+# the workdir
+tmpw=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+export DOTDROP_WORKDIR="${tmpw}"
+
+clear_on_exit "${tmps}"
+clear_on_exit "${tmpd}"
+clear_on_exit "${tmpw}"
+
+# create the config file
+cfg="${tmps}/config.yaml"
+snap="${tmps}/config.snap"
+snapdv="${tmps}/config-dv.snap"
+
+cat > "${cfg}" << _EOF
+config:
+  backup: true
+  create: true
+  dotpath: dotfiles
+variables:
+  var: static
+dynvariables:
+  dvar: cat ${tmps}/value
+dotfiles:
+  f_abc:
+    dst: ${tmpd}/abc
+    src: abc
+  f_def:
+    dst: ${tmpd}/def
+    src: def
+profiles:
+  p1:
+    dotfiles:
+    - f_abc
+  p2:
+    dotfiles:
+    - f_def
+_EOF
+
+echo "{{@@ var @@}}-{{@@ dvar @@}}" > "${tmps}"/dotfiles/abc
+echo "def" > "${tmps}"/dotfiles/def
+echo "compiled" > "${tmps}"/value
+
+# compile with frozen and re-evaluated dynvariables
+cd "${ddpath}" | ${bin} compile -c "${cfg}" -p p1 "${snap}"
+cd "${ddpath}" | ${bin} compile -c "${cfg}" -p p1 -e "${snapdv}"
+[ ! -s "${snap}" ] && echo "snapshot not created" && exit 1
+[ ! -s "${snapdv}" ] && echo "snapshot not created" && exit 1
+
+# the original config is not needed anymore
+mv "${cfg}" "${cfg}.bak"
+echo "target" > "${tmps}"/value
+
+# the snapshot profile is used by default
+cd "${ddpath}" | ${bin} files -c "${snap}" -G | grep '^f_abc'
+cd "${ddpath}" | ${bin} files -c "${snap}" -G | grep '^f_def' && exit 1
+set +e
+cd "${ddpath}" | ${bin} files -c "${snap}" -G -p p2 && exit 1
+set -e
+
+# frozen dynvariables
+cd "${ddpath}" | ${bin} install -f -c "${snap}"
+[ "$(cat "${tmpd}"/abc)" != "static-compiled" ] && echo "bad content" && exit 1
+
+# re-evaluated dynvariables
+cd "${ddpath}" | ${bin} install -f -c "${snapdv}"
+[ "$(cat "${tmpd}"/abc)" != "static-target" ] && echo "bad content" && exit 1
+
+# snapshots cannot be modified
+set +e
+cd "${ddpath}" | ${bin} remove -f -k -c "${snap}" f_abc && exit 1
+set -e
+
+echo "OK"
+exit 0
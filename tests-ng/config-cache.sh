@@ -0,0 +1,133 @@
+#!/usr/bin/env bash
+# author: deadc0de6 (https://github.com/deadc0de6)
+# Copyright (c) 2024, deadc0de6
+#
+# test the parsed config cache
+# returns 1 in case of error
+#
+
+## start-cookie
+set -eu -o errtrace -o pipefail
+cur=$(cd "$(dirname "${0}")" && pwd)
+ddpath="${cur}/../"
+PPATH="{PYTHONPATH:-}"
+export PYTHONPATH="${ddpath}:${PPATH}"
+altbin="python3 -m dotdrop.dotdrop"
+if hash coverage 2>/dev/null; then
+  mkdir -p coverages/
+  altbin="coverage run -p --data-file coverages/coverage --source=dotdrop -m dotdrop.dotdrop"
+fi
+bin="${DT_BIN:-${altbin}}"
+# shellcheck source=tests-ng/helpers
+source "${cur}"/helpers
+echo -e "$(tput setaf 6)==> RUNNING $(basename "${BASH_SOURCE[0]}") <==$(tput sgr0)"
+## end-cookie
+
+################################################################
+# this is the test
+################################################################
+
+# the dotfile source
+tmps=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+mkdir -p "${tmps}"/dotfiles
+# the dotfile destination
+tmpd=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+# the workdir
+tmpw=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+export DOTDROP_WORKDIR="${tmpw}"
+
+clear_on_exit "${tmps}"
+clear_on_exit "${tmpd}"
+clear_on_exit "${tmpw}"
+
+# create the config file
+cfg="${tmps}/config.yaml"
+cfg2="${tmps}/config2.yaml"
+
+cat > "${cfg}" << _EOF
+config:
+  backup: true
+  create: true
+  dotpath: dotfiles
+  cache_config: true
+  import_configs:
+  - ${cfg2}
+dotfiles:
+  f_abc:
+    dst: ${tmpd}/abc
+    src: abc
+profiles:
+  p1:
+    dotfiles:
+    - f_abc
+_EOF
+
+cat > "${cfg2}" << _EOF
+config:
+  dotpath: dotfiles
+dotfiles:
+  f_def:
+    dst: ${tmpd}/def
+    src: def
+profiles:
+  p2:
+    dotfiles:
+    - f_def
+_EOF
+
+echo "abc" > "${tmps}"/dotfiles/abc
+echo "def" > "${tmps}"/dotfiles/def
+
+# first run creates the cache
+cd "${ddpath}" | ${bin} files -c "${cfg}" -G -p p1 | grep '^f_abc'
+cnt=$(find "${tmpw}/.cache" -name 'config-*.json' | wc -l)
+[ "${cnt}" != "1" ] && echo "cache not created" && exit 1
+
+# second run uses the cache
+cd "${ddpath}" | ${bin} files -c "${cfg}" -G -p p1 -V 2>&1 | grep 'cache loaded'
+cd "${ddpath}" | ${bin} files -c "${cfg}" -G -p p2 | grep '^f_def'
+
+# changing an imported config invalidates the cache
+cat >> "${cfg2}" << _EOF
+  p3:
+    dotfiles:
+    - f_def
+_EOF
+cd "${ddpath}" | ${bin} files -c "${cfg}" -G -p p3 | grep '^f_def'
+
+# the cache does not break install
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+[ ! -e "${tmpd}"/abc ] && echo "f_abc not installed" && exit 1
+
+# configs using the environment are not cached
+cfg3="${tmps}/config3.yaml"
+cat > "${cfg3}" << _EOF
+config:
+  dotpath: dotfiles
+  cache_config: true
+variables:
+  v: "{{@@ env['DOTDROP_TEST_CACHE'] @@}}"
+dotfiles:
+  f_abc:
+    dst: ${tmpd}/out-{{@@ v @@}}
+    src: abc
+profiles:
+  p1:
+    dotfiles:
+    - f_abc
+_EOF
+export DOTDROP_TEST_CACHE="aaa"
+cd "${ddpath}" | ${bin} files -c "${cfg3}" -p p1 | grep 'out-aaa'
+export DOTDROP_TEST_CACHE="bbb"
+cd "${ddpath}" | ${bin} files -c "${cfg3}" -p p1 | grep 'out-bbb'
+
+# disabling the option removes the cache
+sed -i 's/cache_config: true/cache_config: false/' "${cfg}"
+for p in p1 p2 p3; do
+  cd "${ddpath}" | ${bin} files -c "${cfg}" -G -p "${p}"
+done
+cnt=$(find "${tmpw}/.cache" -name 'config-*.json' | wc -l)
+[ "${cnt}" != "0" ] && echo "cache not removed" && exit 1
+
+echo "OK"
+exit 0
@@ -0,0 +1,108 @@
+#!/usr/bin/env bash
+# author: deadc0de6 (https://github.com/deadc0de6)
+# Copyright (c) 2024, deadc0de6
+#
+# test dynvariables caching (in-run and ttl)
+# returns 1 in case of error
+#
+
+## start-cookie
+set -eu -o errtrace -o pipefail
+cur=$(cd "$(dirname "${0}")" && pwd)
+ddpath="${cur}/../"
+PPATH="{PYTHONPATH:-}"
+export PYTHONPATH="${ddpath}:${PPATH}"
+altbin="python3 -m dotdrop.dotdrop"
+if hash coverage 2>/dev/null; then
+  mkdir -p coverages/
+  altbin="coverage run -p --data-file coverages/coverage --source=dotdrop -m dotdrop.dotdrop"
+fi
+bin="${DT_BIN:-${altbin}}"
+# shellcheck source=tests-ng/helpers
+source "${cur}"/helpers
+echo -e "$(tput setaf 6)==> RUNNING $(basename "${BASH_SOURCE[0]}") <==$(tput sgr0)"
+## end-cookie
+
+################################################################
+# this is the test
+################################################################
+
+# the dotfile source
+tmps=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+mkdir -p "${tmps}"/dotfiles
+# the dotfile destination
+tmpd=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+# the workdir
+tmpw=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+export DOTDROP_WORKDIR="${tmpw}"
+
+clear_on_exit "${tmps}"
+clear_on_exit "${tmpd}"
+clear_on_exit "${tmpw}"
+
+# counts the executions
+cnt="${tmps}/count"
+
+# create the config file
+cfg="${tmps}/config.yaml"
+cfg2="${tmps}/config2.yaml"
+
+cat > "${cfg}" << _EOF
+config:
+  backup: true
+  create: true
+  dotpath: dotfiles
+  import_configs:
+  - ${cfg2}
+dynvariables:
+  dvar1: "echo run >> ${cnt}; echo dvar1"
+  dvar2:
+    cmd: "echo run >> ${cnt}; echo dvar2"
+    ttl: 3600
+dotfiles:
+  f_abc:
+    dst: ${tmpd}/abc
+    src: abc
+profiles:
+  p1:
+    dynvariables:
+      pdvar1: "echo run >> ${cnt}; echo dvar1"
+    dotfiles:
+    - f_abc
+_EOF
+
+cat > "${cfg2}" << _EOF
+config:
+  dotpath: dotfiles
+dynvariables:
+  subdvar1: "echo run >> ${cnt}; echo dvar1"
+dotfiles:
+profiles:
+_EOF
+
+echo "{{@@ dvar1 @@}}-{{@@ dvar2 @@}}-{{@@ pdvar1 @@}}" > "${tmps}"/dotfiles/abc
+
+# identical commands are run once per run
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1 -V
+grep '^dvar1-dvar2-dvar1$' "${tmpd}"/abc
+nb=$(wc -l < "${cnt}")
+[ "${nb}" != "2" ] && echo "dynvariables ran ${nb} times (expected 2)" && exit 1
+[ ! -s "${tmpw}"/.cache/dynvariables.json ] && echo "ttl not persisted" && exit 1
+
+# dvar2 is persisted
+rm -f "${cnt}" "${tmpd}"/abc
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1 -V
+grep '^dvar1-dvar2-dvar1$' "${tmpd}"/abc
+nb=$(wc -l < "${cnt}")
+[ "${nb}" != "1" ] && echo "dynvariables ran ${nb} times (expected 1)" && exit 1
+
+# changing the command invalidates the persisted output
+sed -i 's/echo dvar2/echo newdvar2/' "${cfg}"
+rm -f "${cnt}" "${tmpd}"/abc
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1 -V
+grep '^dvar1-newdvar2-dvar1$' "${tmpd}"/abc
+nb=$(wc -l < "${cnt}")
+[ "${nb}" != "2" ] && echo "dynvariables ran ${nb} times (expected 2)" && exit 1
+
+echo "OK"
+exit 0
@@ -0,0 +1,125 @@
+#!/usr/bin/env bash
+# author: deadc0de6 (https://github.com/deadc0de6)
+# Copyright (c) 2024, deadc0de6
+#
+# test incremental rendering of templates
+# returns 1 in case of error
+#
+## start-cookie
+set -eu -o errtrace -o pipefail
+cur=$(cd "$(dirname "${0}")" && pwd)
+ddpath="${cur}/../"
+PPATH="{PYTHONPATH:-}"
+export PYTHONPATH="${ddpath}:${PPATH}"
+altbin="python3 -m dotdrop.dotdrop"
+if hash coverage 2>/dev/null; then
+  mkdir -p coverages/
+  altbin="coverage run -p --data-file coverages/coverage --source=dotdrop -m dotdrop.dotdrop"
+fi
+bin="${DT_BIN:-${altbin}}"
+# shellcheck source=tests-ng/helpers
+source "${cur}"/helpers
+echo -e "$(tput setaf 6)==> RUNNING $(basename "${BASH_SOURCE[0]}") <==$(tput sgr0)"
+## end-cookie
+
+################################################################
+# this is the test
+################################################################
+
+# the dotfile source
+tmps=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+mkdir -p "${tmps}"/dotfiles
+# the dotfile destination
+tmpd=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+# the workdir
+tmpw=$(mktemp -d --suffix='-dotdrop-tests' || mktemp -d)
+export DOTDROP_WORKDIR="${tmpw}"
+
+clear_on_exit "${tmps}"
+clear_on_exit "${tmpd}"
+clear_on_exit "${tmpw}"
+
+# create the config file
+cfg="${tmps}/config.yaml"
+
+cat > "${cfg}" << _EOF
+config:
+  backup: false
+  create: true
+  dotpath: dotfiles
+  template_incremental: true
+variables:
+  var: first
+dotfiles:
+  f_abc:
+    dst: ${tmpd}/abc
+    src: abc
+  d_dir:
+    dst: ${tmpd}/dir
+    src: dir
+  f_exists:
+    dst: ${tmpd}/exists
+    src: exists
+profiles:
+  p1:
+    dotfiles:
+    - f_abc
+    - d_dir
+    - f_exists
+_EOF
+
+export DOTDROP_TEST_VALUE="env1"
+echo "{{@@ var @@}}-{{@@ env['DOTDROP_TEST_VALUE'] @@}}" > "${tmps}"/dotfiles/abc
+echo "{%@@ include 'inc' @@%}" >> "${tmps}"/dotfiles/abc
+echo "included" > "${tmps}"/dotfiles/inc
+mkdir -p "${tmps}"/dotfiles/dir
+echo "{{@@ var | upper @@}}" > "${tmps}"/dotfiles/dir/sub
+echo "{{@@ exists('/') @@}}" > "${tmps}"/dotfiles/exists
+
+# never rendered
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 | grep 'never rendered'
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+[ "$(head -1 "${tmpd}"/abc)" != "first-env1" ] && echo "bad content" && exit 1
+
+# nothing changed
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 f_abc d_dir > "${tmps}"/out
+cat "${tmps}"/out
+[ "$(grep -c 'up to date' "${tmps}"/out)" != "2" ] && echo "not up to date" && exit 1
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 f_exists | grep 'uses function "exists"'
+cd "${ddpath}" | ${bin} compare -c "${cfg}" -p p1
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1 | grep '^0 dotfile(s) installed'
+
+# variable changed
+sed -i 's/var: first/var: second/' "${cfg}"
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 f_abc | grep 'variable "var" changed'
+set +e
+cd "${ddpath}" | ${bin} compare -c "${cfg}" -p p1 && echo "compare should fail" && exit 1
+set -e
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+[ "$(head -1 "${tmpd}"/abc)" != "second-env1" ] && echo "bad content" && exit 1
+[ "$(cat "${tmpd}"/dir/sub)" != "SECOND" ] && echo "bad content" && exit 1
+
+# environment variable changed
+export DOTDROP_TEST_VALUE="env2"
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 f_abc | grep 'variable "env.DOTDROP_TEST_VALUE" changed'
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+[ "$(head -1 "${tmpd}"/abc)" != "second-env2" ] && echo "bad content" && exit 1
+
+# included template changed
+echo "modified" > "${tmps}"/dotfiles/inc
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 f_abc | grep 'inc" modified'
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+grep '^modified$' "${tmpd}"/abc
+
+# destination changed
+echo "local" > "${tmpd}"/dir/sub
+cd "${ddpath}" | ${bin} explain -c "${cfg}" -p p1 d_dir | grep 'destination modified'
+set +e
+cd "${ddpath}" | ${bin} compare -c "${cfg}" -p p1 && echo "compare should fail" && exit 1
+set -e
+cd "${ddpath}" | ${bin} install -f -c "${cfg}" -p p1
+[ "$(cat "${tmpd}"/dir/sub)" != "SECOND" ] && echo "bad content" && exit 1
+cd "${ddpath}" | ${bin} compare -c "${cfg}" -p p1
+
+echo "OK"
+exit 0
@@ -146,6 +146,8 @@ def _fake_args():
     args['--transr'] = ''
     args['--remove-existing'] = False
     args['--dkey'] = ''
+    args['--eval-dynvars'] = False
+    args['<snapshot>'] = None
     # cmds
     args['profiles'] = False
     args['files'] = False
@@ -156,6 +158,8 @@ def _fake_args():
     args['update'] = False
     args['detail'] = False
     args['remove'] = False
+    args['compile'] = False
+    args['explain'] = False
     args['gencfg'] = False
     return args
 
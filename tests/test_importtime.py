@@ -0,0 +1,151 @@
+"""
+author: deadc0de6 (https://github.com/deadc0de6)
+Copyright (c) 2024, deadc0de6
+startup-time regression tests
+"""
+
+import os
+import sys
+import unittest
+import subprocess
+from dotdrop.cache import BOOT_ID_PATH
+from tests.helpers import get_tempdir, clean
+
+# modules only needed by some commands
+HEAVY = ['requests', 'packaging', 'jinja2']
+# wall-clock budgets depend on the host load,
+# they are only checked when this is set
+ENV_IMPORTTIME = 'DOTDROP_TEST_IMPORTTIME'
+# budget (in microseconds) for importing dotdrop per command,
+# the best of RUNS is measured about 90ms for files and profiles
+# and 105ms for detail, a margin is left for slower hosts
+BUDGETS = {
+    'files': 230000,
+    'profiles': 230000,
+    'detail': 260000,
+}
+RUNS = 3
+
+CONFIG = """config:
+  backup: true
+  create: true
+  dotpath: dotfiles
+dotfiles:
+  f_abc:
+    src: abc
+    dst: ~/.abc
+profiles:
+  p1:
+    dotfiles:
+    - f_abc
+"""
+
+
+def importtime(args, cwd, workdir=None):
+    """
+    run dotdrop with -X importtime
+    returns the dict module: cumulative time in us
+    and the total time spent importing dotdrop modules
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = os.environ.copy()
+    env['PYTHONPATH'] = root
+    if workdir:
+        env['DOTDROP_WORKDIR'] = workdir
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'dotdrop.dotdrop']
+    cmd.extend(args)
+    proc = subprocess.run(cmd, cwd=cwd, env=env, check=False,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    mods = {}
+    total = 0
+    for line in proc.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2]
+        mods[name.strip()] = cumulative
+        if name.startswith(' dotdrop.'):
+            # top-level import from dotdrop's entry point
+            total += cumulative
+    return mods, total
+
+
+class TestImportTime(unittest.TestCase):
+    """test case"""
+
+    def _setup(self):
+        """create a config and return <tmp, config path, workdir>"""
+        tmp = get_tempdir()
+        self.addCleanup(clean, tmp)
+        os.mkdir(os.path.join(tmp, 'dotfiles'))
+        with open(os.path.join(tmp, 'dotfiles', 'abc'), 'w',
+                  encoding='utf-8') as file:
+            file.write('no template\n')
+        cfg = os.path.join(tmp, 'config.yaml')
+        with open(cfg, 'w', encoding='utf-8') as file:
+            file.write(CONFIG)
+        return tmp, cfg, os.path.join(tmp, 'workdir')
+
+    @staticmethod
+    def _args(cmd, cfg):
+        """command line arguments for cmd"""
+        if cmd == 'profiles':
+            return [cmd, '-b', '-c', cfg]
+        return [cmd, '-b', '-c', cfg, '-p', 'p1']
+
+    def test_lazy_imports(self):
+        """heavy modules are not imported when not needed"""
+        tmp, cfg, workdir = self._setup()
+        for cmd in BUDGETS:
+            mods, total = importtime(self._args(cmd, cfg), tmp,
+                                     workdir=workdir)
+            self.assertIn('dotdrop.options', mods)
+            for mod in HEAVY:
+                self.assertNotIn(mod, mods, f'{mod} imported by {cmd}')
+            self.assertGreater(total, 0)
+
+    @unittest.skipUnless(os.environ.get(ENV_IMPORTTIME),
+                         f'set {ENV_IMPORTTIME} to check the budgets')
+    def test_import_budgets(self):
+        """importing dotdrop stays within the budgets"""
+        tmp, cfg, workdir = self._setup()
+        for cmd, budget in BUDGETS.items():
+            totals = []
+            for _ in range(RUNS):
+                _, total = importtime(self._args(cmd, cfg), tmp,
+                                      workdir=workdir)
+                totals.append(total)
+            self.assertLess(min(totals), budget, f'{cmd} startup too slow')
+
+    def test_platform_cache(self):
+        """distro is not imported once the platform is cached"""
+        if not os.path.exists(BOOT_ID_PATH):
+            self.skipTest('boot id not available')
+        tmp = get_tempdir()
+        self.addCleanup(clean, tmp)
+        cfg = os.path.join(tmp, 'config.yaml')
+        with open(cfg, 'w', encoding='utf-8') as file:
+            file.write(CONFIG)
+        workdir = os.path.join(tmp, 'workdir')
+        args = ['profiles', '-b', '-c', cfg]
+
+        mods, _ = importtime(args, tmp, workdir=workdir)
+        self.assertIn('distro', mods)
+        mods, _ = importtime(args, tmp, workdir=workdir)
+        self.assertNotIn('distro', mods)
+
+
+def main():
+    """entry point"""
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
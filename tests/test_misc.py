@@ -10,8 +10,9 @@ basic unittest for misc stuff
 
 import os
 import sys
+import importlib.util
 import unittest
-from io import StringIO
+from io import StringIO, BytesIO
 from unittest.mock import patch
 from jinja2 import TemplateNotFound
 from dotdrop.profile import Profile
@@ -22,14 +23,19 @@ from dotdrop.dotfile import Dotfile
 from dotdrop.installer import Installer
 from dotdrop.updater import Updater
 from dotdrop.uninstaller import Uninstaller
-from dotdrop.templategen import Templategen
+from dotdrop.templategen import Templategen, TemplateIndex, \
+    TemplateDeps, DICT_VARS_NAME, file_has_markers
 from dotdrop.exceptions import UndefinedException, \
     UnmetDependency
 from dotdrop.dotdrop import apply_install_trans
+from dotdrop import timings
+from dotdrop import filetype
 from dotdrop.utils import removepath, samefile, \
     content_empty, _match_ignore_pattern, \
     get_module_from_path, dependencies_met, \
-    dir_empty
+    dir_empty, get_file_perm, \
+    copy_file, copy_stats
+from dotdrop.writer import write_stream
 from tests.helpers import create_random_file, \
     get_tempdir, clean, edit_content
 
@@ -71,54 +77,67 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(_match_ignore_pattern('', '', debug=True))
         self.assertEqual(get_module_from_path(None), None)
 
+    def test_module_from_path(self):
+        """modules are loaded once whatever their extension"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        suffixes = list(importlib.machinery.SOURCE_SUFFIXES)
+        path, _ = create_random_file(tmpdir, content='VALUE = []\n')
+        mod = get_module_from_path(path)
+        self.assertEqual(mod.VALUE, [])
+        self.assertIs(get_module_from_path(path), mod)
+        path, _ = create_random_file(tmpdir, content='VALUE = 1\n')
+        self.assertEqual(get_module_from_path(path).VALUE, 1)
+        self.assertEqual(importlib.machinery.SOURCE_SUFFIXES, suffixes)
+
     def test_dependencies_met(self):
         """dependencies met"""
-        oimport = __import__
+        ofind_spec = importlib.util.find_spec
 
         def prepare_import_mock(keywords):
             def import_mock(name, *args):
                 if name in keywords:
-                    raise ImportError
-                return oimport(name, *args)
+                    return None
+                return ofind_spec(name, *args)
             return import_mock
 
         # with self.assertRaises(UnmetDependency):
-        #     with patch('builtins.__import__',
+        #     with patch('importlib.util.find_spec',
         #                side_effect=prepare_import_mock(
         #                    ['magic', 'python-magic'])
         #                ):
         #         dependencies_met()
 
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['docopt'])):
                 dependencies_met()
 
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['jinja2'])):
                 dependencies_met()
 
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['ruamel.yaml'])):
                 dependencies_met()
 
         orig = sys.version_info
         sys.version_info = (3, 10)
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['tomli'])):
                 dependencies_met()
         sys.version_info = orig
 
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['tomli_w'])):
                 dependencies_met()
 
         with self.assertRaises(UnmetDependency):
-            with patch('builtins.__import__',
+            with patch('importlib.util.find_spec',
                        side_effect=prepare_import_mock(['distro'])):
                 dependencies_met()
 
@@ -190,6 +209,103 @@ class TestInstaller(unittest.TestCase):
             "diff",
         ))
 
+    def test_stream_template(self):
+        """templates are rendered next to dst and moved in place"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        src, _ = create_random_file(tmpdir, content='{{@@ var @@}}\n' * 3)
+        dst = os.path.join(tmpdir, 'dst')
+        edit_content(dst, 'abc\nabc\nabc\n')
+        os.chmod(dst, 0o600)
+        lnk = os.path.join(tmpdir, 'lnk')
+        os.symlink(dst, lnk)
+        inst = Installer(base=tmpdir, backup=False)
+        tmpl = Templategen(base=tmpdir, variables={'var': 'abc'})
+
+        # same content is not written
+        self.assertEqual(inst._copy_file(tmpl, src, lnk), (False, None))
+        tmpl = Templategen(base=tmpdir, variables={'var': 'abcd'})
+        self.assertEqual(inst._copy_file(tmpl, src, lnk), (True, None))
+        self.assertTrue(os.path.islink(lnk))
+        with open(dst, 'r', encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'abcd\nabcd\nabcd\n')
+        self.assertEqual(get_file_perm(dst), 0o600)
+        # no temporary file left
+        self.assertEqual(sorted(os.listdir(tmpdir)),
+                         sorted([os.path.basename(src), 'dst', 'lnk']))
+
+        # compared on the fly
+        out = BytesIO()
+        chunks = [b'abcd\n', b'abcd', b'\nabcd\n']
+        self.assertFalse(write_stream(chunks, out, compare=dst))
+        self.assertEqual(out.getvalue(), b''.join(chunks))
+        self.assertTrue(write_stream(chunks[:2], BytesIO(), compare=dst))
+        self.assertTrue(write_stream(chunks + [b'a'], BytesIO(), compare=dst))
+        self.assertTrue(write_stream(chunks, BytesIO(), compare='/non'))
+
+    def test_copy_binary(self):
+        """binary files are copied without being rendered"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        content = b'\0{{@@ var @@}}' + os.urandom(10000)
+        src = os.path.join(tmpdir, 'src')
+        with open(src, 'wb') as file:
+            file.write(content)
+        dst = os.path.join(tmpdir, 'dst')
+        inst = Installer(base=tmpdir, backup=False)
+        tmpl = Templategen(base=tmpdir)
+        self.assertTrue(tmpl.is_binary(src))
+        before = copy_stats()
+        with patch.object(Templategen, 'generate_stream') as gen:
+            self.assertEqual(inst._copy_file(tmpl, src, dst), (True, None))
+            self.assertEqual(inst._copy_file(tmpl, src, dst), (False, None))
+            gen.assert_not_called()
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), content)
+        after = copy_stats()
+        moved = sum(size for _, size in after.values()) - \
+            sum(size for _, size in before.values())
+        self.assertEqual(moved, len(content))
+
+        # empty file
+        empty = os.path.join(tmpdir, 'empty')
+        edit_content(empty, '')
+        self.assertIn(copy_file(empty, dst), copy_stats())
+        self.assertEqual(os.path.getsize(dst), 0)
+
+        # size unknown (procfs, sysfs, ...)
+        ofstat = os.fstat
+
+        def fstat(fdesc):
+            stat = list(ofstat(fdesc))
+            stat[6] = 0
+            return os.stat_result(stat)
+
+        with patch('dotdrop.utils.os.fstat', side_effect=fstat):
+            self.assertEqual(copy_file(src, dst), 'read/write')
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), content)
+
+        # short copies are started over
+        ocopy = getattr(os, 'copy_file_range', None)
+        calls = []
+
+        def short(infd, outfd, count):
+            calls.append(count)
+            if len(calls) > 1 or not ocopy:
+                # not supported (older kernels across filesystems)
+                return 0
+            return ocopy(infd, outfd, min(count, 100))
+
+        with patch('fcntl.ioctl', side_effect=OSError), \
+                patch('dotdrop.utils.os.copy_file_range',
+                      side_effect=short, create=True), \
+                patch('dotdrop.utils.os.sendfile', return_value=0,
+                      create=True):
+            self.assertEqual(copy_file(src, dst), 'read/write')
+        with open(dst, 'rb') as file:
+            self.assertEqual(file.read(), content)
+
     def test_check_paths(self):
         """coverage for _check_paths"""
         inst = Installer()
@@ -320,6 +436,145 @@ class TestTemplateGen(unittest.TestCase):
         cont = tmpl._handle_file(path)
         self.assertEqual(content, cont)
 
+    def test_overlay(self):
+        """overlays share the engine but not the variables"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        path, _ = create_random_file(tmpdir, content='{{@@ a @@}}{{@@ b @@}}')
+        tmpl = Templategen(base=tmpdir, variables={'a': '1', 'b': '2'})
+        over = tmpl.overlay({'b': '3'})
+        self.assertEqual(over.generate(path), b'13')
+        self.assertEqual(tmpl.generate(path), b'12')
+        self.assertIs(over.env, tmpl.env)
+        self.assertEqual(over.overlay({'a': '4'}).generate_string(
+            '{{@@ a @@}}{{@@ b @@}}'), '43')
+        self.assertEqual(tmpl.variables[DICT_VARS_NAME], {'a': '1', 'b': '2'})
+        self.assertEqual(tmpl.variables['b'], '2')
+
+    def test_scopes(self):
+        """scopes are pushed and popped without copies"""
+        tmpl = Templategen(variables={'a': '1'})
+        base = tmpl.variables
+        saved = tmpl.add_tmp_vars({'a': '2', 'b': '3'})
+        self.assertIs(tmpl.variables.maps[1], base.maps[0])
+        self.assertEqual(tmpl.generate_string('{{@@ a @@}}{{@@ b @@}}'), '23')
+        tmpl.restore_vars(saved)
+        self.assertIs(tmpl.variables, base)
+        self.assertEqual(tmpl.generate_string('{{@@ a @@}}'), '1')
+        with self.assertRaises(UndefinedException):
+            tmpl.generate_string('{{@@ b @@}}')
+        # globals are still available and shadowed by variables
+        self.assertTrue(tmpl.generate_string('{{@@ exists("/") @@}}'))
+        over = tmpl.overlay({'exists': 'var'})
+        self.assertEqual(over.generate_string('{{@@ exists @@}}'), 'var')
+
+    def test_dependencies(self):
+        """inputs of templates are recorded and checked"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        edit_content(os.path.join(tmpdir, 'inc'), '{{@@ b @@}}')
+        content = '{{@@ a @@}}{{@@ env.HOME @@}}{{@@ d["x"] @@}}'
+        content += '{%@@ include "inc" ignore missing @@%}'
+        content += '{%@@ include "missing" ignore missing @@%}'
+        src, _ = create_random_file(tmpdir, content=content)
+        tmpl = Templategen(base=tmpdir,
+                           variables={'a': '1', 'b': '2', 'd': {'x': 'y'}})
+        files, names, filters, reason = tmpl.get_dependencies(src)
+        self.assertIsNone(reason)
+        self.assertEqual(sorted(files),
+                         sorted([src, os.path.join(tmpdir, 'inc'),
+                                 os.path.join(tmpdir, 'missing')]))
+        self.assertEqual(names, {'a': None, 'b': None,
+                                 'env': {'HOME'}, 'd': {'x'}})
+        self.assertFalse(filters)
+
+        # unpredictable templates
+        for string, expected in [('{{@@ exists("/") @@}}', 'exists'),
+                                 ('{{@@ [1] | random @@}}', 'random'),
+                                 ('{%@@ include a @@%}', 'dynamic')]:
+            path, _ = create_random_file(tmpdir, content=string)
+            files, names, filters, reason = tmpl.get_dependencies(path)
+            if not reason:
+                _, reason = tmpl.get_inputs_digest(names, filters)
+            self.assertIn(expected, reason)
+        path, _ = create_random_file(tmpdir,
+                                     content='{{@@ basename(a) @@}}')
+        _, names, filters, _ = tmpl.get_dependencies(path)
+        self.assertIsNone(tmpl.get_inputs_digest(names, filters)[1])
+
+        # method calls depend on the whole value
+        string = '{{@@ d.get("x") @@}}{%@@ for k, v in e.items() @@%}'
+        string += '{{@@ k @@}}{%@@ endfor @@%}{{@@ e.z @@}}'
+        path, _ = create_random_file(tmpdir, content=string)
+        _, names, _, _ = tmpl.get_dependencies(path)
+        self.assertIsNone(names['d'])
+        self.assertIsNone(names['e'])
+        calls = TemplateDeps()
+        calls.load(tmpdir)
+        called = tmpl.overlay({'e': {'z': '1'}})
+        pathdst = os.path.join(tmpdir, 'calldst')
+        edit_content(pathdst, 'rendered')
+        calls.put(pathdst, calls.inputs(called, path))
+        self.assertTrue(calls.uptodate(called, path, pathdst))
+        self.assertFalse(calls.uptodate(called.overlay({'d': {'x': 'y',
+                                                              'w': 'v'}}),
+                                        path, pathdst))
+        self.assertFalse(calls.uptodate(tmpl.overlay({'e': {'z': '1',
+                                                            'y': '2'}}),
+                                        path, pathdst))
+
+        # up to date until an input changes
+        deps = TemplateDeps()
+        deps.load(tmpdir)
+        dst = os.path.join(tmpdir, 'dst')
+        self.assertIn('never', deps.explain(tmpl, src, dst))
+        inputs = deps.inputs(tmpl, src)
+        edit_content(dst, 'rendered')
+        deps.put(dst, inputs)
+        self.assertTrue(deps.save())
+        deps = TemplateDeps()
+        deps.load(tmpdir)
+        self.assertTrue(deps.uptodate(tmpl, src, dst))
+        self.assertTrue(deps.uptodate(tmpl.overlay({'c': '3'}), src, dst))
+        self.assertEqual(deps.skipped, 2)
+        self.assertEqual(deps.explain(tmpl.overlay({'b': '3'}), src, dst),
+                         'variable \"b\" changed')
+        self.assertEqual(deps.explain(tmpl.overlay({'d': {'x': 'z'}}),
+                                      src, dst),
+                         'variable \"d.x\" changed')
+        edit_content(os.path.join(tmpdir, 'missing'), 'new')
+        self.assertIn('missing\" modified', deps.explain(tmpl, src, dst))
+        os.remove(os.path.join(tmpdir, 'missing'))
+        edit_content(dst, 'local')
+        self.assertEqual(deps.explain(tmpl, src, dst),
+                         'destination modified')
+
+    def test_bytecode_cache(self):
+        """compiled templates are reused across templaters"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        cachedir = os.path.join(tmpdir, 'bytecode')
+        path, _ = create_random_file(tmpdir, content='{{@@ var @@}}\n')
+
+        tmpl = Templategen(base=tmpdir, variables={'var': 'abc'},
+                           bytecode_dir=cachedir)
+        self.assertEqual(tmpl.generate(path), b'abc\n')
+        self.assertEqual(len(os.listdir(cachedir)), 1)
+
+        tmpl = Templategen(base=tmpdir, variables={'var': 'def'},
+                           bytecode_dir=cachedir)
+        with patch.object(tmpl.env, 'compile',
+                          side_effect=AssertionError('compiled')):
+            self.assertEqual(tmpl.generate(path), b'def\n')
+
+        # the filters change the compiled code
+        tmpl = Templategen(base=tmpdir, variables={'var': 'abc'},
+                           bytecode_dir=cachedir)
+        tmpl._filters['custom'] = str
+        tmpl.load_functions()
+        self.assertEqual(tmpl.generate(path), b'abc\n')
+        self.assertEqual(len(os.listdir(cachedir)), 2)
+
     def test_filetype(self):
         """test using file instead of magic"""
         oimport = __import__
@@ -376,6 +631,199 @@ class TestTemplateGen(unittest.TestCase):
 
         tmpl._load_funcs_to_dic(None, None)
 
+    def test_compiled_cache(self):
+        """test compiled templates are shared"""
+        string = '{{@@ var @@}}-compiled-cache'
+        tmpl1 = Templategen(variables={'var': 'a'})
+        tmpl2 = Templategen(variables={'var': 'b'})
+        hits, misses = Templategen.cache_stats()
+        self.assertEqual(tmpl1.generate_string(string), 'a-compiled-cache')
+        self.assertEqual(tmpl2.generate_string(string), 'b-compiled-cache')
+        nhits, nmisses = Templategen.cache_stats()
+        self.assertEqual(nmisses, misses + 1)
+        self.assertEqual(nhits, hits + 1)
+
+
+class TestFiletype(unittest.TestCase):
+    """test case"""
+
+    def test_sniff(self):
+        """identify files from their content"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        path, _ = create_random_file(tmpdir, content='')
+        self.assertEqual(filetype.sniff(path), filetype.MIME_EMPTY)
+        path, _ = create_random_file(tmpdir,
+                                     content='abc\néà\n'.encode('utf-8'),
+                                     binary=True)
+        self.assertEqual(filetype.sniff(path), filetype.MIME_TEXT)
+        path, _ = create_random_file(tmpdir, content=b'a\0b', binary=True)
+        self.assertEqual(filetype.sniff(path), filetype.MIME_BINARY)
+        path, _ = create_random_file(tmpdir, content='abc'.encode('utf-16'),
+                                     binary=True)
+        self.assertIsNone(filetype.sniff(path))
+        path, _ = create_random_file(tmpdir, content=b'a\x01b', binary=True)
+        self.assertIsNone(filetype.sniff(path))
+        # a character cut at the end of the sample
+        content = b'a' * (filetype.SAMPLE_SIZE - 1) + 'é'.encode('utf-8')
+        path, _ = create_random_file(tmpdir, content=content, binary=True)
+        self.assertEqual(filetype.sniff(path), filetype.MIME_TEXT)
+        # text formats are left to magic
+        svg = '<?xml version="1.0"?>\n'
+        svg += '<svg xmlns="http://www.w3.org/2000/svg"></svg>\n'
+        pgp = '-----BEGIN PGP PUBLIC KEY BLOCK-----\n\nmQINBF\n'
+        pgp += '-----END PGP PUBLIC KEY BLOCK-----\n'
+        for content, mime in [(svg, 'image/svg+xml'),
+                              (pgp, 'application/pgp-keys')]:
+            path, _ = create_random_file(tmpdir, content=content)
+            self.assertIsNone(filetype.sniff(path))
+            self.assertEqual(filetype.get_filetype(path), mime)
+            self.assertTrue(Templategen(base=tmpdir).is_binary(path))
+
+    def test_cache_and_batch(self):
+        """undecided files are identified in a single call"""
+        self.addCleanup(filetype.CACHE.clear)
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        text, _ = create_random_file(tmpdir, content='abc')
+        undecided = []
+        for _ in range(3):
+            path, _ = create_random_file(tmpdir, content=b'\x01\x02',
+                                         binary=True)
+            undecided.append(path)
+
+        def fallback(paths, **_kwargs):
+            return {path: 'application/x-test' for path in paths}
+
+        paths = [text] + undecided
+        with patch.object(filetype, '_get_filetypes_fallback',
+                          side_effect=fallback) as mock:
+            types = filetype.get_filetypes(paths)
+            self.assertEqual(mock.call_count, 1)
+            self.assertEqual(mock.call_args[0][0], undecided)
+            self.assertEqual(types[text], filetype.MIME_TEXT)
+            self.assertEqual(types[undecided[0]], 'application/x-test')
+            # cached
+            with patch.object(filetype, 'sniff') as sniff:
+                types = filetype.get_filetypes(paths)
+                sniff.assert_not_called()
+            self.assertEqual(mock.call_count, 1)
+
+        # a modified file is identified again
+        edit_content(text, b'\0\0', binary=True)
+        self.assertEqual(filetype.get_filetype(text), filetype.MIME_BINARY)
+
+    def test_file_cmd(self):
+        """the file command handles several paths"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        path1, _ = create_random_file(tmpdir, content='abc')
+        path2, _ = create_random_file(tmpdir, content=b'\0\1\2',
+                                      binary=True)
+        types = filetype._file_cmd([path1, path2])
+        self.assertEqual(len(types), 2)
+        self.assertTrue(Templategen._is_text(types[0]))
+        self.assertFalse(Templategen._is_text(types[1]))
+
+
+class TestTimings(unittest.TestCase):
+    """test case"""
+
+    def test_disabled(self):
+        """nothing is recorded when disabled"""
+        self.addCleanup(timings.clear)
+        with patch.object(timings, 'ENABLED', False):
+            with timings.phase('phase'):
+                pass
+            func = timings.wrap('func', min)
+            self.assertIs(func, min)
+            out = StringIO()
+            timings.report(file=out)
+            self.assertEqual(out.getvalue(), '')
+
+    def test_report(self):
+        """phases are reported as a tree"""
+        self.addCleanup(timings.clear)
+        with patch.object(timings, 'ENABLED', True):
+            with timings.phase('parent'):
+                for _ in range(2):
+                    with timings.phase('child'):
+                        pass
+                timings.wrap('other', min)(1, 2)
+            out = StringIO()
+            timings.report(file=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'timings:')
+        self.assertTrue(lines[1].startswith('  parent: '))
+        self.assertTrue(lines[2].startswith('    child: '))
+        self.assertTrue(lines[2].endswith('(2 times)'))
+        self.assertTrue(lines[3].startswith('    other: '))
+
+
+class TestTemplateIndex(unittest.TestCase):
+    """test case"""
+
+    def test_index(self):
+        """files are only read when they change"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        workdir = os.path.join(tmpdir, 'workdir')
+        dotdir = os.path.join(tmpdir, 'dir')
+        os.mkdir(dotdir)
+        sub = os.path.join(dotdir, 'sub')
+        os.mkdir(sub)
+        create_random_file(dotdir, content='abc')
+        tmpl, _ = create_random_file(sub, content='{{@@ header() @@}}')
+
+        index = TemplateIndex()
+        index.load(workdir)
+        self.assertTrue(index.path_is_template(dotdir))
+        self.assertTrue(index.path_is_template(tmpl))
+        reads = index.reads
+        self.assertGreater(reads, 0)
+        self.assertTrue(index.save())
+
+        # persisted
+        index = TemplateIndex()
+        index.load(workdir)
+        self.assertTrue(index.path_is_template(dotdir))
+        self.assertEqual(index.reads, 0)
+        self.assertFalse(index.save())
+
+        # modified
+        edit_content(tmpl, 'no template anymore')
+        self.assertFalse(index.path_is_template(dotdir))
+        reads = index.reads
+        self.assertGreater(reads, 0)
+        self.assertFalse(index.path_is_template(sub))
+        self.assertFalse(index.path_is_template(dotdir))
+        self.assertEqual(index.reads, reads)
+        self.assertFalse(index.path_is_template('/non/existing'))
+
+    def test_scan(self):
+        """markers are found in text files only"""
+        tmpdir = get_tempdir()
+        self.addCleanup(clean, tmpdir)
+        for marker in ['{{@@ a @@}}', '{%@@ if a @@%}', '{#@@ a @@#}']:
+            path, _ = create_random_file(tmpdir, content='a' * 10000 + marker)
+            self.assertTrue(file_has_markers(path))
+        path, _ = create_random_file(tmpdir, content='{{ a }} {@@ a @@}')
+        self.assertFalse(file_has_markers(path))
+        path, _ = create_random_file(tmpdir, content='')
+        self.assertFalse(file_has_markers(path))
+        path, _ = create_random_file(tmpdir, content='\0{{@@ a @@}}')
+        self.assertFalse(file_has_markers(path))
+        self.assertFalse(file_has_markers(tmpdir))
+
+        # size limit
+        path, _ = create_random_file(tmpdir, content='{{@@ a @@}}')
+        index = TemplateIndex()
+        index.load(os.path.join(tmpdir, 'workdir'), max_size=5)
+        self.assertFalse(index.path_is_template(path))
+        self.assertEqual(index.reads, 0)
+        index.max_size = 0
+        self.assertTrue(index.path_is_template(path))
+
 
 class TestLinkTypes(unittest.TestCase):
     """test case"""
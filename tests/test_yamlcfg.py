@@ -10,12 +10,14 @@ from unittest.mock import patch
 import os
 
 from dotdrop.cfg_yaml import CfgYaml as Cfg
+from dotdrop.cfg_aggregator import CfgAggregator
 from dotdrop.options import Options
 from dotdrop.linktypes import LinkTypes
-from dotdrop.exceptions import YamlException
+from dotdrop.exceptions import YamlException, ConfigException
 from tests.helpers import (SubsetTestCase, _fake_args, clean,
                            create_fake_config, create_yaml_keyval, get_tempdir,
-                           populate_fake_config, yaml_load, yaml_dump)
+                           load_options, populate_fake_config, yaml_load,
+                           yaml_dump)
 
 
 class TestConfig(SubsetTestCase):
@@ -72,6 +74,160 @@ class TestConfig(SubsetTestCase):
             # pylint: disable=W0212
             cfg._resolve_dotfile_link('fake')
 
+    def test_variables_order(self):
+        """test variables resolution order and cycles"""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+        confpath = create_fake_config(tmp,
+                                      configname=self.CONFIG_NAME,
+                                      dotpath=self.CONFIG_DOTPATH,
+                                      backup=self.CONFIG_BACKUP,
+                                      create=self.CONFIG_CREATE)
+        variables = {
+            'var1': '{{@@ var2 @@}}-1',
+            'var2': '{{@@ var3 @@}}-2',
+            'var3': '3',
+            'dvar': {
+                'x': 'x',
+                'y': '{{@@ dvar.x @@}}y',
+            },
+        }
+        populate_fake_config(confpath, variables=variables)
+        cfg = Cfg(confpath, debug=True)
+        self.assertEqual(cfg.variables['var1'], '3-2-1')
+        self.assertEqual(cfg.variables['var2'], '3-2')
+        self.assertEqual(cfg.variables['dvar']['y'], 'xy')
+
+        variables['var3'] = '{{@@ var1 @@}}-3'
+        populate_fake_config(confpath, variables=variables)
+        with self.assertRaisesRegex(YamlException,
+                                    'var1 -> var2 -> var3 -> var1'):
+            Cfg(confpath, debug=True)
+
+    def test_indexes(self):
+        """test dotfiles and profiles indexes"""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+        confpath = create_fake_config(tmp,
+                                      configname=self.CONFIG_NAME,
+                                      dotpath=self.CONFIG_DOTPATH,
+                                      backup=self.CONFIG_BACKUP,
+                                      create=self.CONFIG_CREATE)
+        dst = os.path.join(tmp, 'abc')
+        dotfiles = {
+            'f_abc': {'src': 'abc', 'dst': dst},
+        }
+        profiles = {
+            'p1': {'dotfiles': ['f_abc']},
+            'p2': {'dotfiles': ['f_abc']},
+            'p3': {'dotfiles': [], 'include': ['p1']},
+            'p4': {'dotfiles': [], 'include': ['p3']},
+        }
+        populate_fake_config(confpath, dotfiles=dotfiles, profiles=profiles)
+        conf = load_options(confpath, 'p1').conf
+
+        dfs = conf.get_dotfile_by_dst(dst)
+        self.assertEqual([d.key for d in dfs], ['f_abc'])
+        pros = conf.get_profiles_by_dotfile_key('f_abc')
+        self.assertEqual(sorted(p.key for p in pros),
+                         ['p1', 'p2', 'p3', 'p4'])
+
+        # new dotfile is indexed without reloading
+        newdst = os.path.join(tmp, 'def')
+        self.assertTrue(conf.new_dotfile('def', newdst, LinkTypes.NOLINK))
+        dfs = conf.get_dotfile_by_dst(newdst)
+        self.assertEqual([d.key for d in dfs], ['f_def'])
+        pros = conf.get_profiles_by_dotfile_key('f_def')
+        self.assertEqual(sorted(p.key for p in pros), ['p1', 'p3', 'p4'])
+        keys = [d.key for d in conf.get_dotfiles()]
+        self.assertIn('f_def', keys)
+        # including profiles are not left stale
+        keys = [d.key for d in conf.get_dotfiles(profile_key='p4')]
+        self.assertEqual(keys, ['f_abc', 'f_def'])
+
+        # removal from a profile and from the config
+        pro = conf.get_profile('p2')
+        dotfile = conf.get_dotfile('f_abc')
+        self.assertTrue(conf.del_dotfile_from_profile(dotfile, pro))
+        pros = conf.get_profiles_by_dotfile_key('f_abc')
+        self.assertEqual(sorted(p.key for p in pros), ['p1', 'p3', 'p4'])
+        self.assertTrue(conf.del_dotfile(dotfile))
+        self.assertEqual(conf.get_dotfile_by_dst(dst), [])
+
+    def test_transaction(self):
+        """test the config is saved once per transaction"""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+        confpath = create_fake_config(tmp,
+                                      configname=self.CONFIG_NAME,
+                                      dotpath=self.CONFIG_DOTPATH,
+                                      backup=self.CONFIG_BACKUP,
+                                      create=self.CONFIG_CREATE)
+        conf = load_options(confpath, 'p1').conf
+
+        with conf.transaction():
+            for name in ['abc', 'def']:
+                dst = os.path.join(tmp, name)
+                self.assertTrue(conf.new_dotfile(name, dst,
+                                                 LinkTypes.NOLINK))
+            with conf.transaction():
+                self.assertTrue(conf.update_dotfile('f_abc', 0o600))
+            # nothing written yet
+            content = yaml_load(confpath)
+            self.assertFalse(content['dotfiles'])
+            dotfile = conf.get_dotfile('f_abc')
+            self.assertEqual(dotfile.chmod, 0o600)
+
+        content = yaml_load(confpath)
+        self.assertEqual(sorted(content['dotfiles'].keys()),
+                         ['f_abc', 'f_def'])
+        self.assertEqual(content['dotfiles']['f_abc']['chmod'], '600')
+        self.assertEqual(content['profiles']['p1']['dotfiles'],
+                         ['f_abc', 'f_def'])
+
+        # nothing is written on error
+        with self.assertRaises(RuntimeError):
+            with conf.transaction():
+                self.assertTrue(conf.update_dotfile('f_abc', 0o644))
+                raise RuntimeError('abort')
+        content = yaml_load(confpath)
+        self.assertEqual(content['dotfiles']['f_abc']['chmod'], '600')
+
+    def test_roundtrip(self):
+        """test round-trip loading is only used when saving"""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+        confpath = create_fake_config(tmp,
+                                      configname=self.CONFIG_NAME,
+                                      dotpath=self.CONFIG_DOTPATH,
+                                      backup=self.CONFIG_BACKUP,
+                                      create=self.CONFIG_CREATE)
+        with open(confpath, 'a', encoding='utf-8') as file:
+            file.write('variables:\n')
+            file.write('  multi: |\n')
+            file.write('    line1\n')
+            file.write('    line2\n')
+
+        # pylint: disable=W0212
+        cfg = Cfg(confpath, debug=True)
+        self.assertFalse(cfg._roundtrip)
+        self.assertFalse(cfg.save())
+        self.assertFalse(cfg._roundtrip)
+
+        dst = os.path.join(tmp, 'abc')
+        self.assertTrue(cfg.add_dotfile('f_abc', 'abc', dst, 'nolink'))
+        self.assertTrue(cfg._roundtrip)
+        self.assertTrue(cfg.save())
+        with open(confpath, 'r', encoding='utf-8') as file:
+            content = file.read()
+        # block scalar style is preserved
+        self.assertIn('multi: |', content)
+        self.assertIn('f_abc', content)
+
     def test_def_link(self):
         """unittest"""
         # pylint: disable=E1120
@@ -631,6 +787,142 @@ profiles:
         self.assertTrue(set(imported_cfg.profiles['host1']['dotfiles'])
                         < set(importing_cfg.profiles['host2']['dotfiles']))
 
+    def test_import_configs_concurrent(self):
+        """Test import_configs parsed concurrently merge in order."""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+
+        paths = []
+        for name in ['a', 'b', 'c']:
+            path = create_fake_config(tmp, configname=f'config-{name}.yaml')
+            populate_fake_config(path, dotfiles={
+                'f_same': {'dst': f'~/.{name}', 'src': name},
+                f'f_{name}': {'dst': f'~/.{name}', 'src': name},
+            }, profiles={
+                'host1': {'dotfiles': [f'f_{name}']},
+            }, variables={
+                'v_same': name,
+            })
+            paths.append(path)
+        importing_path = create_fake_config(tmp,
+                                            configname=self.CONFIG_NAME,
+                                            import_configs=paths)
+
+        # parsed concurrently
+        cfg = Cfg(importing_path, profile='host1', debug=True)
+        # parsed one after the other
+        with patch.object(Cfg, 'import_configs_workers', 1):
+            seq = Cfg(importing_path, profile='host1', debug=True)
+
+        self.assertEqual(cfg.imported_configs, paths)
+        self.assertEqual(cfg.imported_configs, seq.imported_configs)
+        self.assertEqual(cfg.dotfiles, seq.dotfiles)
+        self.assertEqual(cfg.profiles, seq.profiles)
+        self.assertEqual(cfg.variables, seq.variables)
+
+        # duplicate dotfile keys of later configs are dropped
+        self.assertEqual(cfg.dotfiles['f_same']['src'], 'a')
+        self.assertEqual(set(cfg.dotfiles.keys()),
+                         {'f_same', 'f_a', 'f_b', 'f_c'})
+        # duplicate profiles are merged
+        self.assertEqual(cfg.profiles['host1']['dotfiles'],
+                         ['f_c', 'f_b', 'f_a'])
+
+        # the same config imported twice is rejected
+        conf = yaml_load(importing_path)
+        conf['config']['import_configs'].append(paths[0])
+        yaml_dump(conf, importing_path)
+        with self.assertRaises(YamlException):
+            Cfg(importing_path, profile='host1', debug=True)
+
+        # cycles are rejected even when parsed concurrently
+        conf['config']['import_configs'] = paths[:2]
+        yaml_dump(conf, importing_path)
+        conf = yaml_load(paths[0])
+        conf['config']['import_configs'] = [importing_path]
+        yaml_dump(conf, paths[0])
+        with self.assertRaises(YamlException):
+            Cfg(importing_path, profile='host1', debug=True)
+
+    def test_dynvariables_workers(self):
+        """Test dynvariables are executed in order unless opted out."""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+
+        confpath = create_fake_config(tmp, configname=self.CONFIG_NAME)
+        ran = os.path.join(tmp, 'ran')
+        conf = yaml_load(confpath)
+        conf['dynvariables'] = {
+            'a': 'echo a',
+            'b': 'false',
+            'c': f'touch {ran}',
+        }
+        yaml_dump(conf, confpath)
+
+        # the first failure stops the others
+        with self.assertRaises(YamlException):
+            Cfg(confpath, debug=True)
+        self.assertFalse(os.path.exists(ran))
+
+        # all are executed concurrently
+        conf['config']['dynvariables_workers'] = 4
+        conf['dynvariables']['b'] = 'false && echo b'
+        yaml_dump(conf, confpath)
+        with self.assertRaises(YamlException):
+            Cfg(confpath, debug=True)
+        self.assertTrue(os.path.exists(ran))
+
+        conf['dynvariables']['b'] = 'echo b'
+        conf['dynvariables']['c'] = 'echo c'
+        yaml_dump(conf, confpath)
+        cfg = Cfg(confpath, debug=True)
+        self.assertEqual([cfg.variables[k] for k in 'abc'], ['a', 'b', 'c'])
+
+    def test_lazy_profiles(self):
+        """Test only the selected profile is resolved when lazy."""
+        tmp = get_tempdir()
+        self.assertTrue(os.path.exists(tmp))
+        self.addCleanup(clean, tmp)
+
+        confpath = create_fake_config(tmp, configname=self.CONFIG_NAME)
+        populate_fake_config(confpath, dotfiles={
+            'f_a': {'dst': '~/.a', 'src': 'a'},
+            'f_b': {'dst': '~/.b', 'src': 'b'},
+        }, profiles={
+            'p0': {
+                'dotfiles': ['ALL'],
+                'variables': {'v0': 'p0'},
+            },
+            'p1': {
+                'dotfiles': ['f_a'],
+                'include': ['p0'],
+                'variables': {'v1': '{{@@ v0 @@}}'},
+            },
+            'broken': {
+                'dotfiles': ['f_unknown'],
+                'include': ['p_unknown'],
+            },
+        })
+
+        lazy = Cfg(confpath, profile='p1', debug=True, lazy=True)
+        eager = Cfg(confpath, profile='p1', debug=True)
+        self.assertEqual(lazy.profiles['p1'], eager.profiles['p1'])
+        self.assertEqual(lazy.profiles['p0'], eager.profiles['p0'])
+        self.assertEqual(lazy.dotfiles, eager.dotfiles)
+        self.assertEqual(lazy.variables, eager.variables)
+        self.assertEqual(lazy.variables['v1'], 'p0')
+        # unselected profiles are left as is
+        self.assertEqual(lazy.profiles['broken']['include'], ['p_unknown'])
+
+        # the broken profile is only an error when needed
+        conf = CfgAggregator(confpath, 'p1', debug=True)
+        profile = conf.get_profile()
+        self.assertEqual([d.key for d in profile.dotfiles], ['f_a', 'f_b'])
+        with self.assertRaises(ConfigException):
+            conf.get_profile('broken')
+
 
 def main():
     """entry point"""